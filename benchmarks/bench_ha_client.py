@@ -0,0 +1,111 @@
+"""
+Host-side benchmark of per-update latency for Home Assistant state posts against a local stub server.
+
+    python benchmarks/bench_ha_client.py
+
+Three connection strategies are compared over plain HTTP and (if openssl is available to make a throwaway certificate)
+HTTPS:
+
+- new connection: a fresh connection (and full TLS handshake) per update, which is what the firmware used to do
+- resumed session: a fresh connection per update, resuming the previous TLS session
+- keep-alive: one persistent connection for every update
+"""
+
+import asyncio
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim  # noqa: E402
+
+sim.install()
+
+import socketpool  # noqa: E402
+
+from ha_client import HomeAssistantClient  # noqa: E402
+from sim.ha_stub import HomeAssistantStub  # noqa: E402
+
+UPDATES = 200
+ATTRIBUTES = {"friendly_name": "CinnaScale", "device_class": "weight", "icon": "mdi:scale", "unit_of_measurement": "g"}
+EAGAIN = 11
+
+
+class NonBlockingSSLSocket(ssl.SSLSocket):
+    """Raises OSError(EAGAIN) when a non-blocking read or write would block, like CircuitPython's ssl does."""
+
+    def recv_into(self, buffer, nbytes=None, flags=0):
+        try:
+            return super().recv_into(buffer, nbytes, flags)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            raise OSError(EAGAIN, "EAGAIN")
+
+    def send(self, data, flags=0):
+        try:
+            return super().send(data, flags)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            raise OSError(EAGAIN, "EAGAIN")
+
+
+def make_certificate(directory):
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    try:
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+             "-keyout", keyfile, "-out", certfile],
+            check=True, capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return certfile, keyfile
+
+
+async def run(stub, context, strategy):
+    client = HomeAssistantClient(socketpool.SocketPool(None), stub.url.replace("127.0.0.1", "localhost"), stub.token,
+                                 context)
+    # The stub answers within microseconds, so polling at the device's interval would only measure the interval.
+    client.POLL_INTERVAL = 0
+    start = time.perf_counter()
+    for i in range(UPDATES):
+        status = await client.post_state("sensor.cinnascale", i, ATTRIBUTES)
+        assert 200 <= status < 300, status
+        if strategy != "keep-alive":
+            client.close()
+            if strategy == "new connection":
+                client.tls_session = None
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed / UPDATES, client.connects, client.resumed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_certificate(directory)
+        transports = [("http", None, None)]
+        if certfile:
+            context = ssl.create_default_context(cafile=certfile)
+            context.sslsocket_class = NonBlockingSSLSocket
+            transports.append(("https", context, (certfile, keyfile)))
+        else:
+            print("openssl not found, skipping HTTPS")
+
+        print("{:>6} {:>16} {:>14} {:>9} {:>8}".format("scheme", "strategy", "ms/update", "connects", "resumed"))
+        for scheme, context, cert in transports:
+            for strategy in ("new connection", "resumed session", "keep-alive"):
+                if scheme == "http" and strategy == "resumed session":
+                    continue
+                stub = HomeAssistantStub(certfile=cert and cert[0], keyfile=cert and cert[1]).start()
+                try:
+                    latency, connects, resumed = asyncio.run(run(stub, context, strategy))
+                finally:
+                    stub.stop()
+                print("{:>6} {:>16} {:>14.3f} {:>9} {:>8}".format(scheme, strategy, latency * 1000, connects, resumed))
+
+
+if __name__ == "__main__":
+    main()
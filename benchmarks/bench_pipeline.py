@@ -0,0 +1,461 @@
+"""
+Host-side benchmark suite for the NAU7802 driver and the weighing pipeline.
+
+    python benchmarks/bench_pipeline.py [--output results.json] [--compare previous.json]
+
+Everything runs against the simulated board (see ``sim``) on a stepped clock, so apart from the CPU times the results
+only change when the code does:
+
+- i2c_per_sample: I2C transactions (and bytes) spent per conversion read by the sampler at each conversion rate
+- i2c_configuration: I2C transactions (and bytes) spent setting up the NAU7802 from cold (reset, configure and
+  calibrate), changing the conversion rate, powering it down and back up, and starting warm
+- bus_sharing: two NAU7802s at 80 SPS behind a TCA9548A on one bus with a sensor that's read in bursts of long
+  transactions, with and without the sensor taking turns on the bus (see ``shared_i2c``): conversions missed by the
+  scales, how many transactions the sensor still got, each device's longest wait for a turn and its share of the bus
+- read_us / read_if_available_us / bus_us: host CPU time per driver call, and for the bare bus transaction underneath
+- latency_settled_s: time from a step change in the load to read_settled_weight() returning the new weight
+- heap_peak_bytes / heap_retained_bytes: traced heap high-water mark during a weigh cycle (reading the weight,
+  recording it through CinnaScaleDevice and publishing it) and how much the firmware's heap grows per cycle.  The peak
+  is for the whole process, so it includes the Home Assistant stub's share of handling the requests
+- weigh_cycles_per_minute / reports_per_minute / samples_missed_per_minute: weigh cycles paced the way main.py's weigh
+  loop paces them (checking whenever the report policy sees the weight change) against a load that changes every
+  second, how many of them reached Home Assistant and how many conversions the sampler missed meanwhile
+- history_upload: requests, request body bytes and (virtual) seconds it takes to get a day of one minute history to
+  Home Assistant, batched as hourly long-term statistics and, for comparison, as a state for every minute
+
+The results are written as JSON along with the commit they were measured at.  ``--compare`` prints the change from an
+earlier results file.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim  # noqa: E402
+
+sim.install()
+
+from sim import hardware  # noqa: E402
+from sim.clock import SteppedClock  # noqa: E402
+from sim.ha_stub import HomeAssistantStub  # noqa: E402
+from sim.scenario import ZERO_RAW, Scenario  # noqa: E402
+
+NOISE = 150  # counts at 10 SPS
+NETWORK_LATENCY = 0.03  # seconds per round trip
+SAMPLING_TIME = 10  # seconds spent sampling at each rate
+SHARING_TIME = 10  # seconds
+HOUSEKEEPING_INTERVAL = 0.1  # seconds between the sensor's bursts
+HOUSEKEEPING_BURST = 8  # transactions per burst
+HOUSEKEEPING_BYTES = 32  # read by every transaction
+CPU_CALLS = 5000
+LATENCY_TRIALS = 10
+STEP_GRAMS = 50
+LATENCY_TOLERANCE = 1.0  # grams
+ALLOCATION_CYCLES = 20
+THROUGHPUT_TIME = 120  # seconds
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+
+
+class Bench:
+    def __init__(self):
+        self.clock = SteppedClock()
+        self.clock.install()
+        self.board = hardware.Hardware(self.clock, Scenario.parse("0 weight 250"), seed=1)
+        self.board.nau7802.noise = NOISE
+        self.board.nvm[0:4] = ZERO_RAW.to_bytes(4, "big")
+        hardware.setup(self.board)
+
+        self.stub = HomeAssistantStub().start()
+        secrets = types.ModuleType("secrets")
+        secrets.secrets = {
+            "ssid": hardware.Hardware.SSID,
+            "password": hardware.Hardware.PASSWORD,
+            "homeassistant_url": self.stub.url,
+            "token": self.stub.token,
+        }
+        sys.modules["secrets"] = secrets
+
+        self.results = {}
+
+    def step_load(self, grams: float, delay: float = 0.0) -> float:
+        '''Changes the load on the scale delay seconds from now.  Returns the (monotonic) time it changes.'''
+        at = self.board.elapsed() + delay
+        self.board.scenario.weights.append((at, grams, 0.0))
+        return self.clock.start + at
+
+    async def run(self):
+        import scale
+
+        await self.bench_i2c_configuration()
+        await self.bench_bus_sharing()
+        await scale.init_scale()
+        await self.bench_i2c_per_sample(scale)
+        self.bench_cpu(scale)
+
+        sampling = asyncio.create_task(scale.sample())
+        await self.bench_latency(scale)
+
+        import network
+
+        await network.init_network()
+        self.board.network_latency = NETWORK_LATENCY
+        publishing = asyncio.create_task(network.publisher.run())
+        await self.bench_allocations(scale, network)
+        await self.bench_throughput(scale, network)
+
+        for task in (sampling, publishing):
+            task.cancel()
+        # Last, as it moves the clock on by a day.
+        await self.bench_history(network)
+
+    async def bench_i2c_configuration(self):
+        import busio
+        from cedargrove_nau7802_async import NAU7802
+        from sim.nau7802 import FakeNAU7802
+
+        # A chip of its own, so the one the pipeline uses is left as it was.
+        i2c = busio.I2C()
+        i2c.attach(0x2A, FakeNAU7802(clock=self.clock.monotonic))
+        results = {}
+
+        async def measure(name, operation):
+            i2c.reset_counters()
+            await operation
+            results[name] = {"transactions": i2c.transactions, "bytes": i2c.bytes_transferred}
+
+        async def cold_start(adc):
+            await adc.begin(warm=False)
+            await adc.calibrate("INTERNAL")
+
+        async def power_cycle(adc):
+            await adc.enable(False)
+            await adc.enable(True)
+
+        adc = NAU7802(i2c)
+        await measure("cold_start", cold_start(adc))
+        await measure("set_conversion", adc.set_conversion(rate=80))
+        await measure("power_cycle", power_cycle(adc))
+        await measure("warm_start", NAU7802(i2c).begin(warm=True))
+        self.results["i2c_configuration"] = results
+
+    async def bench_bus_sharing(self):
+        import busio
+        from cedargrove_nau7802_async import NAU7802
+        from shared_i2c import HOUSEKEEPING, SharedI2C
+        from sim.nau7802 import FakeNAU7802
+        from sim.tca9548a import FakeTCA9548A
+
+        class Sensor:
+            def write(self, data):
+                pass
+
+            def read(self, buf):
+                pass
+
+        async def bowl(adc):
+            while True:
+                await adc.read_next()
+
+        async def housekeeping(sensor, take_turns):
+            buf = bytearray(HOUSEKEEPING_BYTES)
+            while True:
+                await asyncio.sleep(HOUSEKEEPING_INTERVAL)
+                for _ in range(HOUSEKEEPING_BURST):
+                    if take_turns:
+                        async with sensor.turn(HOUSEKEEPING):
+                            with sensor as i2c:
+                                i2c.readinto(buf)
+                    else:
+                        with sensor as i2c:
+                            i2c.readinto(buf)
+
+        results = {}
+        for mode in ("unarbitrated", "arbitrated"):
+            i2c = busio.I2C()
+            i2c.clock = self.clock
+            mux = FakeTCA9548A(i2c)
+            bus = SharedI2C(i2c)
+            chips = []
+            adcs = []
+            for channel in range(2):
+                chip = FakeNAU7802(clock=self.clock.monotonic)
+                mux.add(channel, 0x2A, chip)
+                adc = NAU7802(bus.device(0x2A, "bowl {}".format(channel + 1), mux_channel=channel))
+                await adc.begin(warm=False)
+                await adc.set_conversion(rate=80)
+                chips.append(chip)
+                adcs.append(adc)
+            i2c.attach(0x77, Sensor())
+            sensor = bus.device(0x77, "sensor")
+
+            tasks = [asyncio.create_task(bowl(adc)) for adc in adcs]
+            await asyncio.sleep(1)
+            for chip in chips:
+                chip.samples_missed = 0
+            bus.reset_stats()
+            tasks.append(asyncio.create_task(housekeeping(sensor, mode == "arbitrated")))
+            await asyncio.sleep(SHARING_TIME)
+            for task in tasks:
+                task.cancel()
+
+            stats = bus.stats()
+            results[mode] = {
+                "samples_missed": sum(chip.samples_missed for chip in chips),
+                "sensor_transactions": stats["sensor"]["transactions"],
+                "max_wait_ms": {name: stats[name]["max_wait_ms"] for name in stats},
+                "utilization": {name: round(stats[name]["utilization"], 3) for name in stats},
+            }
+        self.results["bus_sharing"] = results
+
+    async def bench_i2c_per_sample(self, scale):
+        sampler = scale.sampler
+        task = asyncio.create_task(sampler.run())
+        results = {}
+        for rate in (10, 80):
+            await sampler.reconfigure(rate=rate)
+            await sampler.wait_for_new(2)
+            self.board.i2c.reset_counters()
+            count = sampler.count
+            await asyncio.sleep(SAMPLING_TIME)
+            samples = sampler.count - count
+            results[str(rate)] = {
+                "transactions": round(self.board.i2c.transactions / samples, 1),
+                "bytes": round(self.board.i2c.bytes_transferred / samples, 1),
+            }
+        await sampler.reconfigure(rate=scale.IDLE_RATE)
+        task.cancel()
+        self.results["i2c_per_sample"] = results
+
+    def bench_cpu(self, scale):
+        adc = scale.scale
+        i2c = self.board.i2c
+        register = bytes((0x12,))
+        buffer = bytearray(3)
+
+        def per_call(function, *args):
+            start = time.process_time()
+            for _ in range(CPU_CALLS):
+                function(*args)
+            return round((time.process_time() - start) / CPU_CALLS * 1e6, 2)
+
+        self.results["read_us"] = per_call(adc.read)
+        self.results["read_if_available_us"] = per_call(adc.read_if_available)
+        self.results["bus_us"] = per_call(i2c.writeto_then_readfrom, 0x2A, register, buffer)
+
+    async def bench_latency(self, scale):
+        sampler = scale.sampler
+        latencies = []
+        grams = 250
+        for trial in range(LATENCY_TRIALS):
+            # Let the rate controller drop back to idle so every trial starts from the same place.
+            await asyncio.sleep(scale.FAST_RATE_HOLD * 2)
+            grams += STEP_GRAMS if trial % 2 else -STEP_GRAMS
+            changed = self.step_load(grams)
+            while True:
+                try:
+                    weight, _ = await scale.read_settled_weight()
+                    if abs(weight - grams) <= LATENCY_TOLERANCE:
+                        break
+                except ValueError:
+                    pass
+                await sampler.wait_for_new()
+            latencies.append(time.monotonic() - changed)
+
+        self.results["latency_settled_s"] = {
+            "median": round(statistics.median(latencies), 3),
+            "max": round(max(latencies), 3),
+        }
+
+    async def weigh_cycle(self, scale, network, device):
+        try:
+            weight, _ = await scale.read_settled_weight()
+            device.record_weight(True, weight)
+            success = True
+        except ValueError:
+            device.record_weight(False, 0.0)
+            success = False
+        while network.publisher.order:
+            await asyncio.sleep(0)
+        return success
+
+    async def bench_allocations(self, scale, network):
+        device = network.CinnaScaleDevice()
+        # One cycle first so that everything that's only allocated once already has been.
+        await self.weigh_cycle(scale, network, device)
+
+        # Only count what the firmware allocates, not the simulated hardware or the Home Assistant stub's threads.
+        filters = [
+            tracemalloc.Filter(True, os.path.join(sim.REPO_DIR, "*"), all_frames=True),
+            tracemalloc.Filter(False, os.path.join(sim.SIM_DIR, "*"), all_frames=True),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, tracemalloc.__file__, all_frames=True),
+        ]
+        peaks = []
+        tracemalloc.start(64)
+        try:
+            # Filtering compiles (and caches) the patterns, so do it once before the snapshot that counts.
+            tracemalloc.take_snapshot().filter_traces(filters)
+            gc.collect()
+            before = tracemalloc.take_snapshot().filter_traces(filters)
+            for cycle in range(ALLOCATION_CYCLES):
+                # Steps bigger than the report deadband, so every cycle publishes the weight.
+                self.step_load(250 + 5 * (cycle % 2))
+                await asyncio.sleep(1)
+                tracemalloc.reset_peak()
+                start, _ = tracemalloc.get_traced_memory()
+                await self.weigh_cycle(scale, network, device)
+                _, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - start)
+            gc.collect()
+            after = tracemalloc.take_snapshot().filter_traces(filters)
+        finally:
+            tracemalloc.stop()
+        retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        self.results["heap_peak_bytes"] = int(statistics.median(peaks))
+        self.results["heap_retained_bytes"] = int(retained / ALLOCATION_CYCLES)
+
+    async def bench_throughput(self, scale, network):
+        device = network.CinnaScaleDevice()
+        policy = device.policy
+        policy.watch(scale.sampler, scale.convert_to_decigrams)
+        start = time.monotonic()
+        for second in range(THROUGHPUT_TIME):
+            self.step_load(250 + 5 * (second % 10), second)
+        posted = len(self.stub.requests)
+        missed = self.board.nau7802.samples_missed
+        cycles = 0
+        while time.monotonic() - start < THROUGHPUT_TIME:
+            success = await self.weigh_cycle(scale, network, device)
+            cycles += 1
+            # Like main.weigh(), sleep until the weight changes or the next check is due.
+            policy.wake.clear()
+            try:
+                await asyncio.wait_for(policy.wake.wait(), policy.next_check(success))
+            except asyncio.TimeoutError:
+                pass
+        reports = sum(1 for _, path, _ in self.stub.requests[posted:] if path.endswith("/sensor.cinnascale"))
+        minutes = (time.monotonic() - start) / 60
+        self.results["weigh_cycles_per_minute"] = round(cycles / minutes, 1)
+        self.results["reports_per_minute"] = round(reports / minutes, 1)
+        self.results["samples_missed_per_minute"] = round((self.board.nau7802.samples_missed - missed) / minutes, 1)
+
+    async def bench_history(self, network):
+        device = network.CinnaScaleDevice()
+        history = device.history
+        transport = network.transport
+        # A day of samples, a minute apart, straight into the history rather than through the sampler.
+        for minute in range(history.size + 1):
+            history.add(2500 + minute % 60)
+            self.clock.spend(history.period)
+
+        async def upload(send) -> dict:
+            requests = len(self.stub.requests)
+            start = time.monotonic()
+            await send()
+            sent = self.stub.requests[requests:]
+            return {
+                "requests": len(sent),
+                "bytes": sum(len(json.dumps(data)) for _, _, data in sent),
+                "seconds": round(time.monotonic() - start, 2),
+            }
+
+        async def batched():
+            stats, _ = device.pending_history(transport.clock_offset)
+            await transport.import_statistics(device.HISTORY_STATISTIC, stats)
+
+        async def per_minute():
+            for number in range(history.newest - history.size + 1, history.newest):
+                await transport.publish_state(device.weight_sensor, history.bucket(number)[2] / 10)
+
+        self.results["history_upload"] = {"batched": await upload(batched), "per_minute": await upload(per_minute)}
+
+
+class Discard:
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=sim.REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(previous: dict, current: dict):
+    old = flatten(previous["results"])
+    new = flatten(current["results"])
+    print(
+        "{:40} {:>12} {:>12} {:>8}".format(
+            "metric ({} -> {})".format(previous["commit"], current["commit"]), "before", "after", "change"
+        )
+    )
+    for key, value in new.items():
+        before = old.get(key)
+        change = "" if not before else "{:+.1f}%".format((value - before) / before * 100)
+        print("{:40} {:>12} {:>12} {:>8}".format(key, "-" if before is None else before, value, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write the results (JSON)")
+    parser.add_argument("--compare", help="an earlier results file to compare against")
+    args = parser.parse_args()
+
+    bench = Bench()
+    try:
+        # The firmware is chatty.  Its output isn't what's being measured (and a buffered file would hold on to it).
+        with contextlib.redirect_stdout(Discard()):
+            asyncio.run(bench.run())
+    finally:
+        bench.stub.stop()
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": bench.results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    else:
+        print(json.dumps(bench.results, indent=2))
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Host-side benchmark comparing the sort-and-trim validation that read_weight_with_validation() used to do with the
+streaming WindowStats engine.
+
+    python benchmarks/bench_stats.py
+
+"Per reading" for the streaming engine includes adding the window's worth of fresh samples, since that is the work the
+sampler does between two readings.  "Unordered" is a window that doesn't keep the sorted copy (like SettleDetector's),
+checked for stability only.  "Peak bytes" is the most memory traced while making one reading, over what was allocated
+before it: what the garbage collector has to find room for.
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stats import WindowStats  # noqa: E402
+
+READINGS = 2000
+ZERO = 546562
+TOLERANCE = 1923.3  # A gram, in counts
+
+
+def sort_and_trim(values):
+    # The validation that read_weight_with_validation() used to do for every reading.
+    sorted_values = sorted(values)
+    trimmed_values = sorted_values[1:-1]
+    avg = sum(trimmed_values) / len(trimmed_values)
+    for value in trimmed_values:
+        if abs(value - avg) > 0.01 * avg:
+            raise ValueError()
+    return avg
+
+
+def bench_sort_and_trim(samples, size):
+    start = time.process_time()
+    for i in range(READINGS):
+        sort_and_trim(samples[i * size:(i + 1) * size])
+    return (time.process_time() - start) / READINGS
+
+
+def window_reading(window, values):
+    for value in values:
+        window.add(value)
+    window.full and window.stddev() <= TOLERANCE
+    if window.sorted is not None:
+        window.trimmed_mean(1)
+
+
+def bench_window_stats(samples, size, ordered=True):
+    window = WindowStats(size, ordered)
+    start = time.process_time()
+    for i in range(READINGS):
+        window_reading(window, samples[i * size:(i + 1) * size])
+    return (time.process_time() - start) / READINGS
+
+
+def peak_bytes(reading, samples, size):
+    """The most memory that one reading allocates on top of what was already allocated."""
+    batches = [samples[i * size:(i + 1) * size] for i in range(READINGS)]
+    peak = 0
+    tracemalloc.start()
+    for values in batches:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        reading(values)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return peak
+
+
+def bench_window_query(samples, size):
+    window = WindowStats(size)
+    for value in samples[:size]:
+        window.add(value)
+    start = time.process_time()
+    for i in range(READINGS):
+        window.full and window.stddev() <= TOLERANCE
+        window.trimmed_mean(1)
+        window.median()
+    return (time.process_time() - start) / READINGS
+
+
+def main():
+    rng = random.Random(0)
+    rows = []
+    for size in (5, 20, 64):
+        samples = [ZERO + int(rng.gauss(0, 200)) for _ in range(READINGS * size)]
+        window = WindowStats(size)
+        rows.append((
+            size,
+            bench_sort_and_trim(samples, size) * 1e6,
+            bench_window_stats(samples, size) * 1e6,
+            bench_window_stats(samples, size, ordered=False) * 1e6,
+            bench_window_query(samples, size) * 1e6,
+            peak_bytes(sort_and_trim, samples, size),
+            peak_bytes(lambda values: window_reading(window, values), samples, size),
+        ))
+
+    print("A reading for every window of fresh samples:")
+    print(
+        "{:>6} {:>18} {:>18} {:>18} {:>14} {:>17} {:>17}".format(
+            "window", "sort+trim us/read", "streaming us/read", "unordered us/read", "query only us",
+            "sort+trim peak B", "streaming peak B"
+        )
+    )
+    for size, old, new, unordered, query, old_peak, new_peak in rows:
+        print(
+            "{:>6} {:>18.2f} {:>18.2f} {:>18.2f} {:>14.2f} {:>17} {:>17}".format(
+                size, old, new, unordered, query, old_peak, new_peak
+            )
+        )
+
+    # SettleDetector and FeedingDetector check the window after every sample, which sort-and-trim would sort for.
+    print()
+    print("Checked after every sample:")
+    print(
+        "{:>6} {:>20} {:>20} {:>20}".format(
+            "window", "sort+trim us/sample", "streaming us/sample", "unordered us/sample"
+        )
+    )
+    for size, old, new, unordered, _, _, _ in rows:
+        print("{:>6} {:>20.2f} {:>20.2f} {:>20.2f}".format(size, old, new / size, unordered / size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import asyncio
+import keypad
+from adafruit_ticks import ticks_ms, ticks_diff
+
+# Gestures
+PRESS = "press"
+LONG_PRESS = "long press"
+DOUBLE_PRESS = "double press"
+
+
+class Buttons:
+    '''
+    Turns the key events that keypad queues up (it scans and debounces the pins in the background) into gestures and
+    runs the handlers registered for them with on().
+
+    A long press is reported as soon as the button has been held for LONG_PRESS_MS, and nothing more is reported when
+    it's let go.  A double press is two presses that start within DOUBLE_PRESS_MS of the first one ending.  If a button
+    has a double press handler, a single press is only reported once DOUBLE_PRESS_MS has passed without a second one.
+
+    Gestures are timed by the events' timestamps, so the event queue only needs looking at every so often: every
+    POLL_INTERVAL seconds, or HELD_POLL_INTERVAL while a gesture is in progress.  Handlers run one at a time in their
+    own coroutine, which sleeps until there's a gesture to handle, and gestures made while one is running wait their
+    turn.
+    '''
+
+    LONG_PRESS_MS = 1500
+    DOUBLE_PRESS_MS = 400
+    POLL_INTERVAL = 0.1  # seconds
+    HELD_POLL_INTERVAL = 0.02  # seconds
+
+    def __init__(self, pins: list, names: list):
+        self.pins = pins
+        self.keys = keypad.Keys(pins, value_when_pressed=False, pull=True)
+        self.names = names
+        self.handlers = {}  # (name, gesture) -> coroutine function
+        self.event = keypad.Event()
+        count = len(pins)
+        self.pressed_at = [None] * count  # When each button went down, None while it's up
+        self.released_at = [None] * count  # When a press that might become a double press ended
+        self.second = [False] * count  # Whether the press in progress is the second of a double press
+        self.long = [False] * count  # Whether the press in progress has been reported as a long press
+        self.gestures = []  # (name, gesture) waiting to be handled
+        self.ready = asyncio.Event()
+
+    def on(self, name: str, gesture: str, handler):
+        '''Runs handler (a coroutine function with no arguments) whenever gesture is made with the named button.'''
+        self.handlers[(name, gesture)] = handler
+
+    def suspend(self):
+        '''Stops scanning the buttons and frees their pins (for pin alarms to use) until resume().'''
+        self.keys.deinit()
+
+    def resume(self):
+        self.keys = keypad.Keys(self.pins, value_when_pressed=False, pull=True)
+
+    async def run(self):
+        await asyncio.gather(self._watch(), self._dispatch())
+
+    async def _watch(self):
+        event = self.event
+        while True:
+            # Looked up every time as resume() replaces it.
+            while self.keys.events.get_into(event):
+                if event.pressed:
+                    self._pressed(event.key_number, event.timestamp)
+                else:
+                    self._released(event.key_number, event.timestamp)
+            self._check_timers(ticks_ms())
+
+            busy = self.pressed_at.count(None) + self.released_at.count(None) < 2 * len(self.names)
+            await asyncio.sleep(self.HELD_POLL_INTERVAL if busy else self.POLL_INTERVAL)
+
+    async def _dispatch(self):
+        while True:
+            if not self.gestures:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            name, gesture = self.gestures.pop(0)
+            handler = self.handlers.get((name, gesture))
+            if handler is not None:
+                await handler()
+
+    def _pressed(self, key: int, timestamp: int):
+        released_at = self.released_at[key]
+        self.second[key] = released_at is not None and ticks_diff(timestamp, released_at) <= self.DOUBLE_PRESS_MS
+        if released_at is not None and not self.second[key]:
+            # Too late to be a double press, the earlier one just hadn't been reported yet.
+            self._report(key, PRESS)
+        self.released_at[key] = None
+        self.pressed_at[key] = timestamp
+        self.long[key] = False
+
+    def _released(self, key: int, timestamp: int):
+        pressed_at = self.pressed_at[key]
+        self.pressed_at[key] = None
+        if pressed_at is None or self.long[key]:
+            return
+        if ticks_diff(timestamp, pressed_at) >= self.LONG_PRESS_MS:
+            # It was let go before the long press was noticed.
+            self._report(key, LONG_PRESS)
+        elif self.second[key]:
+            self._report(key, DOUBLE_PRESS)
+        elif (self.names[key], DOUBLE_PRESS) in self.handlers:
+            self.released_at[key] = timestamp
+        else:
+            self._report(key, PRESS)
+
+    def _check_timers(self, now: int):
+        for key in range(len(self.names)):
+            pressed_at = self.pressed_at[key]
+            if pressed_at is not None and not self.long[key] and ticks_diff(now, pressed_at) >= self.LONG_PRESS_MS:
+                self.long[key] = True
+                self._report(key, LONG_PRESS)
+            released_at = self.released_at[key]
+            if released_at is not None and ticks_diff(now, released_at) > self.DOUBLE_PRESS_MS:
+                self.released_at[key] = None
+                self._report(key, PRESS)
+
+    def _report(self, key: int, gesture: str):
+        print("[", self.names[key], "] ", gesture, sep="")
+        self.gestures.append((self.names[key], gesture))
+        self.ready.set()
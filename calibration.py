@@ -0,0 +1,124 @@
+import struct
+from array import array
+
+VERSION = 1
+MAX_POINTS = 6
+
+_HEADER = "<BBH"  # version, number of points, dead zone (mg)
+_POINT = "<ii"  # counts above the tare, milligrams
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_POINT_SIZE = struct.calcsize(_POINT)
+
+# Weights are worked out as fixed-point decigrams with this many fractional bits, and slopes (decigrams per count) with
+# twice as many.  The counts are split into their high and low bits before being multiplied by a slope so that neither
+# product leaves CircuitPython's small (31 bit) integers, which would allocate.
+_FRACTION_BITS = 12
+_SLOPE_BITS = 2 * _FRACTION_BITS
+_LOW_MASK = (1 << _FRACTION_BITS) - 1
+_HALF = 1 << (_FRACTION_BITS - 1)
+
+
+class Calibration:
+    '''
+    Converts raw counts (relative to the tare) to weight with a piecewise-linear curve through zero and up to MAX_POINTS
+    known weights.  Below zero and past the heaviest point the nearest segment is extended, so a single point is a plain
+    slope.
+
+    A provisional calibration (like nominal()'s) is only a guess until a weight has been measured, so the first point
+    that's added replaces its points rather than joining them.
+
+    Everything that needs a division is worked out when the points change, which leaves to_decigrams() with a short
+    search and a couple of integer multiplies and shifts.
+    '''
+
+    def __init__(self, points=(), dead_zone: int = 150, provisional: bool = False):
+        self.points = []  # (counts, milligrams) in increasing order
+        self.dead_zone = dead_zone  # Weights closer to zero than this (in mg) read as zero
+        self.provisional = False
+        for counts, milligrams in points:
+            self.add_point(counts, milligrams, rebuild=False)
+        self.provisional = provisional
+        self._rebuild()
+
+    @classmethod
+    def nominal(cls, counts_per_gram: float, dead_zone: int = 150) -> "Calibration":
+        '''A provisional slope of counts_per_gram, for a scale that hasn't been calibrated.'''
+        return cls(((round(counts_per_gram * 10), 10000),), dead_zone, provisional=True)
+
+    def add_point(self, counts: int, milligrams: int, rebuild: bool = True):
+        '''
+        Adds a known weight.  It replaces any point within 1% of the same weight, or if the table is full, the point
+        closest to it.  The first one added to a provisional calibration replaces all of its points.
+        '''
+        if counts <= 0 or milligrams <= 0:
+            raise ValueError("Calibration needs a weight on the scale")
+        points = [] if self.provisional else list(self.points)
+        if points:
+            closest = min(points, key=lambda point: abs(point[1] - milligrams))
+            if abs(closest[1] - milligrams) * 100 <= milligrams or len(points) >= MAX_POINTS:
+                points.remove(closest)
+        points.append((counts, milligrams))
+        points.sort()
+        for i in range(1, len(points)):
+            if points[i][1] <= points[i - 1][1]:
+                raise ValueError("Heavier weights must read higher than lighter ones")
+        self.points = points
+        self.provisional = False
+        if rebuild:
+            self._rebuild()
+
+    def to_decigrams(self, counts: int) -> int:
+        starts = self.starts
+        i = 0
+        last = len(starts) - 1
+        while i < last and counts >= starts[i + 1]:
+            i += 1
+        delta = counts - starts[i]
+        slope = self.slopes[i]
+        weight = self.offsets[i] + (delta >> _FRACTION_BITS) * slope + (((delta & _LOW_MASK) * slope) >> _FRACTION_BITS)
+
+        # Give ourselves a little buffer so that we don't get jitter around zero.
+        if -self.dead_zone_fixed < weight < self.dead_zone_fixed:
+            return 0
+
+        # Round to the nearest 0.1g
+        return (weight + _HALF) >> _FRACTION_BITS
+
+    def _rebuild(self):
+        if not self.points:
+            raise ValueError("Calibration needs at least one point")
+        # Per segment: the counts it starts at, and the weight there and its slope in fixed point.
+        self.starts = array("i")
+        self.offsets = array("i")
+        self.slopes = array("i")
+        start_counts, start_milligrams = 0, 0
+        for counts, milligrams in self.points:
+            span = counts - start_counts
+            self.starts.append(start_counts)
+            self.offsets.append(((start_milligrams << _FRACTION_BITS) + 50) // 100)
+            self.slopes.append((((milligrams - start_milligrams) << _SLOPE_BITS) + span * 50) // (span * 100))
+            start_counts, start_milligrams = counts, milligrams
+        self.dead_zone_fixed = (self.dead_zone << _FRACTION_BITS) // 100
+        # The average sensitivity over the calibrated range, for turning tolerances in grams into counts.
+        self.counts_per_gram = self.points[-1][0] * 1000 / self.points[-1][1]
+
+    def encode(self) -> bytearray:
+        data = bytearray(_HEADER_SIZE + len(self.points) * _POINT_SIZE)
+        struct.pack_into(_HEADER, data, 0, VERSION, len(self.points), self.dead_zone)
+        for i in range(len(self.points)):
+            struct.pack_into(_POINT, data, _HEADER_SIZE + i * _POINT_SIZE, *self.points[i])
+        return data
+
+    @classmethod
+    def decode(cls, data) -> "Calibration":
+        '''Returns the calibration that encode() produced data from, or None if it isn't a valid one.'''
+        if len(data) < _HEADER_SIZE:
+            return None
+        version, count, dead_zone = struct.unpack_from(_HEADER, data, 0)
+        if version != VERSION or not 0 < count <= MAX_POINTS or len(data) != _HEADER_SIZE + count * _POINT_SIZE:
+            return None
+        points = [struct.unpack_from(_POINT, data, _HEADER_SIZE + i * _POINT_SIZE) for i in range(count)]
+        try:
+            return cls(points, dead_zone)
+        except ValueError:
+            return None
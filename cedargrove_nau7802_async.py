@@ -30,20 +30,19 @@ Implementation Notes
 
 * Adafruit's Bus Device library: https://github.com/adafruit/Adafruit_CircuitPython_BusDevice
 * Adafruit's Register library: https://github.com/adafruit/Adafruit_CircuitPython_Register
+* Adafruit's Ticks library: https://github.com/adafruit/Adafruit_CircuitPython_Ticks
 """
 
 import time
-import struct
 import asyncio
 
+import digitalio
 from adafruit_bus_device.i2c_device import I2CDevice
+from adafruit_ticks import ticks_ms, ticks_add, ticks_diff
 from adafruit_register.i2c_struct import ROUnaryStruct
 
 # from adafruit_register.i2c_struct   import UnaryStruct
-from adafruit_register.i2c_bits import RWBits
 from adafruit_register.i2c_bits import ROBits
-from adafruit_register.i2c_bit import RWBit
-from adafruit_register.i2c_bit import ROBit
 
 # DEVICE REGISTER MAP
 _PU_CTRL = 0x00  # Power-Up Control RW
@@ -59,6 +58,10 @@ _PGA = 0x1B  # Programmable Gain Amplifier  RW
 _PWR_CTRL = 0x1C  # Power Control  RW
 _REV_ID = 0x1F  # Chip Revision ID  R-
 
+_MAX_WAIT_MS = 20  # Longest sleep between checks for restarted conversions
+_CAL_POLL = 0.010  # Seconds between checks for a finished calibration
+_SAMPLE_TURN = 0  # A shared bus's most urgent turns, for reading conversions
+
 
 # pylint: disable=too-few-public-methods
 class LDOVoltage:
@@ -100,77 +103,277 @@ class CalibrationMode:
     GAIN = 0x3  # Gain   Calibration System;   _CTRL2[1:0] = 3
 
 
+class ShadowRegisters:
+    """A copy of the chip's registers kept in RAM, so that changing a field
+    doesn't cost an I2C read-modify-write. ``get()`` returns a register from
+    the copy, reading it from the chip only the first time (or after
+    ``refresh()``). ``set()`` changes the copy and writes the register straight
+    away, unless it's inside a batch (``with registers:``). Then the changed
+    registers are written when the outermost batch ends (or by ``commit()``):
+    once each however many fields changed, and a run of neighbouring registers
+    in a single transaction, as the chip auto-increments the register pointer.
+    ``read()`` always reads the chip, for the status bits that it changes by
+    itself."""
+
+    def __init__(self, i2c_device, size=0x20):
+        self.i2c_device = i2c_device
+        self.values = bytearray(size)
+        self.known = bytearray(size)  # 1 where values[] matches the chip
+        self.dirty = bytearray(size)  # 1 where values[] is still to be written
+        self.depth = 0  # Batches open
+        self._buf = bytearray(size + 1)  # Register pointer, then values
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if not self.depth:
+            self.commit()
+
+    def get(self, register):
+        """The register's value, read from the chip if it isn't known."""
+        if not self.known[register]:
+            self.refresh(register)
+        return self.values[register]
+
+    def set(self, register, value):
+        """Change the register, writing it now unless a batch is open."""
+        self.values[register] = value
+        self.known[register] = 1
+        self.dirty[register] = 1
+        if not self.depth:
+            self.commit()
+
+    def update(self, register, mask, bits):
+        """Change the bits of the register in mask to bits."""
+        self.set(register, (self.get(register) & ~mask) | (bits & mask))
+
+    def assume(self, register, value):
+        """Note what the register holds (e.g. its default after a reset)
+        without reading or writing it."""
+        self.values[register] = value
+        self.known[register] = 1
+        self.dirty[register] = 0
+
+    def read(self, register):
+        """Read the register from the chip. The copy is updated unless it has
+        changes that haven't been written yet."""
+        buf = self._buf
+        buf[0] = register
+        with self.i2c_device as i2c:
+            i2c.write_then_readinto(buf, buf, out_end=1, in_start=1, in_end=2)
+        if not self.dirty[register]:
+            self.values[register] = buf[1]
+            self.known[register] = 1
+        return buf[1]
+
+    def refresh(self, register, count=1):
+        """Read count registers from register on into the copy in a single
+        transaction, discarding any changes to them that haven't been
+        written."""
+        self._buf[0] = register
+        with self.i2c_device as i2c:
+            i2c.write_then_readinto(
+                self._buf, self.values, out_end=1, in_start=register, in_end=register + count
+            )
+        for i in range(register, register + count):
+            self.known[i] = 1
+            self.dirty[i] = 0
+
+    def commit(self):
+        """Write every register that has changed."""
+        dirty = self.dirty
+        values = self.values
+        buf = self._buf
+        register = 0
+        with self.i2c_device as i2c:
+            while register < len(dirty):
+                if not dirty[register]:
+                    register += 1
+                    continue
+                buf[0] = register
+                length = 1
+                while register < len(dirty) and dirty[register]:
+                    buf[length] = values[register]
+                    dirty[register] = 0
+                    register += 1
+                    length += 1
+                i2c.write(buf, end=length)
+
+
+class _Bits:
+    """A field of ``num_bits`` bits from ``lowest_bit`` up in a register,
+    kept in the driver's ``ShadowRegisters``. A ``volatile`` field is one the
+    chip changes, so reading it always reads the register. One bit fields are
+    booleans."""
+
+    def __init__(self, num_bits, register, lowest_bit, volatile=False):
+        self.register = register
+        self.lowest_bit = lowest_bit
+        self.mask = ((1 << num_bits) - 1) << lowest_bit
+        self.flag = num_bits == 1
+        self.volatile = volatile
+
+    def __get__(self, obj, objtype=None):
+        if self.volatile:
+            value = obj.registers.read(self.register)
+        else:
+            value = obj.registers.get(self.register)
+        value = (value & self.mask) >> self.lowest_bit
+        return bool(value) if self.flag else value
+
+    def __set__(self, obj, value):
+        obj.registers.update(self.register, self.mask, int(value) << self.lowest_bit)
+
+
 class NAU7802:
     """The primary NAU7802 class."""
 
     # pylint: disable=too-many-instance-attributes
-    def __init__(self, i2c_bus, address=0x2A, active_channels=1):
+    def __init__(self, i2c_bus, address=0x2A, active_channels=1, drdy_pin=None):
         """Instantiate NAU7802; LDO 3v0 volts, gain 128, 10 samples per second
         conversion rate, disabled ADC chopper clock, low ESR caps, and PGA output
-        stabilizer cap if in single channel mode."""
-        self.i2c_device = I2CDevice(i2c_bus, address)
-        if not self.reset():
-            raise RuntimeError("NAU7802 device could not be reset")
-        if not self.enable(True):
-            raise RuntimeError("NAU7802 device could not be enabled")
-        self.ldo_voltage = "3V0"  # 3.0-volt internal analog power (AVDD)
-        self._pu_ldo_source = True  # Internal analog power (AVDD)
-        self.gain = 128  # X128
-        self._c2_conv_rate = ConversionRate.RATE_10SPS  # 10SPS default
-        self._adc_chop_clock = 0x3  # 0x3 = Disable ADC chopper clock
-        self._pga_ldo_mode = 0x0  # 0x0 = Use low ESR capacitors
+        stabilizer cap if in single channel mode. Nothing is sent to the chip
+        until ``begin()`` is awaited. If the chip's DRDY output is wired to
+        ``drdy_pin``, the data-ready status is read from the pin instead of
+        over I2C. ``i2c_bus`` can also be the chip's device on a bus that's
+        shared with other drivers (anything with ``turn()``, like
+        ``shared_i2c.BusDevice``), and then every conversion is read in a
+        sample turn on it."""
+        if hasattr(i2c_bus, "turn"):
+            self.i2c_device = i2c_bus
+            self._sample_turn = i2c_bus.turn(_SAMPLE_TURN)
+        else:
+            self.i2c_device = I2CDevice(i2c_bus, address)
+            self._sample_turn = None
+        # Configuration goes through the copy of the registers; see ShadowRegisters
+        self.registers = ShadowRegisters(self.i2c_device)
+        self._drdy = None
+        if drdy_pin is not None:
+            self._drdy = digitalio.DigitalInOut(drdy_pin)
+            self._drdy.switch_to_input()
+        # Preallocated buffers for the sample read path
+        self._pu_ctrl_buf = bytearray((_PU_CTRL, 0x00))  # Pointer + PU_CTRL
+        self._adc_reg = bytes((_ADCO_B2,))  # ADCO_B2 register pointer
+        self._adc_buf = bytearray(3)  # ADCO_B2, ADCO_B1, ADCO_B0
+        # The chip is brought up (and these are written to it) by begin()
+        self._ldo_voltage = "3V0"  # 3.0-volt internal analog power (AVDD)
+        self._gain = 128  # X128
+        self._conversion_rate = 10  # 10SPS default
         self._act_channels = active_channels
-        # 0x1 = Enable PGA out stabilizer cap for single channel use
-        self._pc_cap_enable = 0x1
-        if self._act_channels == 2:
-            # 0x0 = Disable PGA out stabilizer cap for dual channel use
-            self._pc_cap_enable = 0x0
+        self._enable = False  # Whether the analog and digital systems are powered
         self._calib_mode = None  # Initialize for later use
         self._adc_out = None  # Initialize for later use
+        self._next_due = None  # ticks_ms when the next conversion is expected
+        self._settling = True  # Whether the next conversion is the first since they (re)started
 
     # DEFINE I2C DEVICE BITS, NYBBLES, BYTES, AND REGISTERS
     # Chip Revision  R-
     _rev_id = ROBits(4, _REV_ID, 0, 1, False)
     # Register Reset  (RR)  RW
-    _pu_reg_reset = RWBit(_PU_CTRL, 0, 1, False)
+    _pu_reg_reset = _Bits(1, _PU_CTRL, 0)
     # Power-Up Digital Circuit  (PUD) RW
-    _pu_digital = RWBit(_PU_CTRL, 1, 1, False)
+    _pu_digital = _Bits(1, _PU_CTRL, 1)
     # Power-Up Analog Circuit  (PUA) RW
-    _pu_analog = RWBit(_PU_CTRL, 2, 1, False)
+    _pu_analog = _Bits(1, _PU_CTRL, 2)
     # Power-Up Ready Status  (PUR) R-
-    _pu_ready = ROBit(_PU_CTRL, 3, 1, False)
+    _pu_ready = _Bits(1, _PU_CTRL, 3, volatile=True)
     # Power-Up Conversion Cycle Start  (CS) RW
-    _pu_cycle_start = RWBit(_PU_CTRL, 4, 1, False)
+    _pu_cycle_start = _Bits(1, _PU_CTRL, 4)
     # Power-Up Cycle Ready  (CR) R-
-    _pu_cycle_ready = ROBit(_PU_CTRL, 5, 1, False)
+    _pu_cycle_ready = _Bits(1, _PU_CTRL, 5, volatile=True)
     # Power-Up AVDD Source  (ADDS) RW
-    _pu_ldo_source = RWBit(_PU_CTRL, 7, 1, False)
+    _pu_ldo_source = _Bits(1, _PU_CTRL, 7)
     # Control_1 Gain  (GAINS) RW
-    _c1_gains = RWBits(3, _CTRL1, 0, 1, False)
+    _c1_gains = _Bits(3, _CTRL1, 0)
     # Control_1 LDO Voltage  (VLDO) RW
-    _c1_vldo_volts = RWBits(3, _CTRL1, 3, 1, False)
+    _c1_vldo_volts = _Bits(3, _CTRL1, 3)
     # Control_2 Calibration Mode  (CALMOD) RW
-    _c2_cal_mode = RWBits(2, _CTRL2, 0, 1, False)
+    _c2_cal_mode = _Bits(2, _CTRL2, 0)
     # Control_2 Calibration Start  (CALS) RW
-    _c2_cal_start = RWBit(_CTRL2, 2, 1, False)
+    _c2_cal_start = _Bits(1, _CTRL2, 2, volatile=True)
     # Control_2 Calibration Error (CAL_ERR) RW
-    _c2_cal_error = RWBit(_CTRL2, 3, 1, False)
+    _c2_cal_error = _Bits(1, _CTRL2, 3, volatile=True)
     # Control_2 Conversion Rate  (CRS) RW
-    _c2_conv_rate = RWBits(3, _CTRL2, 4, 1, False)
+    _c2_conv_rate = _Bits(3, _CTRL2, 4)
     # Control_2 Channel Select  (CHS) RW
-    _c2_chan_select = RWBit(_CTRL2, 7, 1, False)
+    _c2_chan_select = _Bits(1, _CTRL2, 7)
     # ADC Result Output  MSByte R-
     _adc_out_2 = ROUnaryStruct(_ADCO_B2, ">B")
     # ADC Result Output  MidSByte R-
     _adc_out_1 = ROUnaryStruct(_ADCO_B1, ">B")
     # ADC Result Output  LSByte R-
     _adc_out_0 = ROUnaryStruct(_ADCO_B0, ">B")
-    # ADC Chopper Clock Frequency Select  -W
-    _adc_chop_clock = RWBits(2, _ADC, 4, 1, False)
+    # ADC Chopper Clock Frequency Select  -W (reads back as OTP_B1)
+    _adc_chop_clock = _Bits(2, _ADC, 4)
     # PGA Stability/Accuracy Mode (LDOMODE) RW
-    _pga_ldo_mode = RWBit(_PGA, 6, 1, False)
+    _pga_ldo_mode = _Bits(1, _PGA, 6)
     # Power_Ctrl PGA Capacitor (PGA_CAP_EN) RW
-    _pc_cap_enable = RWBit(_PWR_CTRL, 7, 1, False)
+    _pc_cap_enable = _Bits(1, _PWR_CTRL, 7)
+
+    async def begin(self, warm=True):
+        """Reset, power up and configure the chip. A restart of the
+        microcontroller doesn't power cycle the NAU7802, so if ``warm`` is True
+        and ``configured()`` finds it still set up, the reset is skipped and the
+        conversion rate it was left at is kept. If it was left converting the
+        power-up delay is skipped too, and if it was powered down with
+        ``enable(False)`` it's just powered back up. The internal calibration
+        is only needed after a cold start. True for a warm start."""
+        if warm and self.configured():
+            if self._enable:
+                self._settling = False  # It's been converting all along
+            elif not await self.enable(True):
+                raise RuntimeError("NAU7802 device could not be enabled")
+            return True
+        if not await self.reset():
+            raise RuntimeError("NAU7802 device could not be reset")
+        if not await self.enable(True):
+            raise RuntimeError("NAU7802 device could not be enabled")
+        # Written together once they're all set: three transactions
+        with self.registers:
+            self.ldo_voltage = self._ldo_voltage
+            self._pu_ldo_source = True  # Internal analog power (AVDD)
+            self.gain = self._gain
+            self.conversion_rate = self._conversion_rate
+            self._adc_chop_clock = 0x3  # 0x3 = Disable ADC chopper clock
+            self._pga_ldo_mode = 0x0  # 0x0 = Use low ESR capacitors
+            # 0x1 = Enable PGA out stabilizer cap for single channel use
+            # 0x0 = Disable PGA out stabilizer cap for dual channel use
+            self._pc_cap_enable = 0x1 if self._act_channels == 1 else 0x0
+        return False
+
+    def configured(self):
+        """True if the chip is cycling (or was, before ``enable(False)``
+        powered it down) with this driver's LDO voltage, gain and PGA settings
+        at a supported conversion rate, with no calibration running or failed.
+        The register defaults after a power cycle never match. Adopts the
+        chip's conversion rate and power state when True. The registers it
+        reads are kept in the register copy either way."""
+        registers = self.registers
+        # PU_CTRL, CTRL1 and CTRL2, then PGA and PWR_CTRL
+        registers.refresh(_PU_CTRL, 3)
+        registers.refresh(_PGA, 2)
+        pu_ctrl, ctrl1, ctrl2 = registers.values[_PU_CTRL:_CTRL2 + 1]
+        pga, pwr_ctrl = registers.values[_PGA], registers.values[_PWR_CTRL]
+        # AVDDS and CS set and RR clear, with PUR, PUA and PUD all set
+        # (powered up) or all clear (powered down)
+        if pu_ctrl & 0x9F not in (0x9E, 0x90):
+            return False
+        vldo = getattr(LDOVoltage, "LDO_" + self._ldo_voltage)
+        if ctrl1 & 0x3F != (vldo << 3) | getattr(Gain, "GAIN_X" + str(self._gain)):
+            return False
+        if ctrl2 & 0x0C:  # CALS or CAL_ERR
+            return False
+        if pga & 0x40 or bool(pwr_ctrl & 0x80) != (self._act_channels == 1):
+            return False
+        for rate in (10, 20, 40, 80, 320):
+            if getattr(ConversionRate, "RATE_" + str(rate) + "SPS") == (ctrl2 >> 4) & 0x7:
+                self._conversion_rate = rate
+                self._enable = pu_ctrl & 0x9F == 0x9E
+                return True
+        return False
 
     @property
     def chip_revision(self):
@@ -249,6 +452,38 @@ class NAU7802:
             self._c1_gains = Gain.GAIN_X64
         elif self._gain == 128:
             self._c1_gains = Gain.GAIN_X128
+        self._restarted()
+
+    @property
+    def conversion_rate(self):
+        """The ADC conversion rate in samples per second."""
+        return self._conversion_rate
+
+    @conversion_rate.setter
+    def conversion_rate(self, rate=10):
+        """Select the conversion rate. Valid values are 10, 20, 40, 80, and
+        320 samples per second. Changing the rate requires a calibration;
+        see ``set_conversion()``."""
+        if not "RATE_" + str(rate) + "SPS" in dir(ConversionRate):
+            raise ValueError("Invalid Conversion Rate")
+        self._conversion_rate = rate
+        self._c2_conv_rate = getattr(ConversionRate, "RATE_" + str(rate) + "SPS")
+        self._restarted()
+
+    async def set_conversion(self, rate=None, gain=None):
+        """Change the conversion rate (samples per second) and/or the gain
+        factor while running. The internal offset calibration is repeated for
+        the new settings, and ``read_next()`` discards the first conversion
+        afterwards, which is still settling. True if the calibration was
+        successful. The new settings and the start of the calibration go in
+        one write."""
+        with self.registers:
+            if rate is not None:
+                self.conversion_rate = rate
+            if gain is not None:
+                self.gain = gain
+            self._start_calibration("INTERNAL")
+        return await self._calibration_result()
 
     async def enable(self, power=True):
         """Enable(start) or disable(stop) the internal analog and digital
@@ -256,13 +491,16 @@ class NAU7802:
         True when enabled; False when disabled."""
         self._enable = power
         if self._enable:
-            self._pu_analog = True
-            self._pu_digital = True
+            with self.registers:
+                self._pu_analog = True
+                self._pu_digital = True
             await asyncio.sleep(0.750)  # Wait 750ms; minimum 400ms
-            self._pu_start = True  # Start acquisition system cycling
+            self._pu_cycle_start = True  # Start acquisition system cycling
+            self._restarted()
             return self._pu_ready
-        self._pu_analog = False
-        self._pu_digital = False
+        with self.registers:
+            self._pu_analog = False
+            self._pu_digital = False
         await asyncio.sleep(0.010)  # Wait 10ms (200us minimum)
         return False
 
@@ -274,42 +512,87 @@ class NAU7802:
     def read(self):
         """Reads the 24-bit ADC data. Returns a signed integer value with
         24-bit resolution. Assumes that the ADC data-ready bit was checked
-        to be True."""
-        adc = self._adc_out_2 << 24  # [31:24] << MSByte
-        adc = adc | (self._adc_out_1 << 16)  # [23:16] << MidSByte
-        adc = adc | (self._adc_out_0 << 8)  # [15: 8] << LSByte
-        adc = adc.to_bytes(4, "big")  # Pack to 4-byte (32-bit) structure
-        value = struct.unpack(">i", adc)[0]  # Unpack as 4-byte signed integer
-        self._adc_out = value / 128  # Restore to 24-bit signed integer value
-        return self._adc_out
+        to be True. ADCO_B2..ADCO_B0 are fetched in a single auto-incrementing
+        3-byte transaction into a preallocated buffer.
+
+        The value is twice the 24-bit conversion result, the same units the
+        original driver returned (it assembled the bytes into the top of a
+        32-bit word and divided by 128), so existing tares and calibrations
+        still apply."""
+        buf = self._adc_buf
+        with self.i2c_device as i2c:
+            i2c.write_then_readinto(self._adc_reg, buf)
+        value = (buf[0] << 16) | (buf[1] << 8) | buf[2]
+        if value & 0x800000:  # Sign-extend the 24-bit two's complement value
+            value -= 0x1000000
+        value <<= 1
+        self._adc_out = value
+        return value
+
+    def read_if_available(self):
+        """Check the ADC data-ready status and, if a conversion is ready,
+        read it. Returns the value (see ``read()``) or None when no new data is
+        available. Costs one transaction when not ready and two when ready
+        (versus four for ``available()`` followed by the byte-wise read), or
+        none and one with a DRDY pin."""
+        if self._drdy is not None:
+            if not self._drdy.value:  # DRDY is high while a conversion is ready
+                return None
+            return self.read()
+        buf = self._pu_ctrl_buf
+        with self.i2c_device as i2c:
+            i2c.write_then_readinto(buf, buf, out_end=1, in_start=1)
+        if not buf[1] & 0x20:  # PU_CTRL[5] Cycle Ready (CR)
+            return None
+        return self.read()
 
     async def reset(self):
         """Resets all device registers and enables digital system power.
         Returns the power ready status bit value: True when system is ready;
         False when system not ready for use."""
-        self._pu_reg_reset = True  # Reset all registers
+        registers = self.registers
+        # Everything else in PU_CTRL is about to be reset, so it isn't read
+        registers.set(_PU_CTRL, 0x01)  # Reset all registers (RR)
         await asyncio.sleep(0.100)  # Wait 100ms; 10ms minimum
-        self._pu_reg_reset = False
-        self._pu_digital = True
+        # Now at their power-on defaults, which needn't be read back
+        for register in (_CTRL1, _CTRL2, _ADC, _PGA, _PWR_CTRL):
+            registers.assume(register, 0x00)
+        with registers:
+            self._pu_reg_reset = False
+            self._pu_digital = True
         await asyncio.sleep(0.750)  # Wait 750ms; 400ms minimum
         return self._pu_ready
 
     async def calibrate(self, mode="INTERNAL"):
         """Perform the calibration procedure. Valid calibration modes
         are 'INTERNAL', 'OFFSET', and 'GAIN'. True if successful."""
+        self._start_calibration(mode)
+        return await self._calibration_result()
+
+    def _start_calibration(self, mode):
+        """Set the calibration mode and start it, in one write."""
         if not mode in dir(CalibrationMode):
             raise ValueError("Invalid Calibration Mode")
         self._calib_mode = mode
-        if self._calib_mode == "INTERNAL":  # Internal PGA offset (zero setting)
-            self._c2_cal_mode = CalibrationMode.INTERNAL
-        elif self._calib_mode == "OFFSET":  # External PGA offset (zero setting)
-            self._c2_cal_mode = CalibrationMode.OFFSET
-        elif self._calib_mode == "GAIN":  # External PGA full-scale gain setting
-            self._c2_cal_mode = CalibrationMode.GAIN
-        self._c2_cal_start = True
-        while self._c2_cal_start:
-            await asyncio.sleep(0.010)  # 10ms
-        return not self._c2_cal_error
+        with self.registers:
+            if self._calib_mode == "INTERNAL":  # Internal PGA offset (zero setting)
+                self._c2_cal_mode = CalibrationMode.INTERNAL
+            elif self._calib_mode == "OFFSET":  # External PGA offset (zero setting)
+                self._c2_cal_mode = CalibrationMode.OFFSET
+            elif self._calib_mode == "GAIN":  # External PGA full-scale gain setting
+                self._c2_cal_mode = CalibrationMode.GAIN
+            self._c2_cal_start = True
+
+    async def _calibration_result(self):
+        """Wait for the calibration to finish. True if it was successful.
+        Each check is a single read of CTRL2, which also has the error bit,
+        and leaves the register copy with CALS cleared."""
+        ctrl2 = 0x04
+        while ctrl2 & 0x04:  # CALS
+            await asyncio.sleep(_CAL_POLL)
+            ctrl2 = self.registers.read(_CTRL2)
+        self._restarted()
+        return not ctrl2 & 0x08  # CAL_ERR
 
     async def zero_channel(self):
         """Initiate internal calibration for current channel.Use when scale is started,
@@ -325,28 +608,79 @@ class NAU7802:
         )
         print("...channel %1d zeroed" % self.channel)
 
+    async def read_next(self):
+        """Wait for the next conversion and read it. Returns the value (see
+        ``read()``). Conversions arrive once per conversion period, so rather
+        than polling the data-ready status until one does, this sleeps until
+        the next one is due (a period after the last one was read, less an
+        eighth of a period of margin) and then checks every eighth of a
+        period. That is about three transactions per conversion, or one with a
+        DRDY pin, and the CPU is free in between. The first conversion after
+        the conversions restart is still settling and is skipped. On a shared
+        bus each check is made in a sample turn, which is booked for when the
+        check is due so that other drivers keep the bus free for it."""
+        polled = False  # Whether the conversion wasn't ready at the first check
+        while True:
+            # Changing the rate or calibrating restarts the conversions (and
+            # clears the due time), so long waits are split up to notice that.
+            while self._next_due is not None:
+                wait = ticks_diff(self._next_due, ticks_ms())
+                if wait <= 0:
+                    break
+                await asyncio.sleep_ms(min(wait, _MAX_WAIT_MS))
+            period = 1000 // self._conversion_rate  # ms
+            margin = max(1, period >> 3)
+            if self._sample_turn is None:
+                value = self.read_if_available()
+            else:
+                async with self._sample_turn:
+                    value = self.read_if_available()
+            if value is None:
+                polled = True
+                if self._sample_turn is not None:
+                    self._sample_turn.book(ticks_add(ticks_ms(), margin))
+                await asyncio.sleep_ms(margin)
+                continue
+            now = ticks_ms()
+            if not polled and self._next_due is not None and ticks_diff(now, self._next_due) > period >> 2:
+                # It was ready when it was first checked, which was held up
+                # (on a busy bus), but the conversion wasn't: the next one is
+                # due a period after this one was, not a period from now.
+                next_due = ticks_add(self._next_due, period)
+            else:
+                # Aiming early keeps the estimate from drifting later than the conversions.
+                next_due = ticks_add(now, period - margin)
+            self._next_due = next_due
+            if self._sample_turn is not None:
+                self._sample_turn.book(next_due)
+            polled = False
+            if not self._settling:
+                return value
+            self._settling = False
+
+    def _restarted(self):
+        """Note that the chip has started its conversions over."""
+        self._next_due = None
+        self._settling = True
+
     async def read_raw_value(self, samples=2):
         """Read and average consecutive raw sample values. Return average raw value."""
         sample_sum = 0
-        sample_count = samples
-        while sample_count > 0:
-            while not self.available():
-                await asyncio.sleep(0)  # Let us play nice with anything else async
-                pass
-            sample_sum = sample_sum + self.read()
-            sample_count -= 1
-        return int(sample_sum / samples)
-
-    async def read_raw_values(self, samples=2):
-        """Read consecutive raw sample values. Return list of raw values."""
-        sample_values = []
-
-        sample_count = samples
-        while sample_count > 0:
-            while not self.available():
-                await asyncio.sleep(0)
-                pass
-            sample_values.append(self.read())
-            sample_count -= 1
-
-        return sample_values
\ No newline at end of file
+        for _ in range(samples):
+            sample_sum = sample_sum + await self.read_next()
+        # Integer division (truncating toward zero like int() did) avoids
+        # allocating a float and the precision it loses on large sums.
+        average = abs(sample_sum) // samples
+        return average if sample_sum >= 0 else -average
+
+    async def read_raw_values(self, samples=2, out=None):
+        """Read consecutive raw sample values. Return list of raw values.
+        If ``out`` (a list or array of at least ``samples`` items) is
+        provided, the values are stored in it instead of a new list."""
+        if out is None:
+            out = [0] * samples
+
+        for index in range(samples):
+            out[index] = await self.read_next()
+
+        return out
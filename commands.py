@@ -0,0 +1,62 @@
+import asyncio
+import traceback
+
+
+class Commands:
+    '''
+    Runs the handlers registered with on() for the commands that Home Assistant sends, so the scale can be told what to
+    do from an automation or a dashboard as well as with its buttons.
+
+    A command is an event (fired in Home Assistant, e.g. by a script) whose data has the command's name under "command"
+    and anything the command needs alongside it:
+
+        event_type: cinnascale_command
+        event_data:
+          command: set_threshold
+          grams: 20
+
+    receive (a coroutine function) is called every POLL_INTERVAL seconds for the events that have arrived since the last
+    call.  If it raises (it couldn't reach Home Assistant) it's tried again after RETRY_INTERVAL seconds.  If it's None
+    (nothing can send commands) run() returns straight away.  Handlers run one at a time, in the order their commands
+    arrived, and commands that arrive while one is running wait their turn.
+    '''
+
+    POLL_INTERVAL = 0.25  # seconds
+    RETRY_INTERVAL = 10  # seconds
+
+    def __init__(self, receive):
+        self.receive = receive
+        self.handlers = {}  # name -> coroutine function
+
+    def on(self, name: str, handler):
+        '''Runs handler (a coroutine function taking the event's data) whenever the named command arrives.'''
+        self.handlers[name] = handler
+
+    async def run(self):
+        if self.receive is None:
+            return
+        while True:
+            try:
+                events = await self.receive()
+            except Exception as e:
+                print(f"Unable to receive commands: {e}")
+                await asyncio.sleep(self.RETRY_INTERVAL)
+                continue
+
+            for event in events:
+                await self._dispatch(event.get("data") or {})
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _dispatch(self, data: dict):
+        name = data.get("command")
+        handler = self.handlers.get(name)
+        print("[command] ", name, sep="")
+        if handler is None:
+            print(f"Unknown command {name}")
+            return
+        try:
+            await handler(data)
+        except Exception as e:
+            print(f"Command {name} failed: {e}")
+            if not isinstance(e, ValueError):
+                traceback.print_exception(e)
@@ -0,0 +1,176 @@
+import time
+from adafruit_ticks import ticks_ms, ticks_diff
+
+from stats import WindowStats
+
+# Kinds of feeding event
+MEAL = "meal"
+REFILL = "refill"
+REMOVED = "removed"
+RETURNED = "returned"
+DAY = "day"
+
+
+class FeedingDetector:
+    '''
+    Turns the stream of samples into feeding events, so that what happened to the bowl is known without anything having
+    to watch every sample:
+
+    - MEAL: the cat ate.  Everything eaten with less than SESSION_GAP seconds between bites is one meal, from when the
+      first bite started to when the last one ended.
+    - REFILL: REFILL_MIN grams or more were added.
+    - REMOVED / RETURNED: the bowl was taken off the scale (the weight went REMOVED_BELOW grams below the tare, which is
+      the empty bowl) and put back.  What changed while it was off is the returned event's grams, and if food was added
+      it's a refill too.  Food taken away while the bowl was off isn't counted as eaten.
+    - DAY: the total eaten during a day, sent once it's over.
+
+    Events are passed to on_event(kind, start, end, decigrams) with the start and end as time.time() (the same for
+    events that happen at an instant).
+
+    The device's clock isn't set, so the days are by Home Assistant's: clock_offset() gives the seconds to add to
+    time.time() to get its time (None until that's known), and utc_offset is the seconds to add to that to get the local
+    time.  Days aren't checked while the offset isn't known, so whatever is eaten until then counts towards the day that
+    was being counted.  The day and what was eaten during it can be given to carry on counting after a restart.
+
+    The weight is split into steady levels: it's steady once the last WINDOW samples are within STEADY grams of each
+    other and their mean stays within STEADY grams for SETTLE_MS.  Each level is compared with the one before it, so a
+    bump that doesn't change the weight is ignored, and a slow change (the cat eating gently) still ends up as a string
+    of small steps.  A level within STEADY grams of the last one doesn't replace it, so drift only starts a meal once
+    it adds up to more than that, and less than MEAL_MIN grams isn't a meal.
+
+    Weights are kept in whole decigrams so that watching the samples doesn't allocate floats.
+    '''
+
+    WINDOW = 8
+    STEADY = 1  # grams
+    SETTLE_MS = 2000
+    MEAL_MIN = 2  # grams
+    REFILL_MIN = 5  # grams
+    REMOVED_BELOW = -20  # grams
+    SESSION_GAP = 120  # seconds
+
+    def __init__(self, on_event, clock_offset, utc_offset: int = 0, day: int = None, today: int = 0):
+        self.on_event = on_event
+        self.clock_offset = clock_offset
+        self.utc_offset = utc_offset
+        self.convert = None  # Turns a raw sample into decigrams
+        self.window = WindowStats(self.WINDOW)
+        self.steady = self.STEADY * 10
+        self.meal_min = self.MEAL_MIN * 10
+        self.refill_min = self.REFILL_MIN * 10
+        self.removed_below = self.REMOVED_BELOW * 10
+        self.today = today  # Decigrams eaten today
+        self.day = day  # Days since the epoch (in local time) that today is for
+        self.reset()
+
+    def reset(self):
+        '''Starts over, forgetting the current level.  Call after the tare or calibration changes.'''
+        self.window.reset()
+        self.level = None  # The latest steady weight (in decigrams)
+        self.anchor = None  # The mean when the weight started looking steady
+        self.steady_since = None  # ticks_ms() of the same
+        self.moving = False
+        self.moved_at = None  # time.time() when the weight started moving
+        self.removed_from = None  # The level before the bowl was taken off, None while it's on
+        self.meal_from = None  # The level before the meal in progress, None if there isn't one
+        self.meal_start = None
+        self.meal_end = None
+
+    def watch(self, sampler, convert):
+        '''Starts watching the sampler's samples.  convert turns a raw sample into decigrams.'''
+        self.convert = convert
+        sampler.listeners.append(self.on_sample)
+
+    def on_sample(self, value: int):
+        window = self.window
+        window.add(self.convert(value))
+        if not window.full:
+            return
+        now = ticks_ms()
+        mean = window.int_mean()
+
+        if window.sorted[window.size - 1] - window.sorted[0] > self.steady or (
+            self.anchor is not None and abs(mean - self.anchor) > self.steady
+        ):
+            self.anchor = None
+            if not self.moving:
+                self.moving = True
+                self.moved_at = int(time.time())
+            return
+
+        if self.anchor is None:
+            self.anchor = mean
+            self.steady_since = now
+        elif (self.moving or self.level is None) and ticks_diff(now, self.steady_since) >= self.SETTLE_MS:
+            self.moving = False
+            self._settled(mean)
+        elif self.meal_from is not None and ticks_diff(now, self.steady_since) >= self.SESSION_GAP * 1000:
+            self._end_meal(self.level)
+
+    def check_day(self):
+        '''
+        Sends the DAY event once the day is over, with its start and end at its midnight and the next one.  Call this
+        every so often.
+        '''
+        offset = self.clock_offset()
+        if offset is None:
+            return
+        # Seconds to add to the device's clock to get the local time.
+        offset += self.utc_offset
+        day = (int(time.time()) + offset) // 86400
+        if self.day is None:
+            self.day = day
+        elif day != self.day:
+            eaten = self.today
+            start = self.day * 86400 - offset
+            self.day = day
+            self.today = 0
+            self.on_event(DAY, start, start + 86400, eaten)
+
+    def _settled(self, level: int):
+        previous = self.level
+        self.level = level
+        if previous is None:
+            return
+        now = int(time.time())
+
+        if level < self.removed_below:
+            if self.removed_from is None:
+                self._end_meal(previous)
+                self.removed_from = previous
+                self.on_event(REMOVED, self.moved_at, self.moved_at, 0)
+            return
+        if self.removed_from is not None:
+            change = level - self.removed_from
+            self.removed_from = None
+            self.on_event(RETURNED, now, now, change)
+            if change >= self.refill_min:
+                self.on_event(REFILL, now, now, change)
+            return
+
+        change = level - previous
+        if change >= self.refill_min:
+            self._end_meal(previous)
+            self.on_event(REFILL, self.moved_at, now, change)
+        elif change < -self.steady or self.meal_from is not None:
+            # Either the start of a meal or more of the one in progress.
+            if self.meal_from is None:
+                self.meal_from = previous
+                self.meal_start = self.moved_at
+            self.meal_end = now
+        else:
+            # Too small to be anything yet.  Keep comparing with the old level so that small steps add up.
+            self.level = previous
+
+    def _end_meal(self, level: int):
+        '''Ends the meal in progress (if there is one) with the weight at level, and sends it if enough was eaten.'''
+        meal_from = self.meal_from
+        if meal_from is None:
+            return
+        self.meal_from = None
+        eaten = meal_from - level
+        if eaten < self.meal_min:
+            return
+        self.check_day()
+        self.today += eaten
+        self.on_event(MEAL, self.meal_start, self.meal_end, eaten)
@@ -0,0 +1,404 @@
+import asyncio
+import json
+import time
+from adafruit_ticks import ticks_add, ticks_diff, ticks_ms
+
+EAGAIN = 11
+EPIPE = 32
+ECONNRESET = 104
+ETIMEDOUT = 110
+_MONTHS = b"janfebmaraprmayjunjulaugsepoctnovdec"
+
+
+class HomeAssistantClient:
+    '''
+    A minimal HTTP/1.1 client for the Home Assistant REST API which keeps a single connection open between requests.
+
+    Every state update used to pay for a new TCP connection and, for HTTPS, a full TLS handshake.  This client keeps the
+    socket alive and sends each request over it, so a burst of sensor updates shares one connection.  When the
+    connection does have to be re-established the previous TLS session is resumed if the ssl module supports it (CPython
+    does, CircuitPython currently doesn't).  If the server has closed an idle connection (it was reset or closed before
+    any of the response arrived) the request is transparently retried once on a new one.  Any other error, including a
+    timeout, closes the connection and is raised to the caller: the server may already have acted on the request, and
+    an event mustn't be fired twice.
+
+    Requests are coroutines which never block the event loop while waiting on the server: once connected the socket is
+    non-blocking, and whenever it can't take or give anything yet the request sleeps for POLL_INTERVAL seconds and
+    tries again, giving up after timeout seconds.  Only connecting (and the TLS handshake) blocks, for up to timeout,
+    which the kept-alive connection makes rare.  Requests from different tasks take turns on the connection.
+
+    The Date header of the responses tells how far the device's clock is from Home Assistant's (clock_offset, in seconds
+    to add to time.time()), as the device's clock isn't set.  It's checked again every CLOCK_SYNC_REQUESTS requests.
+    '''
+
+    CLOCK_SYNC_REQUESTS = 100
+    POLL_INTERVAL = 0.005  # seconds
+
+    def __init__(self, pool, url: str, token: str, ssl_context=None, timeout: float = 2):
+        scheme, _, host = url.partition("://")
+        host = host.rstrip("/")
+        self.tls = scheme == "https"
+        self.host, _, port = host.partition(":")
+        self.port = int(port) if port else (443 if self.tls else 80)
+        self.pool = pool
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.auth = "Bearer " + token
+        self.lock = asyncio.Lock()
+        self.deadline = 0  # ticks_ms when the request being made times out
+        self.responded = False  # Whether any of the response to the request being made has arrived
+        self.socket = None
+        self.tls_session = None
+        self.buffer = bytearray(512)
+        self.view = memoryview(self.buffer)
+        # Requests are assembled in here.
+        self.out = bytearray(512)
+        self.out_view = memoryview(self.out)
+        # entity_id -> (attributes, encoded request head, encoded start of the body) for post_state()
+        self.entities = {}
+        # Unconsumed response bytes are buffer[start:end]
+        self.start = 0
+        self.end = 0
+        self.line_start = 0
+        self.connects = 0
+        self.requests = 0
+        self.resumed = 0
+        self.clock_offset = None
+        self.clock_synced = 0  # self.requests when clock_offset was last set
+
+    @property
+    def connected(self) -> bool:
+        return self.socket is not None
+
+    def connect(self):
+        self.close()
+        addr_info = self.pool.getaddrinfo(self.host, self.port, 0, self.pool.SOCK_STREAM)[0]
+        sock = self.pool.socket(addr_info[0], addr_info[1])
+        try:
+            sock.settimeout(self.timeout)
+            if self.tls:
+                if self.tls_session is not None:
+                    sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host, session=self.tls_session)
+                else:
+                    sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+            sock.connect(addr_info[-1])
+            sock.settimeout(0)
+        except Exception:
+            sock.close()
+            raise
+        if getattr(sock, "session_reused", False):
+            self.resumed += 1
+        self.socket = sock
+        self.start = self.end = 0
+        self.connects += 1
+
+    def close(self):
+        if self.socket is None:
+            return
+        if self.tls:
+            # Hang on to the TLS session so the next connection can resume it.
+            self.tls_session = getattr(self.socket, "session", None)
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+        self.socket = None
+
+    async def post_state(self, entity_id: str, state, attributes: dict) -> int:
+        '''
+        Sets the state of an entity.  Returns the response's status code.  The request line, headers and attributes are
+        only encoded the first time an entity is posted (or when it's given a different attributes dict), so pass the
+        same dict each time and don't modify it.
+        '''
+        cached = self.entities.get(entity_id)
+        if cached is None or cached[0] is not attributes:
+            prefix = '{"attributes": ' + json.dumps(attributes) + ', "state": '
+            cached = (attributes, self._head("POST", "/api/states/" + entity_id), prefix.encode())
+            self.entities[entity_id] = cached
+        return await self._request(cached[1], json.dumps(state).encode(), cached[2], b"}")
+
+    async def request(self, method: str, path: str, data=None) -> int:
+        body = b"" if data is None else json.dumps(data).encode()
+        return await self._request(self._head(method, path), body)
+
+    def _head(self, method: str, path: str) -> bytes:
+        '''Everything in a request up to the value of the Content-Length header.'''
+        return (
+            "{} {} HTTP/1.1\r\nHost: {}\r\nAuthorization: {}\r\nContent-Type: application/json\r\n"
+            "Connection: keep-alive\r\nContent-Length: "
+        ).format(method, path, self.host, self.auth).encode()
+
+    async def _request(self, head: bytes, body: bytes, prefix: bytes = b"", suffix: bytes = b"") -> int:
+        async with self.lock:
+            return await self._locked_request(head, body, prefix, suffix)
+
+    async def _locked_request(self, head: bytes, body: bytes, prefix: bytes, suffix: bytes) -> int:
+        length = len(prefix) + len(body) + len(suffix)
+        # Send the request in one go; a separate write for the body stalls on Nagle's algorithm and delayed ACKs.  The
+        # request is assembled in a buffer that's reused unless the request doesn't fit.
+        out = self.out
+        size = len(head) + 10 + 4 + length
+        if size > len(out):
+            out = bytearray(size)
+        end = self._put(out, 0, head)
+        end = self._put_int(out, end, length)
+        end = self._put(out, end, b"\r\n\r\n")
+        end = self._put(out, end, prefix)
+        end = self._put(out, end, body)
+        end = self._put(out, end, suffix)
+        request = (self.out_view if out is self.out else memoryview(out))[:end]
+
+        reused = self.connected
+        if not reused:
+            self.connect()
+        try:
+            return await self._exchange(request)
+        except OSError as e:
+            self.close()
+            # A kept-alive connection may have been closed by the server while idle, in which case the request never
+            # got to it; that's worth one retry.  Once any of the response has arrived it got there.
+            if not reused or self.responded or (e.errno != ECONNRESET and e.errno != EPIPE):
+                raise
+        except asyncio.CancelledError:
+            # The rest of the response would be taken for the next one's.
+            self.close()
+            raise
+        self.connect()
+        try:
+            return await self._exchange(request)
+        except BaseException:
+            self.close()
+            raise
+
+    @staticmethod
+    def _put(out: bytearray, start: int, data: bytes) -> int:
+        end = start + len(data)
+        out[start:end] = data
+        return end
+
+    @staticmethod
+    def _put_int(out: bytearray, start: int, value: int) -> int:
+        digits = 1
+        while value >= 10 ** digits:
+            digits += 1
+        end = start + digits
+        for i in range(end - 1, start - 1, -1):
+            out[i] = 0x30 + value % 10  # '0'
+            value //= 10
+        return end
+
+    async def _exchange(self, request) -> int:
+        self.deadline = ticks_add(ticks_ms(), int(self.timeout * 1000))
+        self.responded = False
+        await self._send(request)
+        self.requests += 1
+
+        # The response is parsed where it sits in the receive buffer, a line at a time, rather than copying out lines.
+        buffer = self.buffer
+        end = self._line()
+        while end < 0:
+            await self._fill()
+            end = self._line()
+        start = self.line_start
+        if end - start < 12:
+            raise OSError(ECONNRESET, "Connection closed by server")
+        # "HTTP/1.1 200 OK"
+        status = (buffer[start + 9] - 0x30) * 100 + (buffer[start + 10] - 0x30) * 10 + buffer[start + 11] - 0x30
+
+        length = None
+        chunked = False
+        keep_alive = True
+        while True:
+            end = self._line()
+            while end < 0:
+                await self._fill()
+                end = self._line()
+            start = self.line_start
+            if start == end:
+                break
+            if self._header_is(start, end, b"content-length"):
+                length = self._parse_int(self._value(start, end), end, 10)
+            elif self._header_is(start, end, b"transfer-encoding"):
+                chunked = self._value_is(self._value(start, end), end, b"chunked")
+            elif self._header_is(start, end, b"connection"):
+                keep_alive = not self._value_is(self._value(start, end), end, b"close")
+            elif self._header_is(start, end, b"date") and (
+                self.clock_offset is None or self.requests - self.clock_synced >= self.CLOCK_SYNC_REQUESTS
+            ):
+                self._sync_clock(self._value(start, end), end)
+
+        if chunked:
+            while True:
+                end = self._line()
+                while end < 0:
+                    await self._fill()
+                    end = self._line()
+                size = self._parse_int(self.line_start, end, 16)
+                await self._skip(size)
+                while self._line() < 0:
+                    await self._fill()
+                if size == 0:
+                    break
+        elif length is not None:
+            await self._skip(length)
+        else:
+            # No length means the body runs until the server closes the connection.
+            keep_alive = False
+
+        if not keep_alive:
+            self.close()
+        return status
+
+    async def _send(self, view: memoryview):
+        sent = 0
+        while sent < len(view):
+            try:
+                sent += self.socket.send(view[sent:] if sent else view)
+            except OSError as e:
+                if e.errno != EAGAIN:
+                    raise
+                await self._wait()
+
+    async def _recv_into(self, view) -> int:
+        while True:
+            try:
+                count = self.socket.recv_into(view)
+            except OSError as e:
+                if e.errno != EAGAIN:
+                    raise
+                await self._wait()
+                continue
+            if count == 0:
+                raise OSError(ECONNRESET, "Connection closed by server")
+            self.responded = True
+            return count
+
+    async def _wait(self):
+        '''Gives the server POLL_INTERVAL more seconds, unless the request has run out of time.'''
+        if ticks_diff(self.deadline, ticks_ms()) <= 0:
+            raise OSError(ETIMEDOUT, "Timed out waiting for Home Assistant")
+        await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _fill(self):
+        # Keeps the unconsumed bytes (a partial line) and reads more after them.
+        remaining = self.end - self.start
+        if remaining == len(self.buffer):
+            raise OSError(90, "Response line too long")
+        buffer = self.buffer
+        start = self.start
+        for i in range(remaining):
+            buffer[i] = buffer[start + i]
+        count = await self._recv_into(self.view[remaining:])
+        self.start = 0
+        self.end = remaining + count
+
+    def _line(self) -> int:
+        '''
+        Consumes the next line of the response.  Returns where it ends in the buffer (without the line ending) and sets
+        line_start to where it starts, or -1 if the buffer doesn't hold all of it yet (so _fill() it and try again).
+        Returning a tuple would allocate one for every line, and so would making this a coroutine.
+        '''
+        buffer = self.buffer
+        i = self.start
+        end = self.end
+        while True:
+            if i == end:
+                return -1
+            if buffer[i] == 0x0A:  # \n
+                start = self.line_start = self.start
+                self.start = i + 1
+                if i > start and buffer[i - 1] == 0x0D:  # \r
+                    i -= 1
+                return i
+            i += 1
+
+    def _header_is(self, start: int, end: int, name: bytes) -> bool:
+        '''Whether the header line at buffer[start:end] is the (lower case) name.'''
+        buffer = self.buffer
+        length = len(name)
+        if end - start <= length or buffer[start + length] != 0x3A:  # :
+            return False
+        for i in range(length):
+            if buffer[start + i] | 0x20 != name[i]:  # Lower case letters (and leaves '-' alone)
+                return False
+        return True
+
+    def _value(self, start: int, end: int) -> int:
+        '''Where the value of the header line at buffer[start:end] starts.'''
+        buffer = self.buffer
+        i = start
+        while buffer[i] != 0x3A:  # :
+            i += 1
+        i += 1
+        while i < end and buffer[i] == 0x20:
+            i += 1
+        return i
+
+    def _value_is(self, start: int, end: int, value: bytes) -> bool:
+        buffer = self.buffer
+        while end > start and buffer[end - 1] == 0x20:
+            end -= 1
+        if end - start != len(value):
+            return False
+        for i in range(end - start):
+            if buffer[start + i] | 0x20 != value[i]:
+                return False
+        return True
+
+    def _parse_int(self, start: int, end: int, base: int) -> int:
+        buffer = self.buffer
+        value = 0
+        for i in range(start, end):
+            digit = buffer[i] | 0x20
+            if 0x30 <= digit <= 0x39:  # 0-9
+                digit -= 0x30
+            elif base == 16 and 0x61 <= digit <= 0x66:  # a-f
+                digit -= 0x61 - 10
+            else:
+                break
+            value = value * base + digit
+        return value
+
+    def _sync_clock(self, start: int, end: int):
+        '''Sets clock_offset from a Date header's value at buffer[start:end], e.g. "Tue, 14 Nov 2023 22:13:20 GMT".'''
+        buffer = self.buffer
+        if end - start < 29:
+            return
+        month = 0
+        while month < 12:
+            i = month * 3
+            if (buffer[start + 8] | 0x20 == _MONTHS[i] and buffer[start + 9] | 0x20 == _MONTHS[i + 1]
+                    and buffer[start + 10] | 0x20 == _MONTHS[i + 2]):
+                break
+            month += 1
+        if month == 12:
+            return
+        day = self._parse_int(start + 5, start + 7, 10)
+        year = self._parse_int(start + 12, start + 16, 10)
+        seconds = (
+            self._parse_int(start + 17, start + 19, 10) * 3600
+            + self._parse_int(start + 20, start + 22, 10) * 60
+            + self._parse_int(start + 23, start + 25, 10)
+        )
+        self.clock_offset = _days_since_epoch(year, month + 1, day) * 86400 + seconds - int(time.time())
+        self.clock_synced = self.requests
+
+    async def _skip(self, size: int):
+        while size > 0:
+            if self.start == self.end:
+                self.start = self.end = 0
+                self.end = await self._recv_into(self.view)
+            count = min(size, self.end - self.start)
+            self.start += count
+            size -= count
+
+
+def _days_since_epoch(year: int, month: int, day: int) -> int:
+    '''Days from 1970-01-01 to the date in the (proleptic) Gregorian calendar.'''
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (9 if month <= 2 else -3)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
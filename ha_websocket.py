@@ -0,0 +1,377 @@
+import asyncio
+import binascii
+import json
+import os
+import time
+from adafruit_ticks import ticks_add, ticks_diff, ticks_ms
+
+EAGAIN = 11
+EPIPE = 32
+ECONNRESET = 104
+ETIMEDOUT = 110
+
+
+class HomeAssistantWebSocket:
+    '''
+    A minimal client for the Home Assistant WebSocket API (/api/websocket) which keeps one authenticated connection open
+    so that Home Assistant can push events to the device as well as receive them.
+
+    call() sends a command and waits for its result, which is what the transport uses.  Events for the event types
+    given to subscribe() are collected as they arrive (by call() or, without waiting, by poll()) and handed out by
+    events().  The subscriptions are made every time the connection is.  poll() also pings Home Assistant if nothing
+    has been heard from it for KEEP_ALIVE seconds and gives up on the connection if the ping isn't answered.
+
+    Like HomeAssistantClient's requests, connect(), call() and poll() are coroutines which never block the event loop
+    while waiting on the server: once connected the socket is non-blocking, and whenever it can't take or give anything
+    yet they sleep for POLL_INTERVAL seconds and try again, giving up after timeout seconds.  Only connecting the socket
+    (and the TLS handshake) blocks.  They take turns on the connection, and poll() leaves it alone while a command is
+    waiting for its result, which handles whatever arrives in the meantime anyway.
+
+    A command sent on a connection that the server had closed (it was reset or closed before anything arrived) is
+    retried once on a new one.  Any other error, including a timeout, closes the connection and is raised to the caller,
+    as the command may already have been carried out.  Only unfragmented text, ping and close frames are understood,
+    which is all Home Assistant sends.  Subscribing to events other than Home Assistant's own needs the token of an
+    administrator.
+    '''
+
+    KEEP_ALIVE = 60  # seconds
+    POLL_INTERVAL = 0.005  # seconds
+
+    def __init__(self, pool, url: str, token: str, ssl_context=None, timeout: float = 2):
+        scheme, _, host = url.partition("://")
+        host = host.rstrip("/")
+        self.tls = scheme == "https"
+        self.host, _, port = host.partition(":")
+        self.port = int(port) if port else (443 if self.tls else 80)
+        self.pool = pool
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.token = token
+        self.lock = asyncio.Lock()
+        self.deadline = 0  # ticks_ms when what's being waited for times out
+        self.responded = False  # Whether anything has arrived since the command being made was sent
+        self.socket = None
+        # Received bytes that haven't been handled yet are buffer[start:end]
+        self.buffer = bytearray(1024)
+        self.start = 0
+        self.end = 0
+        # Frames are assembled in here.
+        self.out = bytearray(256)
+        self.next_id = 1
+        self.subscriptions = []  # Event types
+        self.received = []  # Events that haven't been handed out by events() yet
+        self.last_heard = 0
+        self.pinged = False
+        self.pong = None  # The payload of a ping that hasn't been answered yet
+        self.connects = 0
+        self.commands = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.socket is not None
+
+    def subscribe(self, event_type: str):
+        '''Collects the events of event_type from the next connection on.'''
+        self.subscriptions.append(event_type)
+
+    def events(self) -> list:
+        '''The events received since the last call, as Home Assistant sends them (event_type, data, time_fired...).'''
+        received = self.received
+        if received:
+            self.received = []
+        return received
+
+    async def connect(self):
+        '''Connects, unless a call() or another connect() got there first.'''
+        async with self.lock:
+            if not self.connected:
+                await self._connect()
+
+    async def _connect(self):
+        self.close()
+        addr_info = self.pool.getaddrinfo(self.host, self.port, 0, self.pool.SOCK_STREAM)[0]
+        sock = self.pool.socket(addr_info[0], addr_info[1])
+        try:
+            sock.settimeout(self.timeout)
+            if self.tls:
+                sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+            sock.connect(addr_info[-1])
+            sock.settimeout(0)
+        except Exception:
+            sock.close()
+            raise
+        self.socket = sock
+        self.start = self.end = 0
+        self.next_id = 1
+        self.pong = None
+        self.connects += 1
+        try:
+            self.deadline = ticks_add(ticks_ms(), int(self.timeout * 1000))
+            await self._handshake()
+            await self._authenticate()
+            for event_type in self.subscriptions:
+                await self._subscribe(event_type)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.socket is None:
+            return
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+        self.socket = None
+
+    async def call(self, message: dict) -> dict:
+        '''
+        Sends a command (everything but its id) and returns Home Assistant's result for it, which has "success" and
+        either a "result" or an "error".
+        '''
+        async with self.lock:
+            reused = self.connected
+            if not reused:
+                await self._connect()
+            try:
+                return await self._call(message)
+            except OSError as e:
+                self.close()
+                # The server may have closed the connection while it was idle, in which case the command never got to
+                # it; that's worth one retry.  Once anything has arrived since, it may have got there.
+                if not reused or self.responded or (e.errno != ECONNRESET and e.errno != EPIPE):
+                    raise
+            except asyncio.CancelledError:
+                # Its result would be left to arrive on the connection.
+                self.close()
+                raise
+            await self._connect()
+            try:
+                return await self._call(message)
+            except BaseException:
+                self.close()
+                raise
+
+    async def poll(self):
+        '''Handles whatever Home Assistant has sent without waiting for more.  Call this regularly.'''
+        if not self.connected or self.lock.locked():
+            return
+        async with self.lock:
+            try:
+                self.deadline = ticks_add(ticks_ms(), int(self.timeout * 1000))
+                while self._read():
+                    while self._next_message() is not None:
+                        pass
+                    if self.pong is not None:
+                        await self._send_pong()
+
+                silent = time.monotonic() - self.last_heard
+                if silent > 2 * self.KEEP_ALIVE and self.pinged:
+                    raise OSError(ETIMEDOUT, "Ping not answered")
+                if silent > self.KEEP_ALIVE and not self.pinged:
+                    await self._send({"type": "ping"})
+                    self.pinged = True
+            except BaseException:
+                self.close()
+                raise
+
+    async def _call(self, message: dict) -> dict:
+        self.deadline = ticks_add(ticks_ms(), int(self.timeout * 1000))
+        self.responded = False
+        id = await self._send(message)
+        self.commands += 1
+        while True:
+            reply = await self._receive()
+            if reply.get("id") == id:
+                return reply
+
+    async def _subscribe(self, event_type: str):
+        reply = await self._call({"type": "subscribe_events", "event_type": event_type})
+        if not reply.get("success"):
+            raise RuntimeError("Unable to subscribe to {}: {}".format(event_type, reply.get("error")))
+
+    async def _handshake(self):
+        key = binascii.b2a_base64(os.urandom(16)).strip()
+        request = (
+            "GET /api/websocket HTTP/1.1\r\nHost: {}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            "Sec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).format(self.host, key.decode()).encode()
+        await self._write(request)
+
+        # The response is only headers, so wait for the blank line that ends them.
+        buffer = self.buffer
+        i = 3
+        while True:
+            while i >= self.end:
+                await self._fill()
+            if buffer[i] == 0x0A and buffer[i - 1] == 0x0D and buffer[i - 2] == 0x0A:  # \n\r\n
+                break
+            i += 1
+        # "HTTP/1.1 101 Switching Protocols"
+        if bytes(buffer[9:12]) != b"101":
+            raise OSError(111, "WebSocket upgrade refused: " + bytes(buffer[0:12]).decode())
+        # Anything after the headers is already the first frame.
+        self.start = i + 1
+
+    async def _authenticate(self):
+        if (await self._receive()).get("type") != "auth_required":
+            raise RuntimeError("Unexpected WebSocket greeting")
+        await self._send({"type": "auth", "access_token": self.token}, False)
+        reply = await self._receive()
+        if reply.get("type") != "auth_ok":
+            raise RuntimeError("WebSocket authentication failed: {}".format(reply.get("message")))
+
+    async def _send(self, message: dict, numbered: bool = True) -> int:
+        '''Sends a message, numbering it (which adds its id to it) unless it's part of authenticating.'''
+        id = None
+        if numbered:
+            id = message["id"] = self.next_id
+            self.next_id += 1
+        payload = json.dumps(message).encode()
+
+        # A client's frames have to be masked.  The mask is only there to protect proxies that don't understand
+        # WebSocket, and an all zero one leaves the payload as it is rather than XORing every byte of it in Python.
+        length = len(payload)
+        header = 2 if length < 126 else 4 if length < 0x10000 else 10
+        size = header + 4 + length
+        out = self.out if size <= len(self.out) else bytearray(size)
+        out[0] = 0x81  # A complete text frame
+        if header == 2:
+            out[1] = 0x80 | length
+        elif header == 4:
+            out[1] = 0x80 | 126
+            out[2] = length >> 8
+            out[3] = length & 0xFF
+        else:
+            out[1] = 0x80 | 127
+            for i in range(8):
+                out[2 + i] = (length >> (8 * (7 - i))) & 0xFF
+        for i in range(header, header + 4):
+            out[i] = 0
+        out[header + 4:size] = payload
+        await self._write(memoryview(out)[:size])
+        return id
+
+    async def _write(self, data):
+        view = memoryview(data)
+        sent = 0
+        while sent < len(view):
+            try:
+                sent += self.socket.send(view[sent:] if sent else view)
+            except OSError as e:
+                if e.errno != EAGAIN:
+                    raise
+                await self._wait()
+
+    async def _receive(self) -> dict:
+        '''Waits for the next message that isn't an event or a control frame.'''
+        while True:
+            message = self._next_message()
+            if self.pong is not None:
+                await self._send_pong()
+            if message is None:
+                await self._fill()
+            elif message and message.get("type") != "event":
+                return message
+
+    def _next_message(self):
+        '''
+        Handles the next complete frame in the buffer.  Returns the message if it was one (events are also kept for
+        events()), {} if it was a control frame, or None if there isn't a complete frame yet.  A ping is answered by
+        _send_pong() afterwards.
+        '''
+        buffer = self.buffer
+        start = self.start
+        available = self.end - start
+        if available < 2:
+            return None
+        opcode = buffer[start] & 0x0F
+        if not buffer[start] & 0x80:
+            raise OSError(95, "Fragmented WebSocket messages aren't supported")
+        length = buffer[start + 1] & 0x7F
+        header = 2
+        if length == 126:
+            header = 4
+        elif length == 127:
+            header = 10
+        if available < header:
+            return None
+        if header > 2:
+            length = 0
+            for i in range(start + 2, start + header):
+                length = (length << 8) | buffer[i]
+        if header + length > len(buffer):
+            # Bigger than anything Home Assistant normally sends, so the buffer only grows when it has to.
+            self._grow(header + length)
+            buffer = self.buffer
+            start = self.start
+        if available < header + length:
+            return None
+        payload_start = start + header
+        self.start = payload_start + length
+        self.last_heard = time.monotonic()
+        self.pinged = False
+
+        if opcode == 0x1:  # Text
+            message = json.loads(bytes(buffer[payload_start:payload_start + length]))
+            if message.get("type") == "event":
+                self.received.append(message["event"])
+            return message
+        if opcode == 0x9:  # Ping
+            self.pong = bytes(buffer[payload_start:payload_start + length])
+        elif opcode == 0x8:  # Close
+            raise OSError(ECONNRESET, "Connection closed by server")
+        return {}
+
+    async def _send_pong(self):
+        payload = self.pong
+        self.pong = None
+        length = len(payload)
+        out = self.out
+        out[0] = 0x8A  # A complete pong frame
+        out[1] = 0x80 | length
+        for i in range(2, 6):
+            out[i] = 0
+        out[6:6 + length] = payload
+        await self._write(memoryview(out)[:6 + length])
+
+    async def _fill(self):
+        '''Waits for more to arrive, unless what's being waited for has run out of time.'''
+        while not self._read():
+            await self._wait()
+
+    async def _wait(self):
+        '''Gives the server POLL_INTERVAL more seconds, unless what's being waited for has run out of time.'''
+        if ticks_diff(self.deadline, ticks_ms()) <= 0:
+            raise OSError(ETIMEDOUT, "Timed out waiting for Home Assistant")
+        await asyncio.sleep(self.POLL_INTERVAL)
+
+    def _read(self) -> bool:
+        '''Reads what has arrived into the buffer after what hasn't been handled yet.  Returns False if nothing had.'''
+        buffer = self.buffer
+        if self.start:
+            remaining = self.end - self.start
+            buffer[0:remaining] = buffer[self.start:self.end]
+            self.start = 0
+            self.end = remaining
+        if self.end == len(buffer):
+            raise OSError(90, "WebSocket frame too long")
+        try:
+            count = self.socket.recv_into(memoryview(buffer)[self.end:])
+        except OSError as e:
+            if e.errno == EAGAIN:
+                return False
+            raise
+        if count == 0:
+            raise OSError(ECONNRESET, "Connection closed by server")
+        self.end += count
+        self.responded = True
+        return True
+
+    def _grow(self, size: int):
+        buffer = bytearray(size)
+        remaining = self.end - self.start
+        buffer[0:remaining] = self.buffer[self.start:self.end]
+        self.buffer = buffer
+        self.start = 0
+        self.end = remaining
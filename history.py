@@ -0,0 +1,112 @@
+import time
+from array import array
+
+# The mean of a bucket that nothing was recorded in.
+MISSING = -0x80000000
+
+
+class History:
+    '''
+    A fixed-size, downsampled history of the weight: a bucket for every period seconds (by the device's clock) going
+    back size buckets, each holding the lowest, highest and mean weight in it.  The default is a day at a bucket a
+    minute.  Everything is kept in whole decigrams in preallocated arrays, so the history never grows and recording a
+    sample doesn't allocate.  Buckets that nothing was recorded in (while the program wasn't running) are missing.
+
+    hour() rolls the buckets up into hourly statistics, which is what Home Assistant keeps long term.
+    '''
+
+    def __init__(self, size: int = 1440, period: int = 60):
+        self.size = size
+        self.period = period
+        self.minimum = array("i", [0] * size)
+        self.maximum = array("i", [0] * size)
+        self.mean = array("i", [MISSING] * size)
+        self.convert = None  # Turns a raw sample into decigrams
+        self.newest = None  # The number (time // period) of the bucket being filled, None until the first sample
+        self.low = 0
+        self.high = 0
+        self.total = 0
+        self.count = 0
+
+    def watch(self, sampler, convert):
+        '''Starts recording the sampler's samples.  convert turns a raw sample into decigrams.'''
+        self.convert = convert
+        sampler.listeners.append(self.on_sample)
+
+    def on_sample(self, value: int):
+        self.add(self.convert(value))
+
+    def add(self, decigrams: int):
+        number = int(time.time()) // self.period
+        if number != self.newest:
+            self._start(number)
+        if self.count == 0 or decigrams < self.low:
+            self.low = decigrams
+        if self.count == 0 or decigrams > self.high:
+            self.high = decigrams
+        self.total += decigrams
+        self.count += 1
+
+    def bucket(self, number: int) -> tuple:
+        '''The (lowest, highest, mean) of a complete bucket, or None if it's missing or no longer kept.'''
+        if self.newest is None or number >= self.newest or number <= self.newest - self.size:
+            return None
+        i = number % self.size
+        if self.mean[i] == MISSING:
+            return None
+        return self.minimum[i], self.maximum[i], self.mean[i]
+
+    def hour(self, start: int, offset: int = 0) -> tuple:
+        '''
+        The (lowest, highest, mean) of the complete buckets that start within the hour from start, or None if there are
+        none.  The mean is of the buckets' means, so every period counts the same however many samples it had.  offset
+        is added to the device's clock to get the time that start is in (see HomeAssistantClient.clock_offset).
+        '''
+        period = self.period
+        first = -(-(start - offset) // period)
+        end = -(-(start + 3600 - offset) // period)
+        low = high = total = count = 0
+        for number in range(first, end):
+            bucket = self.bucket(number)
+            if bucket is None:
+                continue
+            if count == 0 or bucket[0] < low:
+                low = bucket[0]
+            if count == 0 or bucket[1] > high:
+                high = bucket[1]
+            total += bucket[2]
+            count += 1
+        if count == 0:
+            return None
+        return low, high, total // count
+
+    def oldest(self) -> int:
+        '''When (by the device's clock) the oldest bucket that's still kept starts, or None if there isn't one.'''
+        if self.newest is None:
+            return None
+        for number in range(self.newest - self.size + 1, self.newest):
+            if self.mean[number % self.size] != MISSING:
+                return number * self.period
+        return None
+
+    def _start(self, number: int):
+        '''Closes the bucket being filled and starts bucket number, marking any skipped in between as missing.'''
+        newest = self.newest
+        if newest is None or number < newest or number - newest > self.size:
+            # Nothing to keep, or the clock went backwards.
+            for i in range(self.size):
+                self.mean[i] = MISSING
+        else:
+            i = newest % self.size
+            if self.count:
+                self.minimum[i] = self.low
+                self.maximum[i] = self.high
+                self.mean[i] = self.total // self.count
+            else:
+                self.mean[i] = MISSING
+            for skipped in range(newest + 1, number):
+                self.mean[skipped % self.size] = MISSING
+        self.mean[number % self.size] = MISSING
+        self.newest = number
+        self.total = 0
+        self.count = 0
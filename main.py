@@ -2,14 +2,26 @@ import asyncio
 import board
 import microcontroller
 import digitalio
+import time
+import wifi
 import traceback
 import supervisor
 
+import scale
+from buttons import Buttons, DOUBLE_PRESS, LONG_PRESS, PRESS
 from led import blink, pixels, blink_n
-from scale import init_scale, read_weight_with_validation, tare
-from network import init_network, CinnaScaleDevice, CinnaBinarySensor, CinnaSensor
+from memory import AllocationMeter
+from power import PowerManager
+from scale import calibrate, clear_calibration, init_scale, read_settled_weight, sample, set_idle_rate, tare
+from network import (
+    commands, init_network, maintain_transport, publisher, secrets, wifi_manager, CinnaScaleDevice, CinnaBinarySensor,
+    CinnaSensor
+)
 
-EHOSTUNREACH = 118
+# How long (in seconds) a measured weigh cycle waits for its reports to be published.
+MEMORY_PUBLISH_TIMEOUT = 5
+
+boot_time = time.monotonic()
 
 print()
 print("=================================================")
@@ -25,77 +37,230 @@ def get_button(pin: microcontroller.Pin) -> digitalio.DigitalInOut:
 
 
 boot_button = get_button(board.BUTTON)
-unit_button = get_button(board.MOSI)
-tare_button = get_button(board.MISO)
-off_button = get_button(board.SCK)
+buttons = Buttons([board.MOSI, board.MISO, board.SCK], ["unit", "tare", "off"])
 
 taring: bool = False
-trigger_weigh_event = asyncio.Event()
 scale_device = CinnaScaleDevice()
+# Set when the weight should be checked right away: by the unit button or when the samples show it has changed.
+trigger_weigh_event = scale_device.policy.wake
+# Set "instrument_memory": True in secrets.py to print how many bytes every weigh cycle (reading the weight, recording
+# it and publishing the reports) allocates.
+memory_meter = AllocationMeter("weigh cycle") if secrets.get("instrument_memory", False) else None
+# The known weight (in grams) that a long press of the tare button calibrates the scale with.
+CALIBRATION_WEIGHT = secrets.get("calibration_weight", 100)
+# Set "low_power": True in secrets.py to run on battery.  Instead of staying awake it reports every
+# "low_power_interval" seconds and sleeps in between (see power.py).  A button press wakes it up for
+# LOW_POWER_AWAKE seconds.
+LOW_POWER = secrets.get("low_power", False)
+LOW_POWER_INTERVAL = secrets.get("low_power_interval", 300)
+LOW_POWER_AWAKE = 60  # seconds
+LOW_POWER_PUBLISH_TIMEOUT = 10  # seconds
+
+power = None
+if LOW_POWER:
+    # The boot button is one of the pins that wakes it up.
+    boot_button.deinit()
+    power = PowerManager(boot_time, buttons.pins + [board.BUTTON], [board.BUTTON])
 
 
 async def main():
-    await blink_n(0.2, 0x000033, 3)
-
-    await asyncio.gather(init_network(), init_scale())
+    # Blinking the LED uses power and holds up the report, so it's skipped when running on battery.
+    if not LOW_POWER:
+        await blink_n(0.2, 0x000033, 3)
+
+    # The scale goes first so that its power-up delays overlap with connecting to WiFi.  Sampling doesn't need the
+    # network, so it starts as soon as the scale is ready.
+    network_ready = asyncio.create_task(init_network())
+    await init_scale()
+    scale_device.policy.watch(scale.sampler, scale.convert_to_decigrams)
+    scale_device.feeding.watch(scale.sampler, scale.convert_to_decigrams)
+    scale_device.history.watch(scale.sampler, scale.convert_to_decigrams)
+    if power is not None:
+        scale.restore_samples(power.state.samples)
+    # The sampler and publisher run for the lifetime of the program.
+    asyncio.create_task(sample())
+    await network_ready
+
+    if not LOW_POWER:
+        await blink_n(0.1, 0x110033, 3)
+
+    asyncio.create_task(wifi_manager.run())
+    asyncio.create_task(publisher.run())
+    asyncio.create_task(maintain_transport())
+    asyncio.create_task(scale_device.replay_offline_log())
+    asyncio.create_task(scale_device.send_feeding_events())
+    asyncio.create_task(scale_device.upload_history())
+    asyncio.create_task(report_boot_time())
+
+    if power is not None:
+        await duty_cycle()
+
+    # The publisher restarts the network when Home Assistant can't be reached (see Publisher.RECONNECT_AFTER).
+    await asyncio.gather(
+        weigh(trigger_weigh_event),
+        blink(1.0, 0x000005),
+        buttons.run(),
+        commands.run(),
+    )
+
+
+async def duty_cycle():
+    '''
+    Weighs, reports and sleeps for LOW_POWER_INTERVAL seconds, over and over.  If a button woke it up, it stays awake
+    (weighing and handling the buttons as usual) for LOW_POWER_AWAKE seconds before going back to sleep.
+    '''
+    while True:
+        # The samples restored from before the sleep don't count until a new one agrees with them.
+        await scale.sampler.wait_for_new()
+        await weigh_once()
+        if await publisher.wait_idle(LOW_POWER_PUBLISH_TIMEOUT):
+            power.reported()
+
+        if power.woken_by_button:
+            print("Woken by a button.  Staying awake for {}s".format(LOW_POWER_AWAKE))
+            tasks = [asyncio.create_task(weigh(trigger_weigh_event)), asyncio.create_task(buttons.run())]
+            await asyncio.sleep(LOW_POWER_AWAKE)
+            while taring:
+                await asyncio.sleep(1)
+            for task in tasks:
+                task.cancel()
+
+        samples = await scale.power_down()
+        buttons.suspend()
+        wifi.radio.enabled = False
+        pixels.fill(0)
+        # Only a light sleep returns.  A deep sleep starts the program over when it ends.
+        power.sleep(LOW_POWER_INTERVAL, samples)
+        wifi.radio.enabled = True
+        buttons.resume()
+        await asyncio.gather(scale.power_up(), wifi_manager.connect())
+
+
+async def report_boot_time():
+    '''Prints how long it took from starting up until the first weight reached Home Assistant.'''
+    while scale_device.weight_sensor.value is None:
+        await asyncio.sleep(0.05)
+    print("First report {:.2f}s after boot".format(time.monotonic() - boot_time))
+
+
+async def manual_restart():
+    print("Manual restart...")
+    await blink_n(0.05, 0x226600, 10)
+    supervisor.reload()
 
-    await blink_n(0.1, 0x110033, 3)
 
-    while True:
-        try:
-            await asyncio.gather(
-                weigh(trigger_weigh_event),
-                blink(1.0, 0x000005),
-                watch_buttons(),
+async def hard_reset():
+    print("Resetting...")
+    await blink_n(0.05, 0x662200, 10)
+    microcontroller.reset()
+
+
+async def tare_scale():
+    global taring
+    print("Taring...")
+    taring = True
+    await blink_n(0.05, 0x441133, 20)
+    # Time to get the scale into its "zero weight" state.
+    await asyncio.sleep(5)
+    await tare()
+    # The weights it was following are relative to the old tare.
+    scale_device.feeding.reset()
+    taring = False
+
+
+async def calibrate_scale():
+    global taring
+    print("Calibrating...")
+    taring = True
+    await blink_n(0.05, 0x333300, 20)
+    # Time to let go of the button and put the weight on.
+    await asyncio.sleep(5)
+    try:
+        await calibrate(CALIBRATION_WEIGHT)
+        scale_device.feeding.reset()
+    except ValueError as e:
+        print("Calibration failed:", e)
+        await blink_n(0.1, 0x330000, 10)
+    taring = False
+
+
+async def clear_scale_calibration():
+    print("Clearing the calibration...")
+    clear_calibration()
+    # The weights it was following were from the old calibration.
+    scale_device.feeding.reset()
+    await blink_n(0.05, 0x333300, 5)
+
+
+async def request_measurement():
+    # This wakes up the weigh loop, which reports the weight whether or not it has changed.
+    print("Triggering measurement...")
+    scale_device.policy.request()
+
+
+async def set_empty_threshold(data: dict):
+    grams = data.get("grams")
+    if not isinstance(grams, (int, float)):
+        raise ValueError("set_threshold needs the grams")
+    print("Setting the empty threshold to {}g".format(grams))
+    scale_device.set_empty_threshold(grams)
+
+
+async def set_sample_rate(data: dict):
+    rate = data.get("rate")
+    if not isinstance(rate, int):
+        raise ValueError("set_sample_rate needs the rate")
+    print("Setting the idle conversion rate to {} SPS".format(rate))
+    set_idle_rate(rate)
+
+
+async def print_status():
+    ap_info = wifi.radio.ap_info
+    print("Status:")
+    print("  Tare:", scale.tare_weight, " Calibration:", scale.calibration.points)
+    print("  WiFi:", "disconnected" if ap_info is None else "{} (RSSI: {})".format(ap_info.ssid, ap_info.rssi))
+    print("  Published:", publisher.sent, " Pending:", len(publisher.order), " Dropped:", publisher.dropped)
+    print("  Logged offline:", scale_device.offline_log.pending)
+    for name, stats in scale.bus.stats().items():
+        print(
+            "  I2C {}: {:.2f}% busy, {} transactions, {} waits ({}ms, longest {}ms)".format(
+                name, stats["utilization"] * 100, stats["transactions"], stats["waits"], stats["wait_ms"],
+                stats["max_wait_ms"]
             )
-        except RuntimeError as re:
-            # Check if the cause of the exception was an OSError with EHOSTUNREACH
-            if isinstance(re.__cause__, OSError) and re.__cause__.errno == EHOSTUNREACH:
-                print("Host unreachable.  Restarting network... ", end="")
-                reconnected = await init_network()
-                if reconnected:
-                    print("Reconnected!")
-                else:
-                    print("Failed to reconnect.")
-                    raise
-            else:
-                raise
-
-
-async def watch_buttons():
-    global off_button, tare_button, taring, trigger_weigh_event
-
-    while True:
-        await asyncio.sleep(0.0)
-
-        if not off_button.value:
-            print("Manual restart...")
-            await blink_n(0.05, 0x226600, 10)
-            supervisor.reload()
-
-        if not tare_button.value:
-            print("Taring...")
-            taring = True
-            await blink_n(0.05, 0x441133, 20)
-            # Cheap debounce so we don't tare a whole bunch of times.
-            await asyncio.sleep(5)
-            await tare()
-            taring = False
-
-        if not unit_button.value:
-            print("Measurement requested.")
-            await asyncio.sleep(2)
-            # Set this event which should cause the weigh loop to immediately restart
-            print("Triggering measurement...")
-            trigger_weigh_event.set()
+        )
+
+
+buttons.on("off", PRESS, manual_restart)
+buttons.on("off", LONG_PRESS, hard_reset)
+buttons.on("tare", PRESS, tare_scale)
+buttons.on("tare", LONG_PRESS, calibrate_scale)
+buttons.on("tare", DOUBLE_PRESS, clear_scale_calibration)
+buttons.on("unit", PRESS, request_measurement)
+buttons.on("unit", DOUBLE_PRESS, print_status)
+# The same, for commands from Home Assistant.
+commands.on("tare", lambda data: tare_scale())
+commands.on("calibrate", lambda data: calibrate_scale())
+commands.on("clear_calibration", lambda data: clear_scale_calibration())
+commands.on("measure", lambda data: request_measurement())
+commands.on("set_threshold", set_empty_threshold)
+commands.on("set_sample_rate", set_sample_rate)
+commands.on("reboot", lambda data: manual_restart())
 
 
 async def weigh_once() -> bool:
     global scale_device
 
-    scale_device.record_connection_strength()
-    success, result = await try_weigh()
-    scale_device.record_weight(success, result)
+    if memory_meter is not None:
+        memory_meter.start()
+    try:
+        success, result = await try_weigh()
+        scale_device.record_weight(success, result)
+        if memory_meter is not None:
+            await publisher.wait_idle(MEMORY_PUBLISH_TIMEOUT)
+    finally:
+        if memory_meter is not None:
+            memory_meter.stop()
+            memory_meter.report()
     return success
 
 
@@ -107,11 +272,11 @@ async def weigh(trigger_weigh_event: asyncio.Event):
             await asyncio.sleep(1)
             continue
 
-        next_delay = 60  # seconds
+        success = await weigh_once()
 
-        if not await weigh_once():
-            # If we failed to weigh because we were unstable, then try again more quickly.
-            next_delay = 5  # seconds
+        # Sleep until the next heartbeat is due unless the weight changes first (see reporting.py).  If we failed to
+        # weigh because we were unstable, then try again more quickly.
+        next_delay = scale_device.policy.next_check(success)
 
         # If we happen to have been triggered right after we completed a report, we'll skip it.
         trigger_weigh_event.clear()
@@ -120,7 +285,7 @@ async def weigh(trigger_weigh_event: asyncio.Event):
 
 async def try_weigh() -> tuple[bool, float]:
     try:
-        result = await read_weight_with_validation()
+        result, _ = await read_settled_weight()
         return True, result
     except ValueError:
         # We got a value error which means that the scale is not stable just skip this reading and try again later
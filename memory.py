@@ -0,0 +1,55 @@
+import gc
+
+try:
+    from gc import mem_alloc, mem_free
+except ImportError:
+    # CPython (the host simulation) doesn't have these.  tracemalloc's count of traced bytes stands in for them, although
+    # CPython frees most objects as soon as they're unused so it only shows what a cycle holds on to.
+    import tracemalloc
+
+    def mem_alloc() -> int:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return tracemalloc.get_traced_memory()[0]
+
+    def mem_free() -> int:
+        return 0
+
+
+class AllocationMeter:
+    '''
+    Measures how many bytes of heap are allocated between start() and stop(), for checking that a code path doesn't
+    churn the heap.  The garbage collector is held off in between so that nothing is freed and the growth of
+    gc.mem_alloc() is everything that was allocated, by every task that ran in the meantime.  Keep the measured section
+    short: with the collector off, running out of heap raises MemoryError instead of collecting.
+    '''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.cycles = 0
+        self.last = 0
+        self.total = 0
+        self.most = 0
+        self._start = 0
+
+    def start(self):
+        gc.collect()
+        gc.disable()
+        self._start = mem_alloc()
+
+    def stop(self) -> int:
+        allocated = mem_alloc() - self._start
+        gc.enable()
+        self.cycles += 1
+        self.last = allocated
+        self.total += allocated
+        if allocated > self.most:
+            self.most = allocated
+        return allocated
+
+    def report(self):
+        print(
+            "[memory] {}: {} bytes allocated ({} average, {} most over {} cycles), {} bytes free".format(
+                self.name, self.last, self.total // self.cycles, self.most, self.cycles, mem_free()
+            )
+        )
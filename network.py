@@ -1,13 +1,26 @@
 import binascii
 import asyncio
+import struct
+import time
+import microcontroller
 import wifi
 import mdns
 import ssl
 import socketpool
-import traceback
-import adafruit_requests
 from adafruit_httpserver import Server
 
+import settings
+from commands import Commands
+from ha_client import HomeAssistantClient
+from ha_websocket import HomeAssistantWebSocket
+from transport import MqttTransport, RestTransport, WebSocketTransport
+from offline_log import OfflineLog, FLAG_EMPTY, FLAG_UNSTABLE
+from publisher import Publisher
+from reporting import ReportPolicy
+from feeding import FeedingDetector, DAY, MEAL
+from history import History
+from wifi_manager import WiFiManager
+
 EHOSTUNREACH = 118
 
 # URLs to fetch from
@@ -23,9 +36,32 @@ except ImportError:
     raise
 
 pool: socketpool.SocketPool = None
-requests: adafruit_requests.Session = None
+transport: RestTransport = None
 
 HASS_URL = secrets["homeassistant_url"]
+# How states get to Home Assistant: "rest" (the default), "mqtt", which uses the mqtt_* secrets, or "websocket", which
+# also takes commands from Home Assistant (see commands.py).
+TRANSPORT = secrets.get("transport", "rest")
+# Commands are sent to the device as events of this type.
+COMMAND_EVENT = "cinnascale_command"
+# How often (in seconds) the transport gets a chance to keep its connection alive.
+TRANSPORT_POLL_INTERVAL = 10
+
+# How many times connecting to WiFi is tried while starting up before falling back to the config portal.
+CONNECT_ATTEMPTS = 6
+
+# Region of NVM used to log readings while Home Assistant is unreachable.
+OFFLINE_LOG_START = 1024
+OFFLINE_LOG_SIZE = 3072
+
+# Changes in the weight of up to REPORT_DEADBAND grams aren't reported.  Changes are checked at most every
+# REPORT_MIN_INTERVAL seconds, and if nothing has been reported for REPORT_MAX_INTERVAL seconds everything is reported
+# anyway as a heartbeat.
+REPORT_DEADBAND = secrets.get("report_deadband", 2)
+REPORT_MIN_INTERVAL = 5
+REPORT_MAX_INTERVAL = secrets.get("report_max_interval", 900)
+# Hours ahead of UTC that the days of feeding end at midnight of.
+UTC_OFFSET = secrets.get("utc_offset", 0)
 
 
 class BaseCinnaSensor:
@@ -34,47 +70,49 @@ class BaseCinnaSensor:
     ):
         self.sensor_type = None
         self.name = name
+        self._sensor_name = None
         self.value = None
         self.attributes = {
             "friendly_name": friendly_name,
             "device_class": device_class,
             "icon": icon,
         }
-        self.headers = {
-            "Authorization": "Bearer " + secrets["token"],
-            "Content-Type": "application/json",
-        }
 
     @property
     def sensor_name(self):
-        return self.sensor_type + "." + self.name
+        # Built once rather than on every update.
+        if self._sensor_name is None:
+            self._sensor_name = self.sensor_type + "." + self.name
+        return self._sensor_name
 
     def update(self, value: int, force: bool = False):
-        if not force and self.value == value:
-            print(f"[{self.sensor_name}] Value ({value}) unchanged, skipping update")
+        """
+        Queues an update of the sensor's state in Home Assistant.  This never blocks, the publisher sends it in the
+        background.
+        """
+        # These print their pieces separately instead of formatting a new string for every update.
+        if not force and self.value == value and not publisher.is_pending(self):
+            print("[", self.sensor_name, "] Value (", value, ") unchanged, skipping update", sep="")
             return
 
-        data = {"state": value, "attributes": self.attributes}
-
         update_message = "Force updating" if force else "Updating"
-        print(f"[{self.sensor_name}] {update_message} to {value}... ", end="")
+        print("[", self.sensor_name, "] ", update_message, " to ", value, " (queued)", sep="")
+        publisher.submit(self, value)
 
-        url = f"{HASS_URL}/api/states/{self.sensor_name}"
+    async def post(self, value: int) -> bool:
+        """
+        Sends the state to Home Assistant.  Returns whether it was accepted, anything worth retrying is raised.
+        """
+        print("[", self.sensor_name, "] Publishing ", value, "... ", sep="", end="")
 
-        global requests
-        try:
-            response = requests.post(url, json=data, headers=self.headers, timeout=2)
-        except adafruit_requests.OutOfRetries as oor:
-            print("Update failed.  Out of retries.")
-            traceback.print_exception(oor)
-            return
-            # raise CinnaScaleError("Failed to update {} value".format(self.sensor_name)) from e
+        global transport
+        accepted = await transport.publish_state(self, value)
 
-        if response.status_code < 200 or response.status_code >= 300:
-            print(f"Unexpected status code {response.status_code}")
-        else:
+        if accepted:
             self.value = value
-            print(f"Success! Status: {response.status_code}")
+            print("Success!")
+
+        return accepted
 
 
 class CinnaBinarySensor(BaseCinnaSensor):
@@ -108,74 +146,330 @@ class CinnaScaleDevice():
     SENSOR_NAME = "cinnascale"
     FRIENDLY_NAME = "CinnaScale"
     EMPTY_THRESHOLD = 10
+    # Once empty, the bowl only stops being empty this many grams above EMPTY_THRESHOLD.
+    EMPTY_HYSTERESIS = 5
+    # Changes in the connection strength (in dBm) that are reported between heartbeats.
+    RSSI_DEADBAND = 6
+    # Logged readings are uploaded as events of this type, REPLAY_BATCH readings at a time.
+    REPLAY_EVENT = "cinnascale_readings"
+    REPLAY_BATCH = 32
+    REPLAY_INTERVAL = 5  # seconds
+    # Feeding events are sent as events of this type.  Up to FEEDING_QUEUE of them are kept (the oldest are dropped
+    # first) until Home Assistant can be reached.
+    FEEDING_EVENT = "cinnascale_feeding"
+    FEEDING_QUEUE = 32
+    FEEDING_INTERVAL = 60  # seconds
+    # The history is uploaded as hourly long-term statistics every HISTORY_INTERVAL seconds, up to HISTORY_BATCH hours
+    # in one request.
+    HISTORY_STATISTIC = {
+        "statistic_id": "cinnascale:weight",
+        "source": "cinnascale",
+        "name": "CinnaScale Weight",
+        "unit_of_measurement": "g",
+        "has_mean": True,
+        "has_sum": False,
+    }
+    HISTORY_INTERVAL = 3600  # seconds
+    HISTORY_BATCH = 24
 
     def __init__(self):
         self.weight_sensor = CinnaSensor(f"{self.SENSOR_NAME}", f"{self.FRIENDLY_NAME}", "weight", "mdi:scale", "measurement", "g")
         self.empty_sensor = CinnaBinarySensor(f"{self.SENSOR_NAME}_empty", f"{self.FRIENDLY_NAME} Empty", "battery")
         self.unstable_sensor = CinnaBinarySensor(f"{self.SENSOR_NAME}_unstable", f"{self.FRIENDLY_NAME} Unstable", "vibration")
         self.connection_strength_sensor = CinnaSensor(f"{self.SENSOR_NAME}_connection_strength", f"{self.FRIENDLY_NAME} Connection Strength", "signal_strength", "mdi:wifi")
+        self.eaten_today_sensor = CinnaSensor(f"{self.SENSOR_NAME}_eaten_today", f"{self.FRIENDLY_NAME} Eaten Today", "weight", "mdi:food-drumstick", "total_increasing", "g")
+        self.offline_log = OfflineLog(microcontroller.nvm, OFFLINE_LOG_START, OFFLINE_LOG_SIZE)
+        empty_threshold = settings.store.get_int(settings.EMPTY_THRESHOLD, self.EMPTY_THRESHOLD * 10) / 10
+        self.policy = ReportPolicy(
+            REPORT_DEADBAND, empty_threshold, self.EMPTY_HYSTERESIS, REPORT_MIN_INTERVAL, REPORT_MAX_INTERVAL
+        )
+        # The day's total is kept in the settings as the day and the decigrams eaten during it.
+        day, today = struct.unpack("<ii", settings.store.get(settings.EATEN_TODAY, struct.pack("<ii", -1, 0)))
+        self.feeding = FeedingDetector(
+            self.record_feeding_event, lambda: None if transport is None else transport.clock_offset,
+            int(UTC_OFFSET * 3600), None if day < 0 else day, today
+        )
+        self.feeding_events = []  # [kind, start, end, grams] waiting to be sent
+        self.feeding_ready = asyncio.Event()
+        self.history = History()
+        self.history_uploaded = None  # Home Assistant's time up to which the history has been uploaded
 
     # Record the current WIFI signal strength.  We do this separately from the updating of any other sensors because we
     # want to record this whenever possible and avoid potential issues with the scale updated so that we have some data
-    # point that indicates that we're still connected.
-    def record_connection_strength(self):
-        self.connection_strength_sensor.update(wifi.radio.ap_info.rssi, True)
+    # point that indicates that we're still connected.  It's forced through with every heartbeat, and in between only
+    # reported if it has changed by more than RSSI_DEADBAND.
+    def record_connection_strength(self, heartbeat: bool = True):
+        ap_info = wifi.radio.ap_info
+        # ap_info is None while the radio is disconnected.  The publisher reconnects, so there's nothing to record yet.
+        if ap_info is None:
+            return
+        sensor = self.connection_strength_sensor
+        if heartbeat or sensor.value is None or abs(ap_info.rssi - sensor.value) > self.RSSI_DEADBAND:
+            sensor.update(ap_info.rssi, heartbeat)
 
     def record_weight(self, success: bool, weight: int):
+        '''Records a reading (and the connection strength), reporting whatever the policy says is worth reporting.'''
+        policy = self.policy
+        heartbeat = policy.heartbeat_due()
+        self.record_connection_strength(heartbeat)
+        changed = policy.check(weight if success else None)
+
+        # The publisher only ever holds the latest state, so while we're offline keep every reading in the log.
+        if not publisher.online:
+            flags = 0
+            if not success:
+                flags |= FLAG_UNSTABLE
+            elif policy.empty:
+                flags |= FLAG_EMPTY
+            self.offline_log.append(int(time.time()), weight, flags)
+
         if success:
-            self.weight_sensor.update(weight)
-            self.empty_sensor.update(weight < self.EMPTY_THRESHOLD)
+            if changed or heartbeat:
+                self.weight_sensor.update(weight, heartbeat)
+                policy.reported(weight)
+            self.empty_sensor.update(policy.empty)
             self.unstable_sensor.update(False)
         else:
             self.unstable_sensor.update(True)
-
-
-async def init_network() -> None:
+            if heartbeat:
+                policy.reported()
+
+    def set_empty_threshold(self, grams: float):
+        '''Changes (and saves) the weight that the bowl is empty below, and reports whether it's empty now.'''
+        if grams < 0:
+            raise ValueError("The empty threshold can't be negative")
+        self.policy.set_empty_threshold(grams)
+        settings.store.set_int(settings.EMPTY_THRESHOLD, round(grams * 10))
+        settings.store.flush()
+        self.policy.request()
+
+    def record_feeding_event(self, kind: str, start: int, end: int, decigrams: int):
+        print("[feeding] {} from {} to {}: {}g".format(kind, start, end, decigrams / 10))
+        events = self.feeding_events
+        if len(events) >= self.FEEDING_QUEUE:
+            events.pop(0)
+        events.append([kind, start, end, decigrams / 10])
+        if kind == MEAL or kind == DAY:
+            feeding = self.feeding
+            self.eaten_today_sensor.update(feeding.today / 10)
+            settings.store.set(
+                settings.EATEN_TODAY, struct.pack("<ii", -1 if feeding.day is None else feeding.day, feeding.today)
+            )
+            settings.store.flush()
+        self.feeding_ready.set()
+
+    async def send_feeding_events(self):
+        '''
+        Sends the feeding events as they happen.  Each batch is a single event whose data holds the device's current
+        time and a list of [kind, start, end, grams] (see feeding.py), so while Home Assistant can't be reached they
+        pile up and go out together once it can.  Also ends the day's consumption total at midnight.
+        '''
+        events = self.feeding_events
+        while True:
+            self.feeding.check_day()
+            if not events or not publisher.online:
+                self.feeding_ready.clear()
+                try:
+                    await asyncio.wait_for(self.feeding_ready.wait(), self.FEEDING_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            print(f"Sending {len(events)} feeding events... ", end="")
+            data = {"now": int(time.time()), "events": events}
+            try:
+                accepted = await transport.fire_event(self.FEEDING_EVENT, data)
+            except Exception as e:
+                print(f"Failed: {e}")
+                accepted = False
+
+            if not accepted:
+                await asyncio.sleep(self.REPLAY_INTERVAL)
+                continue
+
+            events.clear()
+            print("Done!")
+
+    def pending_history(self, offset: int) -> tuple[list, int]:
+        '''
+        The complete hours of the history that haven't been uploaded yet (up to HISTORY_BATCH of them) as statistics for
+        import_statistics(), and Home Assistant's time that they go up to.  offset is the transport's clock_offset.
+        '''
+        history = self.history
+        # Only hours that ended before the bucket being filled started are complete.
+        end = ((history.newest or 0) * history.period + offset) // 3600 * 3600
+        start = self.history_uploaded
+        if start is None:
+            oldest = history.oldest()
+            start = end if oldest is None else (oldest + offset) // 3600 * 3600
+        start = max(start, end - self.HISTORY_BATCH * 3600)
+
+        stats = []
+        for hour in range(start, end, 3600):
+            summary = history.hour(hour, offset)
+            if summary is not None:
+                t = time.localtime(hour)
+                stats.append({
+                    "start": "{:04}-{:02}-{:02}T{:02}:00:00+00:00".format(t[0], t[1], t[2], t[3]),
+                    "mean": summary[2] / 10,
+                    "min": summary[0] / 10,
+                    "max": summary[1] / 10,
+                })
+        return stats, end
+
+    async def upload_history(self):
+        '''
+        Uploads the complete hours of the history to Home Assistant's long-term statistics, as one request every
+        HISTORY_INTERVAL seconds rather than a state for every reading.  The hours are by Home Assistant's clock, so
+        nothing is uploaded until the offset to it is known (from a response to some other request).
+        '''
+        while True:
+            await asyncio.sleep(self.HISTORY_INTERVAL)
+            offset = transport.clock_offset
+            if offset is None or not publisher.online:
+                continue
+            stats, end = self.pending_history(offset)
+            if not stats:
+                self.history_uploaded = end
+                continue
+
+            print(f"Uploading {len(stats)} hours of history... ", end="")
+            try:
+                accepted = await transport.import_statistics(self.HISTORY_STATISTIC, stats)
+            except Exception as e:
+                print(f"Failed: {e}")
+                continue
+            # Rejected hours won't be accepted next time either.
+            self.history_uploaded = end
+            if accepted:
+                print("Done!")
+
+    async def replay_offline_log(self):
+        '''
+        Uploads the readings that were logged while Home Assistant was unreachable once it's reachable again.  Each
+        batch is a single event whose data holds the device's current time and a list of [timestamp, grams, flags].
+        '''
+        log = self.offline_log
+        while True:
+            if not publisher.online or log.pending == 0:
+                await asyncio.sleep(self.REPLAY_INTERVAL)
+                continue
+
+            records = log.unsent(self.REPLAY_BATCH)
+            if not records:
+                # Whatever was there didn't pass its CRC.  Skip past it.
+                log.mark_sent(log.unsent_from + self.REPLAY_BATCH - 1)
+                continue
+
+            print(f"Replaying {len(records)} of {log.pending} logged readings... ", end="")
+            data = {"now": int(time.time()), "readings": [[r[1], r[2], r[3]] for r in records]}
+            try:
+                accepted = await transport.fire_event(self.REPLAY_EVENT, data)
+            except Exception as e:
+                print(f"Failed: {e}")
+                await asyncio.sleep(self.REPLAY_INTERVAL)
+                continue
+
+            if not accepted:
+                await asyncio.sleep(self.REPLAY_INTERVAL)
+                continue
+
+            log.mark_sent(records[-1][0])
+            print("Done!")
+            await asyncio.sleep(0)
+
+
+async def init_network() -> bool:
     wifi.radio.hostname = "CinnaScale"
 
     if wifi.radio.connected:
         print("Already connected to WiFi {} (RSSI: {})".format(wifi.radio.ap_info.ssid, wifi.radio.ap_info.rssi))
     else:
         # network_strength_test()
-        connected = connect_to_network()
+        connected = await connect_to_network()
         # connected = False
 
         if not connected:
             await init_config_portal()
             # init_mdns()
 
-    global pool, requests
+    global pool, transport
+
+    # Any connection that the old transport had open went down with the network.
+    if transport is not None:
+        transport.close()
 
     pool = socketpool.SocketPool(wifi.radio)
-    requests = adafruit_requests.Session(pool, ssl.create_default_context())
+    ssl_context = ssl.create_default_context()
+    if TRANSPORT == "mqtt":
+        transport = MqttTransport(
+            pool,
+            ssl_context,
+            secrets["mqtt_broker"],
+            secrets.get("mqtt_port", 1883),
+            secrets.get("mqtt_username"),
+            secrets.get("mqtt_password"),
+            secrets.get("mqtt_ssl", False),
+        )
+    elif TRANSPORT == "websocket":
+        transport = WebSocketTransport(
+            HomeAssistantClient(pool, HASS_URL, secrets["token"], ssl_context),
+            HomeAssistantWebSocket(pool, HASS_URL, secrets["token"], ssl_context),
+            COMMAND_EVENT,
+        )
+    else:
+        transport = RestTransport(HomeAssistantClient(pool, HASS_URL, secrets["token"], ssl_context))
+
+    return wifi.radio.connected
+
 
+async def maintain_transport():
+    """Gives the transport a regular chance to keep its connection alive."""
+    while True:
+        await asyncio.sleep(TRANSPORT_POLL_INTERVAL)
+        try:
+            await transport.poll()
+        except Exception as e:
+            print(f"Transport connection lost: {e}")
+
+
+async def reconnect_network() -> bool:
+    '''
+    How the publisher gets back to Home Assistant after it has been unreachable several times in a row.  If WiFi is
+    still up then the saved address may be what's wrong (the network was renumbered), so it's dropped and the next
+    connection gets one from DHCP.  If it's down, the WiFi manager is already reconnecting and this waits for it.
+    '''
+    if wifi.radio.connected:
+        print("Still connected to WiFi, renewing the address... ")
+        wifi_manager.forget_address()
+    await wifi_manager.connect()
+    return await init_network()
 
-def connect_to_network() -> bool:
-    MAX_RETRIES = 10
-    retry_count = 0
 
+async def receive_commands() -> list:
+    '''The commands that Home Assistant has sent since the last call, over whichever transport is current.'''
+    return await transport.receive()
+
+
+publisher = Publisher(reconnect=reconnect_network)
+# Only the WebSocket transport can be sent commands.
+commands = Commands(receive_commands if TRANSPORT == "websocket" else None)
+wifi_manager = WiFiManager(wifi.radio, secrets["ssid"], secrets["password"])
+# Anything that failed while the link was down is worth retrying straight away.
+wifi_manager.on_connect.append(publisher.retry_now)
+
+
+async def connect_to_network() -> bool:
     # old_mac = ['0xf4', '0x12', '0xfa', '0x8d', '0x9e', '0xdc']
     new_mac = "f4:12:fa:8d:e9:cc"
     wifi.radio.mac_address = binascii.unhexlify(new_mac.replace(":", ""))
 
     print("My MAC addr:", [hex(i) for i in wifi.radio.mac_address])
 
-    ssid = secrets["ssid"]
-
-    while retry_count < MAX_RETRIES:
-        try:
-            # show_available_networks()
-            # print("Connecting to %s... " % secrets["ssid"], end="")
-
-            show_network_strength(ssid)
-            wifi.radio.connect(ssid, secrets["password"])
-            print("Connected with ip {}!".format(wifi.radio.ipv4_address))
-            return True
-        except Exception as e:
-            print("Failed: {}".format(e))
-            retry_count += 1
+    if await wifi_manager.connect(CONNECT_ATTEMPTS):
+        return True
 
-    print("Failed to connect to WiFi after {} retries".format(retry_count))
+    print("Failed to connect to WiFi after {} attempts".format(CONNECT_ATTEMPTS))
     return False
 
 
@@ -218,7 +512,7 @@ def show_available_networks():
             continue
         print(
             "\t%s\t\tRSSI: %d\tChannel: %d"
-            % (str(network.ssid, "utf-8"), network.rssi, network.channel)
+            % (network.ssid, network.rssi, network.channel)
         )
     wifi.radio.stop_scanning_networks()
 
@@ -228,7 +522,7 @@ def show_network_strength(ssid: str):
         if network.ssid == ssid:
             print(
                 "Connecting to %s (RSSI: %d, Channel: %d)... "
-                % (str(network.ssid, "utf-8"), network.rssi, network.channel),
+                % (network.ssid, network.rssi, network.channel),
                 end="",
             )
             break
@@ -0,0 +1,124 @@
+import struct
+
+# Record flags
+FLAG_UNSTABLE = 0x01
+FLAG_EMPTY = 0x02
+FLAG_SENT = 0x80  # Set once the record has been uploaded.  Not covered by the CRC.
+
+_RECORD = "<IIiBB"  # sequence, timestamp, decigrams, flags, crc8
+RECORD_SIZE = struct.calcsize(_RECORD)
+_FLAGS_OFFSET = 12
+
+
+def crc8(data, length: int = None) -> int:
+    '''CRC-8 (polynomial 0x07) of the first length bytes of data.'''
+    crc = 0
+    for i in range(len(data) if length is None else length):
+        crc ^= data[i]
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+class OfflineLog:
+    '''
+    Store-and-forward log of weight readings in a region of NVM, used while Home Assistant can't be reached.
+
+    Records are appended round-robin through the region, so every slot is written the same number of times and the log
+    never grows past its region; once it's full the oldest records are overwritten.  Each record carries a sequence
+    number and a CRC so the head and tail can be found again after a restart (slots that fail their CRC, like erased
+    flash, are treated as empty).  Uploaded records are marked as sent by setting a bit in their flags byte.  Every write
+    to NVM erases and rewrites flash, so a batch of records is marked with one write (two if it wraps around the end of
+    the region) rather than one for each.
+    '''
+
+    def __init__(self, nvm, start: int, size: int):
+        self.nvm = nvm
+        self.start = start
+        self.capacity = min(size, len(nvm) - start) // RECORD_SIZE
+        if self.capacity < 2:
+            raise ValueError("Offline log region is too small")
+        self.buffer = bytearray(RECORD_SIZE)
+        self.next_sequence = 1
+        self.next_slot = 0
+        self.unsent_from = 1  # Sequence number of the oldest record that hasn't been sent
+        self.overwritten = 0  # Unsent records lost because the log was full
+        self._scan()
+
+    @property
+    def pending(self) -> int:
+        return self.next_sequence - self.unsent_from
+
+    def append(self, timestamp: int, grams: float, flags: int = 0):
+        sequence = self.next_sequence
+        struct.pack_into(_RECORD, self.buffer, 0, sequence, timestamp, int(round(grams * 10)), flags & ~FLAG_SENT, 0)
+        self.buffer[RECORD_SIZE - 1] = crc8(self.buffer, RECORD_SIZE - 1)
+        self.nvm[self._offset(self.next_slot):self._offset(self.next_slot) + RECORD_SIZE] = self.buffer
+
+        self.next_sequence += 1
+        self.next_slot = (self.next_slot + 1) % self.capacity
+        if self.pending > self.capacity:
+            self.overwritten += self.pending - self.capacity
+            self.unsent_from = self.next_sequence - self.capacity
+
+    def unsent(self, limit: int) -> list:
+        '''The oldest (up to limit) unsent records as (sequence, timestamp, grams, flags) tuples.'''
+        records = []
+        for sequence in range(self.unsent_from, min(self.next_sequence, self.unsent_from + limit)):
+            record = self._read(self._slot(sequence))
+            if record is not None and record[0] == sequence:
+                records.append(record)
+        return records
+
+    def mark_sent(self, sequence: int):
+        '''Marks every record up to and including sequence as sent.'''
+        end = min(sequence + 1, self.next_sequence)
+        first = self.unsent_from
+        while first < end:
+            # The records in consecutive slots, up to the end of the region.
+            slot = self._slot(first)
+            count = min(end - first, self.capacity - slot)
+            offset = self._offset(slot)
+            data = self.nvm[offset:offset + count * RECORD_SIZE]
+            for i in range(_FLAGS_OFFSET, len(data), RECORD_SIZE):
+                data[i] |= FLAG_SENT
+            self.nvm[offset:offset + len(data)] = data
+            first += count
+        self.unsent_from = max(self.unsent_from, end)
+
+    def _offset(self, slot: int) -> int:
+        return self.start + slot * RECORD_SIZE
+
+    def _slot(self, sequence: int) -> int:
+        # The newest record (next_sequence - 1) is in the slot before next_slot.
+        return (self.next_slot - (self.next_sequence - sequence)) % self.capacity
+
+    def _read(self, slot: int):
+        offset = self._offset(slot)
+        data = self.nvm[offset:offset + RECORD_SIZE]
+        sequence, timestamp, decigrams, flags, crc = struct.unpack(_RECORD, data)
+        # The CRC is calculated with the sent flag clear.
+        self.buffer[:] = data
+        self.buffer[_FLAGS_OFFSET] &= ~FLAG_SENT
+        if sequence == 0 or crc != crc8(self.buffer, RECORD_SIZE - 1):
+            return None
+        return sequence, timestamp, decigrams / 10, flags
+
+    def _scan(self):
+        newest = None
+        oldest_unsent = None
+        for slot in range(self.capacity):
+            record = self._read(slot)
+            if record is None:
+                continue
+            sequence, _, _, flags = record
+            if newest is None or sequence > newest[0]:
+                newest = (sequence, slot)
+            if not flags & FLAG_SENT and (oldest_unsent is None or sequence < oldest_unsent):
+                oldest_unsent = sequence
+
+        if newest is None:
+            return
+        self.next_sequence = newest[0] + 1
+        self.next_slot = (newest[1] + 1) % self.capacity
+        self.unsent_from = self.next_sequence if oldest_unsent is None else oldest_unsent
@@ -0,0 +1,141 @@
+import alarm
+import struct
+import time
+
+from offline_log import crc8
+
+_MAGIC = b"CZ"
+_VERSION = 1
+# magic, version, number of samples, cycles, milliseconds awake, seconds asleep, time.time() when it went to sleep,
+# followed by the samples and a crc8
+_HEADER = "<2sBBIIIi"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+MAX_SAMPLES = 32
+
+
+class SleepState:
+    '''
+    What's kept in alarm.sleep_memory while the board is in deep sleep (which restarts the program): the latest samples,
+    so sampling picks up where it left off, and the running totals behind the duty cycle estimate.  Sleep memory is lost
+    when the power is, so it's only trusted if its CRC matches.
+    '''
+
+    def __init__(self, memory: bytearray = None):
+        self.memory = memory if memory is not None else alarm.sleep_memory
+        self.cycles = 0
+        self.awake_ms = 0  # Total time spent awake
+        self.asleep = 0  # Total time spent asleep, in seconds
+        self.slept_at = None  # time.time() when it last went into deep sleep
+        self.samples = ()
+        self.load()
+
+    def load(self) -> bool:
+        magic, version, count, cycles, awake_ms, asleep, slept_at = struct.unpack(
+            _HEADER, self.memory[0:_HEADER_SIZE]
+        )
+        if magic != _MAGIC or version != _VERSION or count > MAX_SAMPLES:
+            return False
+        end = _HEADER_SIZE + 4 * count
+        data = self.memory[0:end + 1]
+        if crc8(data, end) != data[end]:
+            return False
+        self.cycles = cycles
+        self.awake_ms = awake_ms
+        self.asleep = asleep
+        self.slept_at = None if slept_at < 0 else slept_at
+        self.samples = struct.unpack_from("<{}i".format(count), data, _HEADER_SIZE)
+        return True
+
+    def save(self, samples):
+        '''Saves the totals along with (up to MAX_SAMPLES of the latest) samples.'''
+        count = min(len(samples), MAX_SAMPLES)
+        self.samples = samples[len(samples) - count:]
+        end = _HEADER_SIZE + 4 * count
+        data = bytearray(end + 1)
+        struct.pack_into(
+            _HEADER, data, 0, _MAGIC, _VERSION, count, self.cycles, self.awake_ms, self.asleep,
+            -1 if self.slept_at is None else self.slept_at
+        )
+        struct.pack_into("<{}i".format(count), data, _HEADER_SIZE, *self.samples)
+        data[end] = crc8(data, end)
+        self.memory[0:len(data)] = data
+
+
+class PowerManager:
+    '''
+    Duty cycles the board for running on battery: it wakes up, reports and goes back to sleep until it's time for the
+    next report or a button is pressed.
+
+    Sleeps of at least DEEP_SLEEP_MIN seconds are deep sleeps, which use the least power but restart the program when
+    they end, so the state that should survive goes into sleep memory (see SleepState).  Shorter ones are light sleeps,
+    which pause the program instead.  The scale's buttons aren't on pins that can wake the ESP32-S3 from deep sleep, so
+    deep_sleep_pins (the boot button) are the only ones that wake it from there.
+
+    Every cycle's wake to report latency and duty cycle (the fraction of the cycle spent awake) are printed, and the
+    totals are kept so the long run duty cycle is too.
+    '''
+
+    DEEP_SLEEP_MIN = 60  # seconds
+
+    def __init__(self, woke_at: float, light_sleep_pins: list, deep_sleep_pins: list):
+        self.state = SleepState()
+        self.light_sleep_pins = light_sleep_pins
+        self.deep_sleep_pins = deep_sleep_pins
+        self.wake_alarm = alarm.wake_alarm
+        self.woke_at = woke_at  # time.monotonic()
+        self.reported_at = None
+        self.slept = None  # How long the last sleep took, in seconds
+        if self.wake_alarm is None:
+            # Powered up or reset rather than woken, so the samples are from who knows when.
+            self.state.samples = ()
+        elif self.state.slept_at is not None:
+            # The RTC keeps running in deep sleep.
+            self.slept = max(0, int(time.time()) - self.state.slept_at)
+            self.state.asleep += self.slept
+        self.state.slept_at = None
+
+    @property
+    def woken_by_button(self) -> bool:
+        return isinstance(self.wake_alarm, alarm.pin.PinAlarm)
+
+    def reported(self):
+        '''Notes that this cycle's report has been sent.'''
+        if self.reported_at is None:
+            self.reported_at = time.monotonic()
+
+    def sleep(self, seconds: float, samples) -> bool:
+        '''
+        Sleeps for seconds or until a button is pressed.  A deep sleep never returns, while a light sleep returns
+        whether a button woke it.  The radio, ADC, LED and buttons must already have been powered down or released.
+        '''
+        state = self.state
+        now = time.monotonic()
+        awake = now - self.woke_at
+        state.cycles += 1
+        state.awake_ms += int(awake * 1000)
+        self._report_cycle(awake)
+
+        time_alarm = alarm.time.TimeAlarm(monotonic_time=now + seconds)
+        if seconds >= self.DEEP_SLEEP_MIN:
+            state.slept_at = int(time.time())
+            state.save(samples)
+            pin_alarms = [alarm.pin.PinAlarm(pin, value=False, pull=True) for pin in self.deep_sleep_pins]
+            alarm.exit_and_deep_sleep_until_alarms(time_alarm, *pin_alarms)
+
+        pin_alarms = [alarm.pin.PinAlarm(pin, value=False, pull=True) for pin in self.light_sleep_pins]
+        self.wake_alarm = alarm.light_sleep_until_alarms(time_alarm, *pin_alarms)
+        self.woke_at = time.monotonic()
+        self.slept = self.woke_at - now
+        state.asleep += int(self.slept)
+        self.reported_at = None
+        return self.woken_by_button
+
+    def _report_cycle(self, awake: float):
+        state = self.state
+        latency = "-" if self.reported_at is None else "{:.2f}s".format(self.reported_at - self.woke_at)
+        cycle = awake if self.slept is None else awake + self.slept
+        total = state.awake_ms / 1000 + state.asleep
+        print("Cycle {}: wake to report {}, awake {:.2f}s, duty cycle {:.2f}% ({:.2f}% overall)".format(
+            state.cycles, latency, awake, 100 * awake / cycle if cycle else 100,
+            100 * state.awake_ms / 1000 / total if total else 100
+        ))
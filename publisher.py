@@ -0,0 +1,132 @@
+import asyncio
+import traceback
+
+EHOSTUNREACH = 118
+
+
+class Publisher:
+    '''
+    Sends sensor updates from a dedicated coroutine so that nothing on the measurement path ever waits on the network.
+
+    Updates are queued with submit(), which never blocks.  If an update for a sensor is already waiting then it is
+    replaced, so only the latest state of each sensor is ever sent.  The queue holds at most max_pending sensors; when
+    it's full the oldest update is dropped.  Failed updates stay queued (unless a newer value replaces them) and are
+    retried with exponential backoff.  If the host is unreachable several times in a row then reconnect is awaited
+    before trying again.
+
+    Anything submitted must have a sensor_name and a post(value) coroutine which returns whether the update was accepted
+    and raises if it failed in a way that's worth retrying.  It shouldn't block, so that the sampler keeps running while
+    it's awaited.
+    '''
+
+    MIN_BACKOFF = 1  # seconds
+    MAX_BACKOFF = 60  # seconds
+    RECONNECT_AFTER = 3  # consecutive EHOSTUNREACH failures
+
+    def __init__(self, reconnect=None, max_pending: int = 8):
+        self.reconnect = reconnect
+        self.max_pending = max_pending
+        self.pending = {}  # sensor_name -> (sensor, value)
+        self.order = []  # sensor_names, oldest first
+        self.ready = asyncio.Event()
+        self.retry = asyncio.Event()
+        self.backoff = 0
+        self.unreachable = 0
+        # False from the first failed update until the next successful one.
+        self.online = True
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def is_pending(self, sensor) -> bool:
+        return sensor.sensor_name in self.pending
+
+    async def wait_idle(self, timeout: float) -> bool:
+        '''Waits (up to timeout seconds) for everything queued to be sent.  Returns whether it was.'''
+        waited = 0
+        while self.order and waited < timeout:
+            await asyncio.sleep(0.05)
+            waited += 0.05
+        return not self.order
+
+    def retry_now(self):
+        '''Cuts the current backoff short, for when whatever was failing (like the WiFi connection) has been fixed.'''
+        self.backoff = 0
+        self.unreachable = 0
+        self.retry.set()
+
+    def submit(self, sensor, value) -> bool:
+        '''Queues an update.  Returns False if an older update had to be dropped to make room.'''
+        name = sensor.sensor_name
+        accepted = True
+        if name in self.pending:
+            self.coalesced += 1
+        else:
+            if len(self.order) >= self.max_pending:
+                oldest = self.order.pop(0)
+                del self.pending[oldest]
+                self.dropped += 1
+                accepted = False
+                print(f"[{oldest}] Update dropped, publish queue is full")
+            self.order.append(name)
+        self.pending[name] = (sensor, value)
+        self.ready.set()
+        return accepted
+
+    async def run(self):
+        while True:
+            if not self.order:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+
+            if self.backoff:
+                self.retry.clear()
+                try:
+                    await asyncio.wait_for(self.retry.wait(), self.backoff)
+                except asyncio.TimeoutError:
+                    pass
+                if not self.order:
+                    continue
+
+            name = self.order[0]
+            sensor, value = self.pending[name]
+
+            try:
+                accepted = await sensor.post(value)
+            except Exception as e:
+                print(f"[{name}] Update failed: {e}")
+                if not isinstance(e, (OSError, RuntimeError)):
+                    traceback.print_exception(e)
+                await self._failed(e)
+                continue
+
+            # A newer value may have been submitted while we were posting.  If so leave it queued.
+            if self.pending[name][1] == value:
+                self._remove(name)
+
+            if not accepted:
+                print(f"[{name}] Update rejected, dropping it")
+
+            self.sent += 1
+            self.backoff = 0
+            self.unreachable = 0
+            self.online = True
+            # Give everything else a chance to run between requests.
+            await asyncio.sleep(0)
+
+    async def _failed(self, error: Exception):
+        self.online = False
+        self.backoff = min(self.MAX_BACKOFF, max(self.MIN_BACKOFF, self.backoff * 2))
+
+        cause = getattr(error, "__cause__", None) or error
+        if isinstance(cause, OSError) and cause.errno == EHOSTUNREACH:
+            self.unreachable += 1
+            if self.reconnect is not None and self.unreachable >= self.RECONNECT_AFTER:
+                print("Host unreachable.  Restarting network...")
+                self.unreachable = 0
+                await self.reconnect()
+
+    def _remove(self, name: str):
+        del self.pending[name]
+        self.order.remove(name)
@@ -0,0 +1,77 @@
+import asyncio
+from adafruit_ticks import ticks_ms, ticks_diff
+
+from sampler import Sampler
+
+
+class RateController:
+    '''
+    Idles the ADC at a slow, quiet conversion rate and switches to a fast one while the weight is changing (the bowl is
+    being filled or the cat is eating) so that settling is detected in a fraction of the time.  Once the weight has been
+    steady for hold seconds it drops back to the idle rate.
+
+    The threshold is the change (in raw counts) from the slowly moving baseline that counts as the weight changing.  It
+    needs to be comfortably above the noise at the fast rate or the controller will never drop back down.
+    '''
+
+    def __init__(
+        self, sampler: Sampler, threshold: int, idle_rate: int = 10, fast_rate: int = 80, hold: float = 5.0
+    ):
+        self.sampler = sampler
+        self.threshold = threshold
+        self.idle_rate = idle_rate
+        self.fast_rate = fast_rate
+        self.hold = hold
+        self.rate = sampler.scale.conversion_rate
+        self.baseline = None
+        self.last_change = ticks_ms()
+        self.changed = asyncio.Event()
+
+    def on_sample(self, value: int):
+        if self.baseline is None:
+            self.baseline = value
+            return
+
+        if abs(value - self.baseline) > self.threshold:
+            self.last_change = ticks_ms()
+            if self.rate != self.fast_rate:
+                self.changed.set()
+
+        # Exponential moving average (1/8 weight) in integer math.
+        self.baseline += (value - self.baseline) >> 3
+
+    def set_idle_rate(self, rate: int):
+        '''Changes the idle rate (which must be below the fast rate), switching to it now if the weight is steady.'''
+        if rate == self.idle_rate:
+            return
+        self.idle_rate = rate
+        # At the fast rate it drops back to the new idle rate in its own time.
+        if self.rate != self.fast_rate and self.rate != rate:
+            # Wakes up run(), which sees that it isn't at the idle rate any more.
+            self.changed.set()
+
+    async def run(self):
+        await self.set_rate(self.idle_rate)
+
+        while True:
+            if self.rate == self.fast_rate:
+                remaining = self.hold - ticks_diff(ticks_ms(), self.last_change) / 1000
+                if remaining <= 0:
+                    await self.set_rate(self.idle_rate)
+                    continue
+                await asyncio.sleep(remaining)
+            elif self.rate != self.idle_rate:
+                await self.set_rate(self.idle_rate)
+            else:
+                await self.changed.wait()
+                self.changed.clear()
+                if self.rate == self.idle_rate:
+                    await self.set_rate(self.fast_rate)
+
+    async def set_rate(self, rate: int):
+        if rate == self.rate:
+            return
+        print("Switching conversion rate from {} to {} SPS".format(self.rate, rate))
+        if not await self.sampler.reconfigure(rate=rate):
+            raise RuntimeError("Unable to calibrate NAU7802 at {} SPS".format(rate))
+        self.rate = rate
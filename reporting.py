@@ -0,0 +1,106 @@
+import asyncio
+from adafruit_ticks import ticks_ms, ticks_diff
+
+
+class ReportPolicy:
+    '''
+    Decides when the weight is worth checking and reporting, so that a bowl that isn't being touched costs next to no
+    network traffic while a change still reaches Home Assistant within seconds.
+
+    The samples are watched as they come in (see watch()): once their moving average has moved more than deadband grams
+    from the last weight that was checked, or across the empty threshold, wake is set so the weight is read and checked
+    straight away.  Checks triggered that way are at least min_interval seconds apart.  A checked weight is only
+    reported if it's more than deadband grams from the last one that was, or if nothing has been reported for
+    max_interval seconds (a heartbeat, which is forced through so Home Assistant can tell the scale is still there).
+
+    The bowl is empty below empty_threshold grams and only stops being empty once it's empty_hysteresis grams above it,
+    so a weight that sits right at the threshold doesn't flap.
+
+    Weights are kept in whole decigrams so that watching the samples doesn't allocate floats.
+    '''
+
+    def __init__(
+        self, deadband: float, empty_threshold: float, empty_hysteresis: float, min_interval: float = 5,
+        max_interval: float = 900
+    ):
+        self.deadband = round(deadband * 10)
+        self.empty_below = round(empty_threshold * 10)
+        self.empty_above = round((empty_threshold + empty_hysteresis) * 10)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.convert = None  # Turns a raw sample into decigrams
+        self.baseline = None  # Moving average of the raw samples
+        self.checked = None  # The last weight that was checked (in decigrams)
+        self.checked_at = ticks_ms()
+        self.weight = None  # The last weight that was reported (in decigrams)
+        self.reported_at = None  # ticks_ms() of the last report, None until there's been one
+        self.empty = False
+        self.requested = False
+        # Set when the weight should be checked right away.
+        self.wake = asyncio.Event()
+
+    def watch(self, sampler, convert):
+        '''Starts watching the sampler's samples for changes.  convert turns a raw sample into decigrams.'''
+        self.convert = convert
+        sampler.listeners.append(self.on_sample)
+
+    def on_sample(self, value: int):
+        if self.baseline is None:
+            self.baseline = value
+        else:
+            # Exponential moving average (1/8 weight) in integer math.
+            self.baseline += (value - self.baseline) >> 3
+
+        if self.checked is None or self.wake.is_set():
+            return
+        if ticks_diff(ticks_ms(), self.checked_at) < self.min_interval * 1000:
+            return
+        decigrams = self.convert(self.baseline)
+        if abs(decigrams - self.checked) > self.deadband or self._is_empty(decigrams) != self.empty:
+            self.wake.set()
+
+    def set_empty_threshold(self, empty_threshold: float):
+        '''Changes the weight (in grams) that the bowl is empty below, keeping the hysteresis.'''
+        hysteresis = self.empty_above - self.empty_below
+        self.empty_below = round(empty_threshold * 10)
+        self.empty_above = self.empty_below + hysteresis
+
+    def request(self):
+        '''Has the weight checked and reported right away, whether or not it changed.'''
+        self.requested = True
+        self.wake.set()
+
+    def heartbeat_due(self) -> bool:
+        '''Whether the next report should be forced through, as a heartbeat or because one was requested.'''
+        if self.requested or self.reported_at is None:
+            return True
+        return ticks_diff(ticks_ms(), self.reported_at) >= self.max_interval * 1000
+
+    def check(self, weight: float) -> bool:
+        '''
+        Notes that the weight has been checked (None if it couldn't be read) and returns whether it's far enough from
+        the last weight reported to be worth reporting.
+        '''
+        self.checked_at = ticks_ms()
+        if weight is None:
+            return False
+        self.checked = round(weight * 10)
+        self.empty = self._is_empty(self.checked)
+        return self.weight is None or abs(self.checked - self.weight) > self.deadband
+
+    def reported(self, weight: float = None):
+        '''Notes that a report went out, with the weight if it included one.'''
+        self.reported_at = ticks_ms()
+        self.requested = False
+        if weight is not None:
+            self.weight = round(weight * 10)
+
+    def next_check(self, success: bool) -> float:
+        '''How long (in seconds) until the weight needs checking again if nothing changes.'''
+        if not success or self.reported_at is None:
+            return self.min_interval
+        remaining = self.max_interval - ticks_diff(ticks_ms(), self.reported_at) / 1000
+        return max(self.min_interval, remaining)
+
+    def _is_empty(self, decigrams: int) -> bool:
+        return decigrams < (self.empty_above if self.empty else self.empty_below)
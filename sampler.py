@@ -0,0 +1,121 @@
+import asyncio
+from array import array
+
+from cedargrove_nau7802_async import NAU7802
+
+
+class Sampler:
+    '''
+    Continuously reads conversions from the NAU7802 at whatever conversion rate it is configured for and stores them in
+    a fixed size ring buffer.  Readers never touch the ADC, they just look at the most recent samples, so nothing has to
+    wait for a fresh burst of conversions.
+    '''
+
+    def __init__(self, scale: NAU7802, size: int = 64):
+        self.scale = scale
+        self.size = size
+        self.values = array("i", [0] * size)
+        # Total number of samples recorded.  The newest sample is at index (count - 1) % size.
+        self.count = 0
+        # Pulsed every time a new sample is recorded.
+        self.new_sample = asyncio.Event()
+        # Callables invoked with every new raw value.
+        self.listeners = []
+        # Set while the ADC is being reconfigured, and pulsed once it's done.
+        self.paused = False
+        self.resumed = asyncio.Event()
+
+    async def run(self):
+        while True:
+            if self.paused:
+                await self.resumed.wait()
+                continue
+            # Sleeps until the conversion is due rather than polling the ADC.
+            value = await self.scale.read_next()
+            if self.paused:
+                # Read while the ADC was being reconfigured, so it may be from the old settings.
+                continue
+            self.record(value)
+
+    async def reconfigure(self, rate: int = None, gain: int = None) -> bool:
+        '''
+        Changes the ADC's conversion rate and/or gain.  Sampling is paused while the ADC recalibrates.  Note that changing
+        the gain changes the scale of the raw values (and so the tare and grams conversion).
+        '''
+        self.paused = True
+        try:
+            return await self.scale.set_conversion(rate, gain)
+        finally:
+            self.paused = False
+            self.resumed.set()
+            self.resumed.clear()
+
+    def restore(self, values):
+        '''
+        Records samples saved from before a sleep, oldest first, as if they had just been read, so that the buffer and
+        the listeners pick up where they left off.  They're stale until a new sample agrees with them.
+        '''
+        for value in values:
+            self.record(value)
+
+    def record(self, value: int):
+        self.values[self.count % self.size] = value
+        self.count += 1
+
+        for listener in self.listeners:
+            listener(value)
+
+        # Wake anything waiting for a sample.  Waiters that were already woken stay woken after the clear.
+        self.new_sample.set()
+        self.new_sample.clear()
+
+    @property
+    def available(self) -> int:
+        '''The number of samples currently held in the buffer.'''
+        return min(self.count, self.size)
+
+    def sample(self, number: int) -> int:
+        '''The value of the given sample number (counting from the first sample ever recorded) if it's still buffered.'''
+        if number >= self.count or number < self.count - self.size:
+            raise IndexError("Sample {} is not in the buffer".format(number))
+        return self.values[number % self.size]
+
+    def latest(self, n: int, out: array = None) -> array:
+        '''
+        Returns the latest n samples, oldest first.  If out is provided the values are copied into it instead of
+        allocating a new array.
+        '''
+        n = self._check(n)
+        if out is None:
+            out = array("i", [0] * n)
+        start = self.count - n
+        for i in range(n):
+            out[i] = self.values[(start + i) % self.size]
+        return out
+
+    def mean(self, n: int) -> int:
+        '''The average of the latest n samples.'''
+        n = self._check(n)
+        total = 0
+        for i in range(self.count - n, self.count):
+            total += self.values[i % self.size]
+        return total // n
+
+    async def wait_for(self, n: int):
+        '''Waits until at least n samples are in the buffer.  Returns immediately if they already are.'''
+        self._check(n, allow_empty=True)
+        while self.count < n:
+            await self.new_sample.wait()
+
+    async def wait_for_new(self, n: int = 1):
+        '''Waits until n more samples have been recorded.'''
+        target = self.count + n
+        while self.count < target:
+            await self.new_sample.wait()
+
+    def _check(self, n: int, allow_empty: bool = False) -> int:
+        if n > self.size:
+            raise ValueError("Requested {} samples but the buffer only holds {}".format(n, self.size))
+        if not allow_empty and n > self.count:
+            raise ValueError("Requested {} samples but only {} have been recorded".format(n, self.count))
+        return n
@@ -1,118 +1,252 @@
+import asyncio
 import board
-import microcontroller
-import struct
+from array import array
+from adafruit_ticks import ticks_ms, ticks_diff
 
+from calibration import Calibration
 from cedargrove_nau7802_async import NAU7802
-
+from rate_control import RateController
+from sampler import Sampler
+import settings
+from shared_i2c import SharedI2C
+from stats import SettleDetector
+
+# Number of samples averaged together when taring the scale.
+TARE_SAMPLES = 20
+# Defaults for read_settled_weight(): the most samples in the estimate, the tolerance (in grams) that the weight must
+# be known to, and how long (in seconds) to wait for it to settle.
+SETTLE_SAMPLES = 20
+SETTLE_TOLERANCE = 0.5
+SETTLE_TIMEOUT = 5
+# Conversion rates (samples per second) used while the weight is steady and while it's changing, the change in grams
+# that switches to the fast rate and how long (in seconds) the weight must be steady before switching back.
+IDLE_RATE = 10
+FAST_RATE = 80
+# The rates that the idle rate can be changed to with set_idle_rate() (the NAU7802's rates below FAST_RATE).
+IDLE_RATES = (10, 20, 40)
+FAST_RATE_THRESHOLD = 3.0
+FAST_RATE_HOLD = 5.0
+# The pin that the NAU7802's DRDY output is wired to (e.g. board.A0), or None to check for conversions over I2C.
+DRDY_PIN = None
+# Whether init_scale() can skip resetting and calibrating an ADC that's still set up from before a reload.
+WARM_START = True
+# Number of samples averaged together for a calibration point.
+CALIBRATION_SAMPLES = 40
+# Number of the latest samples that are kept while the scale is powered down.
+SLEEP_SAMPLES = SETTLE_SAMPLES
+
+# The calibration used until the scale has been calibrated.  These values are specific to my scale.
+# ZERO = 546562
+# 45G = 633114
+# SLOPE = TEST_WEIGHT - ZERO_WEIGHT / 45
+GRAMS_MULTIPLIER = 1923.3
+DEAD_ZONE = 0.15
+
+# The STEMMA I2C bus.  Other drivers on it should use a device from bus.device() and take turns (see SharedI2C).
+bus: SharedI2C = None
 scale: NAU7802 = None
+sampler: Sampler = None
+rate_controller: RateController = None
+calibration = Calibration.nominal(GRAMS_MULTIPLIER, round(DEAD_ZONE * 1000))
+# Reused by every read_settled_weight() call.
+settle_detector = SettleDetector(SETTLE_SAMPLES, SETTLE_TOLERANCE * calibration.counts_per_gram)
 tare_weight: int = 0
 
 
 async def init_scale() -> NAU7802:
-    global scale
+    global bus, scale, sampler, rate_controller
 
     load_tare_weight()
+    load_calibration()
 
     # Instantiate NAU7802 ADC
     print("Initializing scale... ", end="")
-    i2c = board.STEMMA_I2C()
-    scale: NAU7802 = NAU7802(i2c, address=0x2A, active_channels=1)
+    bus = SharedI2C(board.STEMMA_I2C())
+    scale = NAU7802(bus.device(0x2A, "scale"), active_channels=1, drdy_pin=DRDY_PIN)
     # scale.gain = 2
 
-    enabled = await scale.enable()
-    if not enabled:
-        raise RuntimeError("Unable to enable NAU7802 ADC")
+    # After a reload the ADC is usually still running with the same settings, so there's no need to start it over.
+    warm = await scale.begin(warm=WARM_START)
 
-    # await scale.zero_channel()
+    if not warm:
+        # await scale.zero_channel()
 
-    internal_calibrated = await scale.calibrate("INTERNAL")
-    if not internal_calibrated:
-        raise RuntimeError("Unable to calibrate NAU7802 internal")
+        internal_calibrated = await scale.calibrate("INTERNAL")
+        if not internal_calibrated:
+            raise RuntimeError("Unable to calibrate NAU7802 internal")
 
-    # offset_calibrated = await scale.calibrate("OFFSET")
-    # if not offset_calibrated:
-    #     raise RuntimeError("Unable to calibrate NAU7802 offset")
+        # offset_calibrated = await scale.calibrate("OFFSET")
+        # if not offset_calibrated:
+        #     raise RuntimeError("Unable to calibrate NAU7802 offset")
 
-    # The first value after calibration seems to be from prior to calibration.
-    scale.read()
+    sampler = Sampler(scale)
 
-    print("Done!")
+    idle_rate = settings.store.get_int(settings.IDLE_RATE, IDLE_RATE)
+    if idle_rate not in IDLE_RATES:
+        idle_rate = IDLE_RATE
+    rate_controller = RateController(
+        sampler, int(FAST_RATE_THRESHOLD * calibration.counts_per_gram), idle_rate, FAST_RATE, FAST_RATE_HOLD
+    )
+    sampler.listeners.append(rate_controller.on_sample)
+
+    print("Done! (warm start)" if warm else "Done!")
 
     return scale
 
 
-def convert_to_grams(raw: int) -> float:
-    # These values are specific to my scale.
-    # ZERO = 546562
-    # 45G = 633114
-    # SLOPE = TEST_WEIGHT - ZERO_WEIGHT / 45
-    GRAMS_MULTIPLIER = 1923.3
-    DEAD_ZONE = 0.15
+def restore_samples(values):
+    '''Puts samples saved by power_down() back into the sampler.  Must be called before sample() is started.'''
+    if values:
+        sampler.restore(values)
+        print("Restored {} samples".format(len(values)))
+
 
-    grams = (raw - tare_weight) / GRAMS_MULTIPLIER
+async def power_down() -> array:
+    '''Powers down the ADC to save power.  Returns the latest samples to hand to restore_samples() afterwards.'''
+    samples = sampler.latest(min(SLEEP_SAMPLES, sampler.available))
+    await scale.enable(False)
+    return samples
 
-    # Give ourselves a little buffer so that we don't get jitter around zero.
-    if grams < DEAD_ZONE and grams > -DEAD_ZONE:
-        grams = 0
 
-    # Round to the nearest 0.1g
-    grams = round(grams, 1)
+async def power_up():
+    '''Powers the ADC back up after power_down() when the program carried on (a light sleep).'''
+    if not await scale.enable(True):
+        raise RuntimeError("Unable to power up NAU7802")
 
-    # print("Raw: {0:6} Scaled: {1:6} Result: {2:6}".format(raw, (raw - tare_weight), grams))
-    return grams
 
+def convert_to_decigrams(raw: int) -> int:
+    # Weights are worked out in whole decigrams with integer math so that converting a reading doesn't allocate floats.
+    return calibration.to_decigrams(raw - tare_weight)
 
-async def read_weight() -> float:
-    global scale, tare_weight
 
-    raw = await scale.read_raw_value(3)
+def convert_to_grams(raw: int) -> float:
+    decigrams = convert_to_decigrams(raw)
+    if decigrams == 0:
+        return 0
 
-    return convert_to_grams(raw)
+    # print("Raw: {0:6} Scaled: {1:6} Result: {2:6}".format(raw, (raw - tare_weight), decigrams))
+    return decigrams / 10
 
 
-async def read_weight_with_validation() -> float:
+async def sample():
     '''
-    Attempts to read a weight from the scale.  This  will gather five separate measurements, discard the highest and the
-    lowest, and average the remaining values.  If the difference between any value and the average is greater than 1% then a
-    ValueError will be raised.  Otherwise the value in grams will be returned.
+    Runs the background sampler which keeps the ring buffer filled along with the controller that adapts its conversion
+    rate.  Must be started after init_scale().
     '''
-    global scale, tare_weight
+    await asyncio.gather(sampler.run(), rate_controller.run())
 
-    values = await scale.read_raw_values(5)
 
-    if len(values) < 3:
-        raise ValueError("At least three values are required")
-
-    sorted_values = sorted(values)
-    trimmed_values = sorted_values[1:-1]
-    avg = sum(trimmed_values) / len(trimmed_values)
-    for value in trimmed_values:
-        if abs(value - avg) > 0.01 * avg:
+async def read_settled_weight(
+    max_samples: int = SETTLE_SAMPLES, tolerance: float = SETTLE_TOLERANCE, timeout: float = SETTLE_TIMEOUT
+) -> tuple[float, float]:
+    '''
+    Reads a weight from the scale using only as many samples as it takes for the reading to settle.  Recent samples that
+    are already in the buffer are used first, so a steady load returns immediately, while a moving one keeps sampling
+    until it settles.  Returns the weight in grams and the confidence (0-1) that it's within tolerance grams of the true
+    weight.  If the scale doesn't settle within timeout seconds a ValueError will be raised.
+    '''
+    global sampler
+
+    detector = settle_detector
+    if max_samples != SETTLE_SAMPLES or tolerance != SETTLE_TOLERANCE:
+        detector = SettleDetector(max_samples, tolerance * calibration.counts_per_gram)
+    detector.reset()
+    start = ticks_ms()
+    next_sample = sampler.count - min(max_samples, sampler.available)
+
+    while True:
+        # Skip anything that was overwritten while we were waiting.
+        next_sample = max(next_sample, sampler.count - sampler.size)
+        # Everything that's buffered goes in before deciding, so older samples that had settled don't hide a change.
+        while next_sample < sampler.count:
+            detector.add(sampler.sample(next_sample))
+            next_sample += 1
+        if detector.settled:
+            return convert_to_grams(detector.window.int_mean()), detector.confidence()
+
+        if ticks_diff(ticks_ms(), start) > timeout * 1000:
             raise ValueError(
-                "Value {} is more than 10% different than the average".format(value)
+                "Not settled after {} samples ({:.2f} confidence)".format(detector.samples, detector.confidence())
             )
 
-    return convert_to_grams(avg)
+        await sampler.wait_for_new()
 
 
 async def tare():
-    global scale, tare_weight
+    global sampler, tare_weight
     print("Taring scale... ", end="")
-    raw = await scale.read_raw_value(20)
+    await sampler.wait_for(TARE_SAMPLES)
+    raw = sampler.mean(TARE_SAMPLES)
     tare_weight = raw
     save_tare_weight()
     print("Done!")
 
 
+async def calibrate(grams: float):
+    '''
+    Records the raw reading with a known weight of grams on the scale as a calibration point and saves the calibration.
+    Weighing more than one known weight gives a piecewise-linear fit through all of them.
+    '''
+    global sampler, tare_weight
+    print("Calibrating with {}g... ".format(grams), end="")
+    # Only samples taken from now on, so none of them are from before the weight was put on.
+    await sampler.wait_for_new(CALIBRATION_SAMPLES)
+    raw = sampler.mean(CALIBRATION_SAMPLES)
+    calibration.add_point(raw - tare_weight, round(grams * 1000))
+    settings.store.set(settings.CALIBRATION, calibration.encode())
+    settings.store.flush()
+    apply_calibration()
+    print("Done!")
+
+
+def clear_calibration():
+    '''Forgets the calibration points and goes back to the nominal slope until the scale is calibrated again.'''
+    global calibration
+    calibration = Calibration.nominal(GRAMS_MULTIPLIER, round(DEAD_ZONE * 1000))
+    # An empty value isn't a valid calibration, so there's nothing to load after a restart either.
+    settings.store.set(settings.CALIBRATION, b"")
+    settings.store.flush()
+    apply_calibration()
+    print("Calibration cleared, using {} counts/g".format(GRAMS_MULTIPLIER))
+
+
+def set_idle_rate(rate: int):
+    '''Changes the conversion rate (samples per second) used while the weight is steady and saves it.'''
+    if rate not in IDLE_RATES:
+        raise ValueError("The idle rate must be one of {} SPS".format(IDLE_RATES))
+    settings.store.set_int(settings.IDLE_RATE, rate)
+    settings.store.flush()
+    rate_controller.set_idle_rate(rate)
+
+
+def apply_calibration():
+    '''Updates the thresholds that are kept in raw counts to match the calibration.'''
+    global settle_detector
+    settle_detector = SettleDetector(SETTLE_SAMPLES, SETTLE_TOLERANCE * calibration.counts_per_gram)
+    if rate_controller is not None:
+        rate_controller.threshold = int(FAST_RATE_THRESHOLD * calibration.counts_per_gram)
+
+
+def load_calibration():
+    global calibration
+    data = settings.store.get(settings.CALIBRATION)
+    loaded = None if data is None else Calibration.decode(data)
+    if loaded is None:
+        print("No saved calibration, using {} counts/g".format(GRAMS_MULTIPLIER))
+        return
+    calibration = loaded
+    apply_calibration()
+    print("Loaded calibration: {}".format(calibration.points))
+
+
 def load_tare_weight():
     global tare_weight
-    tare_bytes = microcontroller.nvm[0:4]
-    tare_weight = struct.unpack(">I", tare_bytes)[0]
+    tare_weight = settings.store.get_int(settings.TARE, 0)
     print("Loaded tare weight: {0:10}".format(tare_weight))
 
 
 def save_tare_weight():
     global tare_weight
     print("Saving tare weight: {0:10}".format(tare_weight))
-    tare_bytes = struct.pack(">I", tare_weight)
-    microcontroller.nvm[0:4] = tare_bytes
+    settings.store.set_int(settings.TARE, tare_weight)
+    settings.store.flush()
@@ -0,0 +1,158 @@
+import struct
+
+import microcontroller
+
+from offline_log import crc8
+
+# Where the settings live in NVM (the offline log starts after them).
+SETTINGS_START = 0
+SETTINGS_SIZE = 1024
+
+# Keys of the stored settings.  Never reuse a key for something else.
+TARE = 1
+CALIBRATION = 2
+WIFI = 3
+EMPTY_THRESHOLD = 4
+IDLE_RATE = 5
+EATEN_TODAY = 6
+
+LAYOUT_VERSION = 1
+_MAGIC = b"CS"
+_BANK_HEADER = "<2sBI"  # magic, layout version, generation, followed by a crc8
+_BANK_HEADER_SIZE = struct.calcsize(_BANK_HEADER) + 1
+_RECORD_HEADER = "<BBB"  # key, length of the value, low byte of the generation, followed by the value and a crc8
+_RECORD_HEADER_SIZE = struct.calcsize(_RECORD_HEADER)
+_MAX_LENGTH = 255
+
+
+class SettingsStore:
+    '''
+    Small key-value store for settings that have to survive a restart, kept in a region of NVM.
+
+    The region is split into two banks.  Changed settings are appended to the active bank as records (each with its own
+    CRC), so repeatedly saving a setting walks through the bank rather than rewriting the same bytes.  When the bank is
+    full every current value is written to the other bank under the next generation number, and once its header has
+    been written that bank becomes the active one.  A write that's cut short only loses the records it was writing.
+
+    The whole region is read once when the store is opened and every value is cached, so get() never touches NVM.
+    set() only updates the cache; flush() writes everything that changed in one go.
+    '''
+
+    def __init__(self, nvm, start: int, size: int):
+        self.nvm = nvm
+        self.start = start
+        self.bank_size = min(size, len(nvm) - start) // 2
+        if self.bank_size < _BANK_HEADER_SIZE + _RECORD_HEADER_SIZE + 1:
+            raise ValueError("Settings region is too small")
+        self.values = {}
+        self.dirty = set()  # Keys that have been set since the last flush
+        self.bank = 0
+        self.generation = 0  # 0 until something has been stored
+        self.end = 0  # Offset in the active bank where the next record goes
+        self._load(nvm[start:start + 2 * self.bank_size])
+
+    def get(self, key: int, default: bytes = None) -> bytes:
+        return self.values.get(key, default)
+
+    def set(self, key: int, value: bytes):
+        if len(value) > _MAX_LENGTH:
+            raise ValueError("Setting is too long")
+        value = bytes(value)
+        if self.values.get(key) != value:
+            self.values[key] = value
+            self.dirty.add(key)
+
+    def get_int(self, key: int, default: int = None) -> int:
+        value = self.values.get(key)
+        return default if value is None else struct.unpack("<i", value)[0]
+
+    def set_int(self, key: int, value: int):
+        self.set(key, struct.pack("<i", value))
+
+    def flush(self) -> bool:
+        '''Writes any settings that have changed.  Returns whether anything was written.'''
+        if not self.dirty:
+            return False
+        records = self._encode(sorted(self.dirty), self.generation)
+        if self.generation and self.end + len(records) <= self.bank_size:
+            offset = self.start + self.bank * self.bank_size + self.end
+            self.nvm[offset:offset + len(records)] = records
+            self.end += len(records)
+        else:
+            self._compact()
+        self.dirty.clear()
+        return True
+
+    def _compact(self):
+        '''Writes every setting to the other bank under the next generation, which retires the current bank.'''
+        bank = 1 - self.bank if self.generation else 0
+        generation = self.generation + 1
+        records = self._encode(sorted(self.values), generation)
+        if _BANK_HEADER_SIZE + len(records) > self.bank_size:
+            raise ValueError("Settings don't fit in their region")
+
+        # The records go first so the bank only becomes valid once they're all there.
+        offset = self.start + bank * self.bank_size
+        self.nvm[offset + _BANK_HEADER_SIZE:offset + _BANK_HEADER_SIZE + len(records)] = records
+        header = bytearray(_BANK_HEADER_SIZE)
+        struct.pack_into(_BANK_HEADER, header, 0, _MAGIC, LAYOUT_VERSION, generation)
+        header[_BANK_HEADER_SIZE - 1] = crc8(header, _BANK_HEADER_SIZE - 1)
+        self.nvm[offset:offset + _BANK_HEADER_SIZE] = header
+
+        self.bank = bank
+        self.generation = generation
+        self.end = _BANK_HEADER_SIZE + len(records)
+
+    def _encode(self, keys: list, generation: int) -> bytearray:
+        records = bytearray(sum(_RECORD_HEADER_SIZE + len(self.values[key]) + 1 for key in keys))
+        offset = 0
+        for key in keys:
+            value = self.values[key]
+            end = offset + _RECORD_HEADER_SIZE + len(value)
+            struct.pack_into(_RECORD_HEADER, records, offset, key, len(value), generation & 0xFF)
+            records[offset + _RECORD_HEADER_SIZE:end] = value
+            records[end] = crc8(records[offset:end])
+            offset = end + 1
+        return records
+
+    def _load(self, data: bytearray):
+        for bank in (0, 1):
+            offset = bank * self.bank_size
+            magic, version, generation = struct.unpack_from(_BANK_HEADER, data, offset)
+            if magic != _MAGIC or version != LAYOUT_VERSION:
+                continue
+            if crc8(data[offset:offset + _BANK_HEADER_SIZE - 1]) != data[offset + _BANK_HEADER_SIZE - 1]:
+                continue
+            if generation > self.generation:
+                self.bank = bank
+                self.generation = generation
+        if not self.generation:
+            return
+
+        # Read records up to the first one that isn't valid, which is either unused space, one that was cut short or
+        # one left over from the bank's previous generation.
+        bank_start = self.bank * self.bank_size
+        bank_end = bank_start + self.bank_size
+        offset = bank_start + _BANK_HEADER_SIZE
+        while offset + _RECORD_HEADER_SIZE < bank_end:
+            key, length, generation = struct.unpack_from(_RECORD_HEADER, data, offset)
+            end = offset + _RECORD_HEADER_SIZE + length
+            if generation != self.generation & 0xFF or end >= bank_end or crc8(data[offset:end]) != data[end]:
+                break
+            self.values[key] = bytes(data[offset + _RECORD_HEADER_SIZE:end])
+            offset = end + 1
+        self.end = offset - bank_start
+
+
+def _migrate(store: SettingsStore):
+    '''Brings over the tare from before there was a settings store, when it was an unsigned int at the start of NVM.'''
+    legacy = microcontroller.nvm[0:4]
+    tare = struct.unpack(">I", legacy)[0]
+    if tare != 0xFFFFFFFF and legacy[0:2] != _MAGIC:
+        store.set_int(TARE, tare - (1 << 32) if tare & 0x80000000 else tare)
+        store.flush()
+
+
+store = SettingsStore(microcontroller.nvm, SETTINGS_START, SETTINGS_SIZE)
+if not store.generation:
+    _migrate(store)
@@ -0,0 +1,289 @@
+import asyncio
+import time
+from adafruit_ticks import ticks_ms, ticks_diff
+
+# Priorities of turns on the bus, most urgent first.
+SAMPLE = 0
+CONTROL = 1
+HOUSEKEEPING = 2
+
+# The TCA9548A I2C multiplexer's default address.
+MUX_ADDRESS = 0x70
+
+# Bit times a transaction spends on the wire besides its data: start, stop and the address byte with its ACK.
+_TRANSACTION_BITS = 11
+
+
+class SharedI2C:
+    '''
+    Shares one I2C bus between several drivers running as asyncio tasks (a NAU7802 for each of several bowls, other
+    STEMMA sensors...) so that the samples aren't held up by housekeeping and no driver starves the others.
+
+    device() gives each driver a BusDevice to use in place of adafruit_bus_device's I2CDevice.  A transaction on it
+    (`with device as i2c:`) happens straight away, as nothing else can run until it's over anyway.  What needs sharing
+    is when they happen, so a driver asks for a turn first:
+
+        async with device.turn(HOUSEKEEPING):
+            with device as i2c:
+                i2c.write_then_readinto(...)
+
+    The bus is one turn's at a time.  Turns are given in order of priority (SAMPLE, then CONTROL, then HOUSEKEEPING) and
+    in the order they were asked for within a priority, so drivers with the same priority take turns fairly.  A driver
+    that knows when it will next need the bus (when its next conversion is due) books its turn for then, and less urgent
+    turns aren't given from GUARD_MS before that until the booked turn has been taken, so a sample read doesn't have to
+    wait for housekeeping to get off the bus.  A booking that isn't taken lapses LAPSE_MS after it was for.  So that
+    bookings can work, a driver should take a turn per transaction (or short burst of them), and a turn that's held
+    across awaits for a longer sequence should check preempted between steps and give the bus up if it's set.
+
+    Devices with the same address (like several NAU7802s, which are always at 0x2A) can share the bus from behind a
+    TCA9548A multiplexer by giving them their mux channel.  The mux is switched whenever a transaction is for a
+    different channel than the last one.
+
+    Every device counts its transactions, how long they kept the bus busy (worked out from the bytes sent at the bus
+    frequency, as timing a transaction that takes a fraction of a millisecond would allocate) and how long its turns
+    waited.  stats() sums them up.
+    '''
+
+    GUARD_MS = 2
+    LAPSE_MS = 50
+
+    def __init__(self, i2c, mux_address: int = MUX_ADDRESS):
+        self.i2c = i2c
+        self.frequency = getattr(i2c, "frequency", 100000)
+        self.mux_address = mux_address
+        self.mux_channel = None  # The channel the mux was last switched to
+        self._mux_buf = bytearray(1)
+        self.devices = []
+        self.holder = None  # The turn that has the bus
+        self.waiting = []  # Turns that have been asked for and not given yet, in the order they were asked for
+        self.booked = []  # Turns that have been booked and not taken yet
+        # Pulsed every time the bus is given up while turns are waiting.
+        self.released = asyncio.Event()
+        self.since = time.monotonic()
+
+    def device(self, address: int, name: str = None, mux_channel: int = None) -> "BusDevice":
+        '''The device at address (behind the mux on mux_channel if it's given).  name is what stats() calls it.'''
+        device = BusDevice(self, address, name or hex(address), mux_channel)
+        self.devices.append(device)
+        return device
+
+    async def acquire(self, turn: "Turn"):
+        '''Waits until it's turn's turn and gives it the bus.  Use the turn with `async with` rather than this.'''
+        if self.holder is None and not self.waiting and not (self.booked and self._booked_ahead(turn)):
+            self._give(turn)
+            return
+
+        asked = ticks_ms()
+        waited = False
+        self.waiting.append(turn)
+        try:
+            while True:
+                if self.holder is not None or self._next() is not turn:
+                    waited = True
+                    await self.released.wait()
+                    continue
+                lapses = self._booked_ahead(turn)
+                if not lapses:
+                    break
+                waited = True
+                # Wait for the booked turn to be taken, or for the booking to lapse.
+                try:
+                    await asyncio.wait_for(self.released.wait(), lapses / 1000)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            self.waiting.remove(turn)
+            self._wake()
+            raise
+        self.waiting.remove(turn)
+        self._give(turn)
+
+        if waited:
+            device = turn.device
+            wait = ticks_diff(ticks_ms(), asked)
+            device.waits += 1
+            device.wait_ms += wait
+            if wait > device.max_wait_ms:
+                device.max_wait_ms = wait
+
+    def release(self, turn: "Turn"):
+        if self.holder is turn:
+            self.holder = None
+            self._wake()
+
+    def book(self, turn: "Turn", at: int):
+        '''Books turn for when (in ticks_ms) it'll be needed.  Use Turn.book() rather than this.'''
+        turn.booked_at = at
+        if turn not in self.booked:
+            self.booked.append(turn)
+        # Anything waiting only for a booking that's now been moved may be able to go.
+        self._wake()
+
+    def preempted(self, turn: "Turn") -> bool:
+        '''Whether a more urgent turn than turn is waiting for the bus.'''
+        for waiting in self.waiting:
+            if waiting.priority < turn.priority:
+                return True
+        return False
+
+    def stats(self) -> dict:
+        '''
+        For each device (by name): its transactions, the fraction of the time since the bus started being shared (or
+        since reset_stats()) that they kept the bus busy, how many of its turns had to wait, and for how long in total
+        and at most in ms.
+        '''
+        elapsed = max(time.monotonic() - self.since, 1e-3)
+        stats = {}
+        for device in self.devices:
+            stats[device.name] = {
+                "transactions": device.transactions,
+                "utilization": device.bits / self.frequency / elapsed,
+                "waits": device.waits,
+                "wait_ms": device.wait_ms,
+                "max_wait_ms": device.max_wait_ms,
+            }
+        return stats
+
+    def reset_stats(self):
+        self.since = time.monotonic()
+        for device in self.devices:
+            device.transactions = device.bits = device.waits = device.wait_ms = device.max_wait_ms = 0
+
+    def _give(self, turn: "Turn"):
+        self.holder = turn
+        if turn.booked_at is not None:
+            turn.booked_at = None
+            self.booked.remove(turn)
+
+    def _booked_ahead(self, turn: "Turn") -> int:
+        '''
+        If a more urgent turn is booked for within GUARD_MS from now (or was booked for earlier and hasn't been taken
+        yet), the ms until its booking lapses.  Otherwise 0.
+        '''
+        now = ticks_ms()
+        lapses = 0
+        for i in range(len(self.booked) - 1, -1, -1):
+            booked = self.booked[i]
+            since = ticks_diff(now, booked.booked_at)
+            if since >= self.LAPSE_MS:
+                # Lapsed, and forgotten before ticks_ms() wraps around and makes it look booked again.
+                booked.booked_at = None
+                self.booked.pop(i)
+            elif booked.priority < turn.priority and since >= -self.GUARD_MS:
+                lapses = max(lapses, self.LAPSE_MS - since)
+        return lapses
+
+    def _next(self):
+        '''The turn that's next: the most urgent one that's waiting, and of those the one that's waited longest.'''
+        best = None
+        for turn in self.waiting:
+            if best is None or turn.priority < best.priority:
+                best = turn
+        return best
+
+    def _wake(self):
+        if self.waiting:
+            # Waiters that were already woken stay woken after the clear.
+            self.released.set()
+            self.released.clear()
+
+
+class Turn:
+    '''A device's turn on the bus at a priority.  Use it with `async with`, which gives the device.'''
+
+    def __init__(self, device: "BusDevice", priority: int):
+        self.device = device
+        self.priority = priority
+        self.booked_at = None  # ticks_ms that the turn is booked for, None if it isn't
+
+    def book(self, at: int):
+        '''Books the turn for at (in ticks_ms), when it'll next be taken.  Taking it ends the booking.'''
+        self.device.bus.book(self, at)
+
+    async def __aenter__(self):
+        await self.device.bus.acquire(self)
+        return self.device
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.device.bus.release(self)
+
+    @property
+    def preempted(self) -> bool:
+        '''Whether a more urgent turn is waiting for the bus, so this one should give it up at the next chance.'''
+        return self.device.bus.preempted(self)
+
+
+class BusDevice:
+    '''
+    A device on a SharedI2C bus.  It works like adafruit_bus_device's I2CDevice (readinto(), write() and
+    write_then_readinto() inside `with device as i2c:`) and counts what it sends, and turn() is its turns on the bus.
+    '''
+
+    def __init__(self, bus: SharedI2C, address: int, name: str, mux_channel: int = None):
+        self.bus = bus
+        self.address = address
+        self.name = name
+        self.mux_channel = mux_channel
+        # One turn for each priority, rather than one per `async with`.
+        self.turns = (Turn(self, SAMPLE), Turn(self, CONTROL), Turn(self, HOUSEKEEPING))
+        self.transactions = 0
+        self.bits = 0  # Bit times spent on the wire
+        self.waits = 0  # Turns that had to wait for the bus
+        self.wait_ms = 0
+        self.max_wait_ms = 0
+
+    def turn(self, priority: int = CONTROL) -> Turn:
+        return self.turns[priority]
+
+    def __enter__(self):
+        i2c = self.bus.i2c
+        while not i2c.try_lock():
+            pass
+        if self.mux_channel is not None and self.bus.mux_channel != self.mux_channel:
+            try:
+                self._select()
+            except Exception:
+                i2c.unlock()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.bus.i2c.unlock()
+        return False
+
+    def readinto(self, buf, *, start: int = 0, end: int = None):
+        if end is None:
+            end = len(buf)
+        self.bus.i2c.readfrom_into(self.address, buf, start=start, end=end)
+        self._count(1, end - start)
+
+    def write(self, buf, *, start: int = 0, end: int = None):
+        if end is None:
+            end = len(buf)
+        self.bus.i2c.writeto(self.address, buf, start=start, end=end)
+        self._count(1, end - start)
+
+    def write_then_readinto(
+        self, out_buffer, in_buffer, *, out_start: int = 0, out_end: int = None, in_start: int = 0, in_end: int = None
+    ):
+        if out_end is None:
+            out_end = len(out_buffer)
+        if in_end is None:
+            in_end = len(in_buffer)
+        self.bus.i2c.writeto_then_readfrom(
+            self.address, out_buffer, in_buffer, out_start=out_start, out_end=out_end, in_start=in_start, in_end=in_end
+        )
+        self._count(2, out_end - out_start + in_end - in_start)
+
+    def _select(self):
+        '''Switches the mux to this device's channel.'''
+        bus = self.bus
+        bus.mux_channel = None  # Unknown if the write fails
+        bus._mux_buf[0] = 1 << self.mux_channel
+        bus.i2c.writeto(bus.mux_address, bus._mux_buf)
+        bus.mux_channel = self.mux_channel
+        self._count(1, 1)
+
+    def _count(self, addresses: int, data_bytes: int):
+        self.transactions += 1
+        self.bits += _TRANSACTION_BITS * addresses + 9 * data_bytes
@@ -0,0 +1,29 @@
+"""
+Host-side simulation helpers for CinnaScale.
+
+None of this is copied to the device.  It provides stand-ins for the CircuitPython hardware modules so that the
+firmware modules can be imported and exercised under CPython on a Linux host.
+
+    import sim
+    sim.install()
+
+``install()`` puts the hardware shims (``sim/shims``) and the repository root at the front of ``sys.path``.  The
+Adafruit libraries from ``requirements.txt`` are still required and can be installed from PyPI with
+``pip install -r sim/requirements.txt``.
+
+``python -m sim.run`` uses the shims to run ``main.py`` itself against a simulated board and Home Assistant.
+"""
+
+import os
+import sys
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+SHIMS_DIR = os.path.join(SIM_DIR, "shims")
+REPO_DIR = os.path.dirname(SIM_DIR)
+
+
+def install():
+    for path in (REPO_DIR, SHIMS_DIR):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
@@ -0,0 +1,125 @@
+"""
+Virtual clocks for simulation runs.
+
+Once installed, ``time.monotonic()``, ``time.monotonic_ns()``, ``time.time()`` and ``time.sleep()`` all follow the
+virtual clock, and ``asyncio.run()`` creates event loops whose selector waits according to the clock.  Code that only
+uses those to tell the time (which is everything in the firmware) is none the wiser.
+
+``VirtualClock`` runs ``speed`` times faster than real time.  ``SteppedClock`` doesn't follow real time at all: it only
+moves when something waits or when the simulated hardware spends time, which makes runs deterministic and as fast as
+the host can go.
+"""
+
+import asyncio
+import selectors
+import time
+
+_real_perf_counter = time.perf_counter
+_real_sleep = time.sleep
+
+
+class SimulationComplete(BaseException):
+    """Raised out of the event loop once the clock passes its deadline.  A BaseException so firmware can't catch it."""
+
+
+class VirtualClock:
+    EPOCH = 1700000000  # time.time() when the clock starts
+
+    def __init__(self, speed: float = 1.0, start: float = 1000.0):
+        self.speed = speed
+        self.start = start
+        self._real_start = _real_perf_counter()
+        self.deadline = None
+
+    def monotonic(self) -> float:
+        return self.start + (_real_perf_counter() - self._real_start) * self.speed
+
+    def monotonic_ns(self) -> int:
+        return int(self.monotonic() * 1e9)
+
+    def elapsed(self) -> float:
+        return self.monotonic() - self.start
+
+    def time(self) -> float:
+        return self.EPOCH + self.elapsed()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            _real_sleep(seconds / self.speed)
+
+    def spend(self, seconds: float):
+        '''Called by simulated hardware for time spent on the wire.  Real time already passes, so there's nothing to do.'''
+
+    def real_timeout(self, timeout):
+        '''
+        Converts a virtual timeout into a real one, capped at the deadline.  Raises every time once the deadline has
+        passed so that nothing gets to run past it.
+        '''
+        if self.deadline is not None:
+            remaining = self.deadline - self.monotonic()
+            if remaining <= 0:
+                raise SimulationComplete()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if timeout is None:
+            return None
+        return max(0, timeout) / self.speed
+
+    def install(self):
+        time.monotonic = self.monotonic
+        time.monotonic_ns = self.monotonic_ns
+        time.time = self.time
+        time.sleep = self.sleep
+        asyncio.set_event_loop_policy(_Policy(self))
+        if not hasattr(asyncio, "sleep_ms"):
+            # CircuitPython's asyncio has sleep_ms.
+            asyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+
+
+class SteppedClock(VirtualClock):
+    # Virtual time taken by every pass of the event loop, roughly what a pass of CircuitPython's scheduler costs on the
+    # ESP32-S3.  Without it a loop of sleep(0)s would never let any time pass.
+    LOOP_COST = 50e-6
+
+    def __init__(self, start: float = 1000.0):
+        super().__init__(1.0, start)
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.now += seconds
+
+    def spend(self, seconds: float):
+        self.now += seconds
+
+    def real_timeout(self, timeout):
+        '''Jumps straight to the end of the timeout (or the deadline) instead of waiting for it.'''
+        if self.deadline is not None:
+            remaining = self.deadline - self.now
+            if remaining <= 0:
+                raise SimulationComplete()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if timeout is None:
+            raise RuntimeError("Nothing is scheduled and the clock has no deadline, so time would stand still")
+        self.now += max(timeout, self.LOOP_COST)
+        return 0
+
+
+class _ScaledSelector(selectors.DefaultSelector):
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        return super().select(self.clock.real_timeout(timeout))
+
+
+class _Policy(asyncio.DefaultEventLoopPolicy):
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def new_event_loop(self):
+        return asyncio.SelectorEventLoop(_ScaledSelector(self.clock))
@@ -0,0 +1,317 @@
+"""
+A local stand-in for the parts of the Home Assistant REST and WebSocket APIs that CinnaScale uses.
+
+The server speaks HTTP/1.1 with keep-alive (like the real aiohttp based server) and can optionally be wrapped in TLS.
+``/api/websocket`` upgrades to a WebSocket that authenticates, takes commands and pushes the events that clients have
+subscribed to, like the real one.  Everything it receives is recorded so a simulation or benchmark can check what was
+sent, and events can be scheduled to be pushed to the device (see ``schedule()``).
+
+    stub = HomeAssistantStub()
+    stub.start()
+    ... post to stub.url with stub.token ...
+    stub.stop()
+"""
+
+import base64
+import datetime
+import hashlib
+import json
+import ssl
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # aiohttp sets TCP_NODELAY too; without it the separate header and body writes stall on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.stub.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/api/websocket" and self.headers.get("Upgrade", "").lower() == "websocket":
+            return self._websocket()
+        self._handle(None)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        self._handle(json.loads(body) if body else None)
+
+    def _handle(self, data):
+        stub = self.server.stub
+        if stub.latency:
+            time.sleep(stub.latency)
+        if self.headers.get("Authorization") != "Bearer " + stub.token:
+            return self._respond(401, {"message": "Unauthorized"})
+
+        status, result = stub.handle(self.command, self.path, data)
+        self._respond(status, result)
+
+    def _respond(self, status, result):
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _websocket(self):
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()).decode()
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        # Once the WebSocket closes so does the connection.
+        self.close_connection = True
+        _WebSocket(self.server.stub, self.rfile, self.connection).serve()
+
+
+class _WebSocket:
+    """One client's WebSocket connection, served on its handler's thread."""
+
+    def __init__(self, stub, rfile, sock):
+        self.stub = stub
+        self.rfile = rfile
+        self.sock = sock
+        self.authenticated = False
+        self.last_id = 0
+        self.subscriptions = {}  # id -> event type
+        self.lock = threading.Lock()
+
+    def serve(self):
+        self.send({"type": "auth_required", "ha_version": "2024.1.0"})
+        try:
+            while True:
+                opcode, payload = self.read_frame()
+                if opcode == 0x8:  # Close
+                    self.send_frame(0x8, payload[:2])
+                    return
+                if opcode == 0x9:  # Ping
+                    self.send_frame(0xA, payload)
+                elif opcode == 0x1:  # Text
+                    if not self.handle(json.loads(payload)):
+                        return
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            with self.stub.lock:
+                if self in self.stub.websockets:
+                    self.stub.websockets.remove(self)
+
+    def handle(self, message: dict) -> bool:
+        """Answers a message.  Returns False if the connection should be closed."""
+        stub = self.stub
+        if stub.latency:
+            time.sleep(stub.latency)
+        with stub.lock:
+            stub.websocket_messages.append(message)
+        if not self.authenticated:
+            if message.get("type") != "auth" or message.get("access_token") != stub.token:
+                self.send({"type": "auth_invalid", "message": "Invalid access token or password"})
+                return False
+            self.authenticated = True
+            with stub.lock:
+                stub.websockets.append(self)
+            self.send({"type": "auth_ok", "ha_version": "2024.1.0"})
+            return True
+
+        id = message.get("id")
+        if not isinstance(id, int) or id <= self.last_id:
+            self.error(id, "id_reuse", "Identifier values have to increase.")
+            return True
+        self.last_id = id
+        kind = message.get("type")
+        if kind == "ping":
+            self.send({"id": id, "type": "pong"})
+        elif kind == "subscribe_events":
+            self.subscriptions[id] = message.get("event_type")
+            self.result(id, None)
+        elif kind == "fire_event":
+            with stub.lock:
+                stub.events.append((message["event_type"], message.get("event_data")))
+            stub.push(message["event_type"], message.get("event_data"))
+            self.result(id, {"context": {"id": str(id)}})
+        elif kind == "recorder/import_statistics":
+            with stub.lock:
+                error = stub._import_statistics(dict(message["metadata"], stats=message["stats"]))
+            if error:
+                self.error(id, "invalid_format", error)
+            else:
+                self.result(id, None)
+        else:
+            self.error(id, "unknown_command", "Unknown command.")
+        return True
+
+    def deliver(self, event_type: str, data):
+        """Sends an event to the client if it has subscribed to it."""
+        for id, subscribed in list(self.subscriptions.items()):
+            if subscribed is None or subscribed == event_type:
+                event = {
+                    "event_type": event_type,
+                    "data": data,
+                    "origin": "LOCAL",
+                    "time_fired": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                }
+                self.send({"id": id, "type": "event", "event": event})
+
+    def result(self, id: int, result):
+        self.send({"id": id, "type": "result", "success": True, "result": result})
+
+    def error(self, id, code: str, message: str):
+        self.send({"id": id, "type": "result", "success": False, "error": {"code": code, "message": message}})
+
+    def send(self, message: dict):
+        self.send_frame(0x1, json.dumps(message).encode())
+
+    def send_frame(self, opcode: int, payload: bytes):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 0x10000:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        with self.lock:
+            self.sock.sendall(header + payload)
+
+    def read_exact(self, size: int) -> bytes:
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError("Client disconnected")
+        return data
+
+    def read_frame(self):
+        first, second = self.read_exact(2)
+        if not first & 0x80:
+            raise ValueError("Fragmented frames aren't supported")
+        if not second & 0x80:
+            raise ValueError("Client frames must be masked")
+        length = second & 0x7F
+        if length == 126:
+            (length,) = struct.unpack(">H", self.read_exact(2))
+        elif length == 127:
+            (length,) = struct.unpack(">Q", self.read_exact(8))
+        mask = self.read_exact(4)
+        payload = self.read_exact(length)
+        return first & 0x0F, bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+
+
+class HomeAssistantStub:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token: str = "sim-token", certfile=None, keyfile=None):
+        self.token = token
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.latency = 0.0  # seconds added to every response
+        self.states = {}
+        self.events = []
+        self.service_calls = []
+        self.statistics = {}  # statistic_id -> {start: {"mean": ..., "min": ..., "max": ...}}
+        self.requests = []  # (method, path, data)
+        self.updates = []  # (time.monotonic(), entity_id) for every state that's set
+        self.connections = 0
+        self.websockets = []  # Authenticated WebSocket connections
+        self.websocket_messages = []  # Everything received over them
+        self.scheduled = []  # (at, event_type, data), soonest first
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return "{}://{}:{}".format("https" if self.certfile else "http", host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push(self, event_type: str, data):
+        """Fires an event (without recording it as one the device sent) to every WebSocket that's subscribed to it."""
+        with self.lock:
+            websockets = list(self.websockets)
+        for websocket in websockets:
+            try:
+                websocket.deliver(event_type, data)
+            except OSError:
+                pass
+
+    def schedule(self, at: float, event_type: str, data):
+        """Pushes an event once deliver_due() is called with a time of at or later."""
+        with self.lock:
+            self.scheduled.append((at, event_type, data))
+            self.scheduled.sort(key=lambda scheduled: scheduled[0])
+
+    def deliver_due(self, now: float):
+        """Pushes the scheduled events that are due by now."""
+        while True:
+            with self.lock:
+                if not self.scheduled or self.scheduled[0][0] > now:
+                    return
+                _, event_type, data = self.scheduled.pop(0)
+            self.push(event_type, data)
+
+    def handle(self, method: str, path: str, data):
+        with self.lock:
+            self.requests.append((method, path, data))
+            parts = path.strip("/").split("/")
+            if parts[:2] == ["api", "states"] and len(parts) == 3:
+                if method == "GET":
+                    if parts[2] not in self.states:
+                        return 404, {"message": "Entity not found."}
+                    return 200, self.states[parts[2]]
+                created = parts[2] not in self.states
+                self.updates.append((time.monotonic(), parts[2]))
+                state = {"entity_id": parts[2], "state": str(data["state"]), "attributes": data.get("attributes", {})}
+                self.states[parts[2]] = state
+                return (201 if created else 200), state
+            if parts[:2] == ["api", "events"] and len(parts) == 3 and method == "POST":
+                self.events.append((parts[2], data))
+                return 200, {"message": "Event {} fired.".format(parts[2])}
+            if parts[:2] == ["api", "services"] and len(parts) == 4 and method == "POST":
+                if parts[2:] == ["recorder", "import_statistics"]:
+                    error = self._import_statistics(data)
+                    if error:
+                        return 400, {"message": error}
+                self.service_calls.append((parts[2], parts[3], data))
+                return 200, []
+            if parts == ["api"]:
+                return 200, {"message": "API running."}
+            return 404, {"message": "Not found"}
+
+    def _import_statistics(self, data) -> str:
+        """Checks an import the way the recorder does and keeps its rows.  Returns what's wrong with it, if anything."""
+        statistic_id = data.get("statistic_id", "")
+        source = data.get("source")
+        if source != "recorder" and not statistic_id.startswith("{}:".format(source)):
+            return "Invalid statistic_id {} for source {}".format(statistic_id, source)
+        rows = {}
+        for row in data.get("stats", []):
+            start = datetime.datetime.fromisoformat(row["start"])
+            if start.tzinfo is None or start.minute or start.second or start.microsecond:
+                return "Invalid timestamp: timestamps must be from the top of the hour"
+            rows[start.timestamp()] = {key: value for key, value in row.items() if key != "start"}
+        self.statistics.setdefault(statistic_id, {}).update(rows)
+        return None
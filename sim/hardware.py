@@ -0,0 +1,126 @@
+"""
+The state of the simulated board, shared by the hardware shims.
+
+A simulation creates a ``Hardware`` and passes it to ``setup()`` before importing the firmware.  The shims look it up
+with ``current()``; when nothing has been set up they fall back to standalone behaviour (a bare I2C bus, an unconnected
+radio) so that individual modules can still be exercised on their own.
+"""
+
+import os
+
+from sim.clock import SimulationComplete, VirtualClock
+from sim.nau7802 import FakeNAU7802
+from sim.scenario import Scenario
+
+_current = None
+
+
+class Reload(BaseException):
+    """Raised by supervisor.reload() and microcontroller.reset() to restart the firmware."""
+
+
+class DeepSleep(Reload):
+    """
+    Raised by alarm.exit_and_deep_sleep_until_alarms().  The simulation runner sleeps until one of the alarms goes off
+    and then runs the firmware again from the top.
+    """
+
+    def __init__(self, alarms):
+        super().__init__()
+        self.alarms = alarms
+
+
+class NVM(bytearray):
+    """microcontroller.nvm, optionally persisted to a file.  Counts every write so wear can be measured."""
+
+    def __init__(self, size: int = 8192, path: str = None):
+        super().__init__(b"\xff" * size)
+        self.path = path
+        self.writes = 0
+        self.bytes_written = 0
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read(size)
+            super().__setitem__(slice(0, len(data)), data)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.writes += 1
+        self.bytes_written += len(value) if isinstance(key, slice) else 1
+        if self.path:
+            with open(self.path, "wb") as f:
+                f.write(self)
+
+
+class Hardware:
+    I2C_ADDRESS = 0x2A
+    SSID = "CinnaNet"
+    PASSWORD = "sim-password"
+    # The pin that the NAU7802's DRDY output is wired to.
+    DRDY_PIN = "A0"
+    SLEEP_MEMORY = 4096  # bytes
+
+    def __init__(self, clock: VirtualClock, scenario: Scenario = None, nvm_path: str = None, seed: int = 0):
+        import busio
+
+        self.clock = clock
+        self.scenario = scenario or Scenario.load()
+        self.nvm = NVM(path=nvm_path)
+        self.i2c = busio.I2C()
+        self.i2c.clock = clock
+        self.nau7802 = FakeNAU7802(
+            signal=lambda t: self.scenario.raw_at(t - clock.start),
+            noise=self.scenario.noise,
+            clock=clock.monotonic,
+            seed=seed,
+        )
+        self.i2c.attach(self.I2C_ADDRESS, self.nau7802)
+        self.pixel_writes = 0
+        # Round trip time (in seconds) spent by every socket connect and request.
+        self.network_latency = 0.0
+        # Called before every socket receive, so that servers which push (like the Home Assistant stub's WebSocket)
+        # can send whatever is due by then.
+        self.receive_hooks = []
+        self.sleep_memory = bytearray(self.SLEEP_MEMORY)
+        self.wake_alarm = None
+        self.light_sleeps = 0
+        self.deep_sleeps = 0
+        self.asleep = 0.0  # seconds
+
+    def sleep_until(self, alarms):
+        """
+        Sleeps until the first of the alarms goes off (a time alarm's time, or a press of a pin alarm's button) and
+        returns it.  Everything outside of the microcontroller, like the NAU7802 and the scenario, carries on.
+        """
+        now = self.elapsed()
+        alarm = min(alarms, key=lambda alarm: alarm._wakes_at(self))
+        wake = alarm._wakes_at(self)
+        if wake == float("inf"):
+            raise RuntimeError("None of the alarms can ever go off")
+        deadline = None if self.clock.deadline is None else self.clock.deadline - self.clock.start
+        if deadline is not None and wake >= deadline:
+            self.asleep += max(0.0, deadline - now)
+            self.clock.sleep(deadline - now)
+            raise SimulationComplete()
+        self.asleep += max(0.0, wake - now)
+        self.clock.sleep(wake - now)
+        self.wake_alarm = alarm
+        return alarm
+
+    def elapsed(self) -> float:
+        return self.clock.elapsed()
+
+    def pressed(self, pin: str) -> bool:
+        return self.scenario.pressed(pin, self.elapsed())
+
+    def link_up(self) -> bool:
+        return self.scenario.link_up(self.elapsed())
+
+
+def setup(hardware: Hardware):
+    global _current
+    _current = hardware
+
+
+def current() -> Hardware:
+    return _current
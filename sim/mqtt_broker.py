@@ -0,0 +1,245 @@
+"""
+A small MQTT 3.1.1 broker to stand in for the real one when running on a host.
+
+It supports what CinnaScale needs: CONNECT (with a last will and optional credentials), QoS 0 and 1 PUBLISH, retained
+messages, SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, PINGREQ and DISCONNECT.  Every published message is recorded,
+and the last will of a client that drops without a DISCONNECT is published just like a real broker would.
+
+    broker = MqttBroker().start()
+    ... connect to broker.host / broker.port ...
+    broker.stop()
+"""
+
+import socket
+import struct
+import threading
+
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+SUBSCRIBE = 0x80
+SUBACK = 0x90
+UNSUBSCRIBE = 0xA0
+UNSUBACK = 0xB0
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+def _packet(packet_type: int, body: bytes) -> bytes:
+    length = len(body)
+    header = bytearray([packet_type])
+    while True:
+        byte = length % 0x80
+        length //= 0x80
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+
+def _string(data: bytes, offset: int):
+    (length,) = struct.unpack_from(">H", data, offset)
+    return data[offset + 2:offset + 2 + length], offset + 2 + length
+
+
+class _Client:
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = None
+        self.will = None  # (topic, payload, retain)
+        self.subscriptions = []
+        self.lock = threading.Lock()
+
+    def send(self, data: bytes):
+        with self.lock:
+            self.sock.sendall(data)
+
+    def read_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Client disconnected")
+            data += chunk
+        return data
+
+    def read_packet(self):
+        header = self.read_exact(1)[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self.read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 0x80
+            if not byte & 0x80:
+                break
+        return header, self.read_exact(length) if length else b""
+
+    def serve(self):
+        clean = False
+        try:
+            while True:
+                header, body = self.read_packet()
+                packet_type = header & 0xF0
+                if packet_type == CONNECT:
+                    if not self.connect(body):
+                        return
+                elif packet_type == PUBLISH:
+                    self.publish(header, body)
+                elif packet_type == SUBSCRIBE:
+                    self.subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    self.unsubscribe(body)
+                elif packet_type == PINGREQ:
+                    self.broker.pings += 1
+                    self.send(_packet(PINGRESP, b""))
+                elif packet_type == DISCONNECT:
+                    clean = True
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.broker.disconnected(self, clean)
+            self.sock.close()
+
+    def connect(self, body: bytes) -> bool:
+        _, offset = _string(body, 0)  # Protocol name
+        flags = body[offset + 1]
+        offset += 4  # Level, flags and keep alive
+        client_id, offset = _string(body, offset)
+        self.client_id = client_id.decode()
+        if flags & 0x04:
+            will_topic, offset = _string(body, offset)
+            will_payload, offset = _string(body, offset)
+            self.will = (will_topic.decode(), will_payload, bool(flags & 0x20))
+        username = password = None
+        if flags & 0x80:
+            username, offset = _string(body, offset)
+            username = username.decode()
+        if flags & 0x40:
+            password, offset = _string(body, offset)
+            password = password.decode()
+
+        accepted = self.broker.credentials is None or self.broker.credentials == (username, password)
+        self.send(_packet(CONNACK, bytes([0, 0 if accepted else 5])))
+        if accepted:
+            self.broker.connected(self)
+        return accepted
+
+    def publish(self, header: int, body: bytes):
+        topic, offset = _string(body, 0)
+        qos = (header >> 1) & 0x3
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            self.send(_packet(PUBACK, packet_id))
+        self.broker.publish(topic.decode(), body[offset:], bool(header & 0x01))
+
+    def subscribe(self, body: bytes):
+        packet_id = body[:2]
+        offset = 2
+        topics = []
+        while offset < len(body):
+            topic, offset = _string(body, offset)
+            offset += 1  # Requested QoS
+            topics.append(topic.decode())
+        self.subscriptions.extend(topics)
+        self.send(_packet(SUBACK, packet_id + bytes(len(topics))))
+        for topic in topics:
+            for retained_topic, payload in list(self.broker.retained.items()):
+                if topic_matches(topic, retained_topic):
+                    self.deliver(retained_topic, payload, True)
+
+    def unsubscribe(self, body: bytes):
+        packet_id = body[:2]
+        offset = 2
+        while offset < len(body):
+            topic, offset = _string(body, offset)
+            if topic.decode() in self.subscriptions:
+                self.subscriptions.remove(topic.decode())
+        self.send(_packet(UNSUBACK, packet_id))
+
+    def deliver(self, topic: str, payload: bytes, retain: bool = False):
+        encoded = topic.encode()
+        self.send(_packet(PUBLISH | (0x01 if retain else 0), struct.pack(">H", len(encoded)) + encoded + payload))
+
+
+class MqttBroker:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, username: str = None, password: str = None):
+        self.credentials = None if username is None else (username, password)
+        self.retained = {}
+        self.messages = []  # (topic, payload, retain)
+        self.clients = []
+        self.connections = 0
+        self.pings = 0
+        self.lock = threading.Lock()
+        self.listener = socket.create_server((host, port))
+        self.host, self.port = self.listener.getsockname()[:2]
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.listener.close()
+        for client in list(self.clients):
+            client.sock.close()
+
+    def drop_clients(self):
+        '''Closes every client connection without a DISCONNECT, as if the network went down.'''
+        for client in list(self.clients):
+            client.sock.shutdown(socket.SHUT_RDWR)
+
+    def _accept(self):
+        while self.running:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=_Client(self, sock).serve, daemon=True).start()
+
+    def connected(self, client: _Client):
+        with self.lock:
+            self.connections += 1
+            self.clients.append(client)
+
+    def disconnected(self, client: _Client, clean: bool):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        if not clean and client.will is not None:
+            self.publish(*client.will)
+
+    def publish(self, topic: str, payload: bytes, retain: bool):
+        with self.lock:
+            self.messages.append((topic, payload, retain))
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            clients = list(self.clients)
+        for client in clients:
+            if any(topic_matches(pattern, topic) for pattern in client.subscriptions):
+                try:
+                    client.deliver(topic, payload)
+                except OSError:
+                    pass
@@ -0,0 +1,187 @@
+"""
+Register-level model of the NAU7802 24-bit ADC for use with the simulated ``busio.I2C`` bus.
+
+The model keeps the chip's 32 byte register file, honours the auto-incrementing register pointer for multi-byte reads
+and writes and produces conversions at the rate selected in CTRL2 from a scripted load-cell ``signal``.  Noise grows
+with the conversion rate, the first conversion after a restart is still settling, and changing the rate or gain adds an
+offset error until the next calibration.
+"""
+
+import random
+import time
+
+_PU_CTRL = 0x00
+_CTRL1 = 0x01
+_CTRL2 = 0x02
+_ADCO_B2 = 0x12
+_ADCO_B0 = 0x14
+_REV_ID = 0x1F
+
+# PU_CTRL bits
+_RR = 0x01
+_PUD = 0x02
+_PUA = 0x04
+_PUR = 0x08
+_CR = 0x20
+
+# CTRL2 bits
+_CALS = 0x04
+_CAL_ERR = 0x08
+
+# CTRL2[6:4] conversion rate select to samples per second
+RATE_SPS = {0x0: 10, 0x1: 20, 0x2: 40, 0x3: 80, 0x7: 320}
+
+
+class FakeNAU7802:
+    """
+    Simulated NAU7802.  ``signal`` maps a time in seconds to a raw 24-bit reading at a gain of 128 and ``noise`` is the
+    standard deviation (in counts) of the gaussian noise added to each conversion at 10 SPS.
+    """
+
+    CALIBRATION_TIME = 0.05  # seconds
+    # Noise scales with the square root of the bandwidth, which is proportional to the conversion rate.
+    NOISE_SCALE = {10: 1.0, 20: 1.41, 40: 2.0, 80: 2.83, 320: 5.66}
+    # Error (in counts) of the first conversion after a restart and of every conversion made with uncalibrated settings.
+    SETTLING_ERROR = 5000
+    UNCALIBRATED_ERROR = 800
+
+    def __init__(self, signal=None, noise: float = 0.0, clock=time.monotonic, seed: int = 0):
+        self.signal = signal if signal is not None else (lambda t: 0)
+        self.noise = noise
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.registers = bytearray(32)
+        self.pointer = 0
+        self.conversions = 0  # Conversions produced since power-up
+        self.samples_read = 0  # Conversions read by the host
+        self.samples_missed = 0  # Conversions overwritten before they were read
+        self._reset_registers()
+
+    def _reset_registers(self):
+        self.registers[:] = bytes(32)
+        self.registers[_REV_ID] = 0x0F
+        self._origin = None
+        self._cycle = 0
+        self._unread = False
+        self._calibration_done = None
+        self._settling = False
+        self._uncalibrated = False
+
+    @property
+    def powered(self) -> bool:
+        pu_ctrl = self.registers[_PU_CTRL]
+        return bool(pu_ctrl & _PUD and pu_ctrl & _PUA)
+
+    @property
+    def rate(self) -> int:
+        return RATE_SPS.get((self.registers[_CTRL2] >> 4) & 0x7, 10)
+
+    @property
+    def gain(self) -> int:
+        return 1 << (self.registers[_CTRL1] & 0x7)
+
+    @property
+    def data_ready(self) -> bool:
+        """The level of the DRDY output, which mirrors the cycle ready (CR) bit."""
+        self._update()
+        return bool(self.registers[_PU_CTRL] & _CR)
+
+    # Bus interface
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        self.pointer = data[0]
+        for value in data[1:]:
+            self._write_register(self.pointer, value)
+            self.pointer = (self.pointer + 1) & 0x1F
+
+    def read(self, buf) -> None:
+        self._update()
+        for i in range(len(buf)):
+            buf[i] = self.registers[self.pointer]
+            if self.pointer == _ADCO_B0:
+                self._consume()
+            self.pointer = (self.pointer + 1) & 0x1F
+
+    # Register side effects
+
+    def _write_register(self, register: int, value: int) -> None:
+        if register == _PU_CTRL:
+            if value & _RR:
+                self._reset_registers()
+                self.registers[_PU_CTRL] = _RR
+                return
+            was_powered = self.powered
+            status = self.registers[_PU_CTRL] & (_PUR | _CR)
+            self.registers[_PU_CTRL] = (value & ~(_PUR | _CR)) | status
+            if value & _PUD:
+                self.registers[_PU_CTRL] |= _PUR
+            else:
+                self.registers[_PU_CTRL] &= ~_PUR
+            if self.powered and not was_powered:
+                self._restart_conversions()
+        elif register == _CTRL2:
+            old = self.registers[_CTRL2]
+            self.registers[_CTRL2] = value
+            if (old ^ value) & 0x70:
+                self._uncalibrated = True
+                self._restart_conversions()
+            if value & _CALS:
+                self.registers[_CTRL2] &= ~_CAL_ERR
+                self._calibration_done = self.clock() + self.CALIBRATION_TIME
+        elif register == _CTRL1:
+            if (self.registers[_CTRL1] ^ value) & 0x7:
+                self._uncalibrated = True
+                self._restart_conversions()
+            self.registers[_CTRL1] = value
+        elif _ADCO_B2 <= register <= _ADCO_B0 or register == _REV_ID:
+            pass  # Read only
+        else:
+            self.registers[register] = value
+
+    def _restart_conversions(self) -> None:
+        self._origin = self.clock()
+        self._cycle = 0
+        self.registers[_PU_CTRL] &= ~_CR
+        self._unread = False
+        self._settling = True
+
+    def _update(self) -> None:
+        now = self.clock()
+        if self._calibration_done is not None and now >= self._calibration_done:
+            self.registers[_CTRL2] &= ~_CALS
+            self._calibration_done = None
+            self._uncalibrated = False
+            self._restart_conversions()
+        if not self.powered or self._origin is None or self._calibration_done is not None:
+            return
+        cycle = int((now - self._origin) * self.rate)
+        if cycle <= self._cycle:
+            return
+        self.conversions += cycle - self._cycle
+        self.samples_missed += cycle - self._cycle - (0 if self._unread else 1)
+        self._cycle = cycle
+        self._latch(self._origin + cycle / self.rate)
+
+    def _latch(self, t: float) -> None:
+        value = int(self.signal(t)) * self.gain // 128
+        if self.noise:
+            value += int(self.random.gauss(0, self.noise * self.NOISE_SCALE[self.rate]))
+        if self._settling:
+            value += self.SETTLING_ERROR
+            self._settling = False
+        if self._uncalibrated:
+            value += self.UNCALIBRATED_ERROR
+        value = max(-0x800000, min(0x7FFFFF, value)) & 0xFFFFFF
+        self.registers[_ADCO_B2] = (value >> 16) & 0xFF
+        self.registers[_ADCO_B2 + 1] = (value >> 8) & 0xFF
+        self.registers[_ADCO_B0] = value & 0xFF
+        self.registers[_PU_CTRL] |= _CR
+        self._unread = True
+
+    def _consume(self) -> None:
+        if self._unread:
+            self.samples_read += 1
+        self._unread = False
+        self.registers[_PU_CTRL] &= ~_CR
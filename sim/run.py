@@ -0,0 +1,218 @@
+"""
+Runs the firmware's ``main.py`` unmodified under CPython against simulated hardware.
+
+    python -m sim.run --speed 60 --duration 3600
+
+The NAU7802, buttons, NeoPixel, NVM and WiFi radio are simulated (see ``sim/shims``) and Home Assistant is replaced by
+``sim.ha_stub``.  Time is virtual: ``--speed 60`` runs an hour of the device's life in a minute, with the load on the
+scale, button presses and WiFi outages following ``--scenario`` (see ``sim.scenario`` for the format).  Reloads and
+resets start ``main.py`` again with the board's state (NVM, radio) intact, just like the device.  Once the duration has
+elapsed a summary is printed.  ``--speed 0`` steps the clock instead, so a run is deterministic and takes as long as
+the host needs to simulate it.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import runpy
+import struct
+import sys
+import time
+import types
+
+import sim
+
+_real_perf_counter = time.perf_counter
+
+
+def _forget_firmware():
+    '''Drops the firmware's modules so the next run imports them fresh, the way a reload does.'''
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if os.path.dirname(os.path.abspath(path)) == sim.REPO_DIR:
+            del sys.modules[name]
+
+
+def _run(main):
+    '''
+    Stands in for asyncio.run().  On the device a reload stops the VM dead, so when main() ends (or the simulation
+    does) the remaining tasks are abandoned rather than cancelled, which firmware that swallows CancelledError would
+    otherwise survive.
+    '''
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def _abandon_tasks():
+    '''Collects the last run's abandoned tasks without asyncio complaining that they were destroyed while pending.'''
+    asyncio_logger = logging.getLogger("asyncio")
+    level = asyncio_logger.level
+    asyncio_logger.setLevel(logging.CRITICAL)
+    _forget_firmware()
+    gc.collect()
+    asyncio_logger.setLevel(level)
+
+
+def _secrets(stub, extra: dict) -> types.ModuleType:
+    from sim.hardware import Hardware
+
+    module = types.ModuleType("secrets")
+    module.secrets = {
+        "ssid": Hardware.SSID,
+        "password": Hardware.PASSWORD,
+        "homeassistant_url": stub.url,
+        "token": stub.token,
+    }
+    module.secrets.update(extra)
+    return module
+
+
+def simulate(speed: float = 60, duration: float = 3600, scenario=None, nvm_path: str = None, seed: int = 0,
+             quiet: bool = False, secrets: dict = None, latency: float = 0.0) -> dict:
+    '''Runs main.py for ``duration`` virtual seconds and returns a summary of what happened.'''
+    sim.install()
+
+    from sim import hardware
+    from sim.clock import SimulationComplete, SteppedClock, VirtualClock
+    from sim.ha_stub import HomeAssistantStub
+    from sim.scenario import ZERO_RAW, Scenario
+
+    clock = VirtualClock(speed) if speed else SteppedClock()
+    clock.install()
+    # The firmware's jitter comes from random too.
+    random.seed(seed)
+    asyncio.run = _run
+    board = hardware.Hardware(clock, scenario or Scenario.load(), nvm_path, seed)
+    board.network_latency = latency
+    hardware.setup(board)
+    if board.nvm[0:4] == b"\xff\xff\xff\xff":
+        # A blank NVM has never been tared.  Start from the empty scale so the scenario's grams are what gets reported.
+        # This is the tare's layout from before the settings store, which brings it over on the first boot.
+        board.nvm[0:4] = struct.pack(">I", ZERO_RAW)
+
+    stub = HomeAssistantStub()
+    stub.start()
+    for at, data in board.scenario.commands:
+        stub.schedule(at, "cinnascale_command", data)
+    board.receive_hooks.append(lambda: stub.deliver_due(board.elapsed()))
+    sys.modules["secrets"] = _secrets(stub, secrets or {})
+
+    import wifi
+
+    main_path = os.path.join(sim.REPO_DIR, "main.py")
+    real_start = _real_perf_counter()
+    clock.deadline = clock.monotonic() + duration
+    runs = 0
+    run_starts = []
+    stdout = sys.stdout
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        while True:
+            runs += 1
+            run_starts.append(clock.monotonic())
+            try:
+                runpy.run_path(main_path, run_name="__main__")
+            except hardware.DeepSleep as sleep:
+                board.deep_sleeps += 1
+                try:
+                    board.sleep_until(sleep.alarms)
+                except SimulationComplete:
+                    break
+                # The radio starts out on (and disconnected) after a deep sleep, like after any other restart.
+                wifi.radio.enabled = False
+                wifi.radio.enabled = True
+                continue
+            except hardware.Reload:
+                board.wake_alarm = None
+                continue
+            except SimulationComplete:
+                pass
+            finally:
+                _abandon_tasks()
+            break
+    finally:
+        if quiet:
+            sys.stdout.close()
+            sys.stdout = stdout
+        stub.stop()
+
+    # How long each run took from starting main.py to its first weight reaching Home Assistant.
+    boot_to_first_report = []
+    for i, start in enumerate(run_starts):
+        end = run_starts[i + 1] if i + 1 < len(run_starts) else float("inf")
+        reports = [t for t, entity in stub.updates if entity == "sensor.cinnascale" and start <= t < end]
+        boot_to_first_report.append(round(reports[0] - start, 2) if reports else None)
+
+    return {
+        "virtual_seconds": round(clock.elapsed(), 1),
+        "real_seconds": round(_real_perf_counter() - real_start, 1),
+        "runs": runs,
+        "boot_to_first_report_s": boot_to_first_report,
+        "ha_requests": len(stub.requests),
+        "ha_connections": stub.connections,
+        "ha_states": {entity: state.get("state") for entity, state in stub.states.items()},
+        "ha_events": len(stub.events),
+        "ha_websocket_messages": len(stub.websocket_messages),
+        "adc_conversions": board.nau7802.conversions,
+        "adc_samples_read": board.nau7802.samples_read,
+        "adc_samples_missed": board.nau7802.samples_missed,
+        "i2c_transactions": board.i2c.transactions,
+        "i2c_bytes": board.i2c.bytes_transferred,
+        "nvm_writes": board.nvm.writes,
+        "wifi_scans": wifi.radio.scans,
+        "wifi_connects": wifi.radio.connects,
+        "wifi_dhcp_leases": wifi.radio.dhcp_leases,
+        "light_sleeps": board.light_sleeps,
+        "deep_sleeps": board.deep_sleeps,
+        "asleep_fraction": round(board.asleep / clock.elapsed(), 3) if clock.elapsed() else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim.run", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--speed", type=float, default=60, help="virtual seconds per real second (default 60, 0 for as fast as possible)")
+    parser.add_argument("--duration", type=float, default=3600, help="virtual seconds to run for (default 3600)")
+    parser.add_argument("--scenario", help="scenario file (default: sim.scenario.DEFAULT)")
+    parser.add_argument("--nvm", help="file to keep the NVM in between runs")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the ADC noise and the firmware's random numbers")
+    parser.add_argument("--quiet", action="store_true", help="hide the firmware's output")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="round trip time in seconds of every connection and request to Home Assistant")
+    parser.add_argument("--secret", action="append", default=[], metavar="KEY=VALUE",
+                        help="add to (or override) secrets.py, VALUE is parsed as JSON if it can be")
+    args = parser.parse_args(argv)
+
+    secrets = {}
+    for secret in args.secret:
+        key, _, value = secret.partition("=")
+        try:
+            secrets[key] = json.loads(value)
+        except ValueError:
+            secrets[key] = value
+
+    sim.install()
+    from sim.scenario import Scenario
+
+    summary = simulate(
+        args.speed, args.duration, Scenario.load(args.scenario), args.nvm, args.seed, args.quiet, secrets,
+        args.latency
+    )
+
+    print()
+    print("Simulation summary")
+    for key, value in summary.items():
+        print("  {:20} {}".format(key, value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Scripted environment for a simulation run: the load on the scale, sensor noise, button presses, WiFi outages and
+commands sent from Home Assistant.
+
+A scenario is a text file with one command per line.  Times are in (virtual) seconds from the start of the run and
+anything after a # is a comment.
+
+    # time  command
+    0       weight 250           # grams on the scale
+    0       noise 150            # ADC noise (standard deviation in counts at 10 SPS)
+    600     weight 220 ramp 90   # ramp to 220g over 90 seconds (the cat eating)
+    900     press MISO 0.5       # hold the tare button for half a second
+    1200    outage 45            # the access point disappears for 45 seconds
+    1500    command set_threshold grams=20   # Home Assistant sends a command (only the websocket transport gets it)
+"""
+
+import json
+
+# The same calibration that scale.py assumes, so the grams in a scenario match the grams that get reported.  Like the
+# calibration these are in the driver's units, which are twice the chip's 24-bit conversion result.
+ZERO_RAW = 546562
+COUNTS_PER_GRAM = 1923.3
+
+DEFAULT = """
+0       weight 250
+0       noise 150
+300     weight 243 ramp 40
+900     weight 231 ramp 60
+1500    weight 520 ramp 4
+1800    outage 60
+2400    weight 498 ramp 120
+"""
+
+
+class Scenario:
+    def __init__(self):
+        self.weights = []  # (time, grams, ramp)
+        self.presses = []  # (time, pin name, duration)
+        self.outages = []  # (start, end)
+        self.commands = []  # (time, data)
+        self.noise = 0.0
+
+    @classmethod
+    def parse(cls, text: str) -> "Scenario":
+        scenario = cls()
+        for number, line in enumerate(text.splitlines(), 1):
+            words = line.split("#", 1)[0].split()
+            if not words:
+                continue
+            try:
+                at = float(words[0])
+                command, args = words[1], words[2:]
+                if command == "weight":
+                    ramp = float(args[2]) if len(args) > 2 and args[1] == "ramp" else 0.0
+                    scenario.weights.append((at, float(args[0]), ramp))
+                elif command == "noise":
+                    scenario.noise = float(args[0])
+                elif command == "press":
+                    scenario.presses.append((at, args[0], float(args[1]) if len(args) > 1 else 0.2))
+                elif command == "outage":
+                    scenario.outages.append((at, at + float(args[0])))
+                elif command == "command":
+                    data = {"command": args[0]}
+                    for arg in args[1:]:
+                        key, _, value = arg.partition("=")
+                        try:
+                            data[key] = json.loads(value)
+                        except ValueError:
+                            data[key] = value
+                    scenario.commands.append((at, data))
+                else:
+                    raise ValueError("unknown command " + command)
+            except (IndexError, ValueError) as e:
+                raise ValueError("Scenario line {}: {}".format(number, e)) from None
+        scenario.weights.sort()
+        return scenario
+
+    @classmethod
+    def load(cls, path: str = None) -> "Scenario":
+        if path is None:
+            return cls.parse(DEFAULT)
+        with open(path) as f:
+            return cls.parse(f.read())
+
+    def grams_at(self, t: float) -> float:
+        grams = 0.0
+        for at, target, ramp in self.weights:
+            if t < at:
+                break
+            if ramp and t < at + ramp:
+                return grams + (target - grams) * (t - at) / ramp
+            grams = target
+        return grams
+
+    def raw_at(self, t: float) -> int:
+        """The chip's conversion result at time t."""
+        return int(ZERO_RAW + self.grams_at(t) * COUNTS_PER_GRAM) // 2
+
+    def pressed(self, pin: str, t: float) -> bool:
+        return any(name == pin and at <= t < at + duration for at, name, duration in self.presses)
+
+    def link_up(self, t: float) -> bool:
+        return not any(start <= t < end for start, end in self.outages)
@@ -0,0 +1,30 @@
+"""
+Simulated ``alarm`` module.
+
+A light sleep blocks until the first of its alarms goes off, with the virtual clock (and the scenario) moving on in the
+meantime.  A deep sleep raises ``sim.hardware.DeepSleep``, which the simulation runner handles by sleeping the same way
+and then running the firmware again from the top.  ``sleep_memory`` belongs to the simulated board so it survives that.
+"""
+
+from sim import hardware as _hardware
+
+from . import pin, time  # noqa: F401
+
+sleep_memory = _hardware.current().sleep_memory if _hardware.current() else bytearray(_hardware.Hardware.SLEEP_MEMORY)
+
+
+def __getattr__(name):
+    if name == "wake_alarm":
+        hardware = _hardware.current()
+        return hardware.wake_alarm if hardware is not None else None
+    raise AttributeError(name)
+
+
+def light_sleep_until_alarms(*alarms):
+    hardware = _hardware.current()
+    hardware.light_sleeps += 1
+    return hardware.sleep_until(alarms)
+
+
+def exit_and_deep_sleep_until_alarms(*alarms, preserve_dios=()):
+    raise _hardware.DeepSleep(alarms)
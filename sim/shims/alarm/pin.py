@@ -0,0 +1,16 @@
+"""Simulated ``alarm.pin``.  The pins are the buttons, which go low while the scenario holds them down."""
+
+
+class PinAlarm:
+    def __init__(self, pin, value: bool, edge: bool = False, pull: bool = False):
+        self.pin = pin
+        self.value = value
+        self.edge = edge
+        self.pull = pull
+
+    def _wakes_at(self, hardware) -> float:
+        now = hardware.elapsed()
+        if not self.value and hardware.pressed(self.pin.name):
+            return now
+        presses = [at for at, name, _ in hardware.scenario.presses if name == self.pin.name and at >= now]
+        return min(presses) if presses and not self.value else float("inf")
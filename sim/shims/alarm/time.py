@@ -0,0 +1,16 @@
+"""Simulated ``alarm.time``."""
+
+import time as _time
+
+
+class TimeAlarm:
+    def __init__(self, *, monotonic_time: float = None, epoch_time: int = None):
+        if (monotonic_time is None) == (epoch_time is None):
+            raise ValueError("Supply exactly one of monotonic_time or epoch_time")
+        if epoch_time is not None:
+            monotonic_time = _time.monotonic() + epoch_time - _time.time()
+        self.monotonic_time = monotonic_time
+        self.epoch_time = epoch_time
+
+    def _wakes_at(self, hardware) -> float:
+        return self.monotonic_time - hardware.clock.start
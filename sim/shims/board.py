@@ -0,0 +1,45 @@
+"""
+Simulated ``board`` module for the Adafruit QT Py ESP32-S3.
+
+The STEMMA QT bus is the simulated board's I2C bus with a fake NAU7802 attached.
+"""
+
+from microcontroller import Pin as _Pin
+from sim import hardware as _hardware
+
+A0 = _Pin("A0")
+A1 = _Pin("A1")
+A2 = _Pin("A2")
+A3 = _Pin("A3")
+SDA = _Pin("SDA")
+SCL = _Pin("SCL")
+SDA1 = _Pin("SDA1")
+SCL1 = _Pin("SCL1")
+TX = _Pin("TX")
+RX = _Pin("RX")
+MOSI = _Pin("MOSI")
+MISO = _Pin("MISO")
+SCK = _Pin("SCK")
+BUTTON = _Pin("BUTTON")
+BOOT0 = BUTTON
+NEOPIXEL = _Pin("NEOPIXEL")
+NEOPIXEL_POWER = _Pin("NEOPIXEL_POWER")
+
+_i2c = None
+
+
+def STEMMA_I2C():
+    global _i2c
+    if _i2c is None:
+        hardware = _hardware.current()
+        if hardware is not None:
+            _i2c = hardware.i2c
+        else:
+            import busio
+
+            _i2c = busio.I2C(SCL1, SDA1)
+    return _i2c
+
+
+def I2C():
+    return STEMMA_I2C()
@@ -0,0 +1,84 @@
+"""
+Simulated ``busio`` module.
+
+``I2C`` is a register-level fake bus.  Devices are attached by address and every transaction is counted so the cost of
+a driver code path can be measured in bus transactions and bytes on the wire.  If the bus is given a simulation
+``clock`` the time each transaction takes on the wire is spent on it.
+"""
+
+# Overhead of a transaction on the wire in bit times: start, stop and the address byte with its ACK.
+_TRANSACTION_BITS = 11
+
+
+class I2C:
+    def __init__(self, scl=None, sda=None, *, frequency: int = 100000):
+        self.frequency = frequency
+        self.devices = {}
+        self.transactions = 0
+        self.bytes_transferred = 0
+        self.clock = None
+        self._locked = False
+
+    def attach(self, address: int, device) -> None:
+        """Attach a simulated device which implements ``write(data)`` and ``read(buf)``."""
+        self.devices[address] = device
+
+    def reset_counters(self) -> None:
+        self.transactions = 0
+        self.bytes_transferred = 0
+
+    def try_lock(self) -> bool:
+        if self._locked:
+            return False
+        self._locked = True
+        return True
+
+    def unlock(self) -> None:
+        self._locked = False
+
+    def deinit(self) -> None:
+        self.devices = {}
+
+    def scan(self) -> list:
+        return sorted(self.devices)
+
+    def _transfer(self, data_bytes: int, addresses: int = 1) -> None:
+        self.transactions += 1
+        self.bytes_transferred += addresses + data_bytes
+        if self.clock is not None:
+            self.clock.spend((_TRANSACTION_BITS * addresses + 9 * data_bytes) / self.frequency)
+
+    def _device(self, address: int):
+        try:
+            return self.devices[address]
+        except KeyError:
+            raise OSError(19, "No I2C device at address: 0x%x" % address) from None
+
+    def writeto(self, address: int, buffer, *, start: int = 0, end: int = None) -> None:
+        data = bytes(buffer[start:end])
+        self._transfer(len(data))
+        self._device(address).write(data)
+
+    def readfrom_into(self, address: int, buffer, *, start: int = 0, end: int = None) -> None:
+        end = len(buffer) if end is None else end
+        self._transfer(end - start)
+        view = memoryview(buffer)[start:end]
+        self._device(address).read(view)
+
+    def writeto_then_readfrom(
+        self, address: int, out_buffer, in_buffer, *, out_start=0, out_end=None, in_start=0, in_end=None
+    ) -> None:
+        # A write followed by a repeated start and a read is a single transaction on the wire.
+        data = bytes(out_buffer[out_start:out_end])
+        in_end = len(in_buffer) if in_end is None else in_end
+        self._transfer(len(data) + in_end - in_start, 2)
+        device = self._device(address)
+        device.write(data)
+        device.read(memoryview(in_buffer)[in_start:in_end])
+
+
+class SPI:
+    """Placeholder so SPI based drivers (and their type annotations) import on the host."""
+
+    def __init__(self, clock=None, MOSI=None, MISO=None):
+        raise NotImplementedError("SPI is not simulated")
@@ -0,0 +1,59 @@
+"""
+Simulated ``digitalio`` module.
+
+Pins are plain objects, so the level of an input is driven by whatever the simulation assigns to ``pin.level``.  An
+unconnected pulled-up input reads ``True`` just like the hardware.
+"""
+
+
+class Direction:
+    INPUT = "INPUT"
+    OUTPUT = "OUTPUT"
+
+
+class Pull:
+    UP = "UP"
+    DOWN = "DOWN"
+
+
+class DriveMode:
+    PUSH_PULL = "PUSH_PULL"
+    OPEN_DRAIN = "OPEN_DRAIN"
+
+
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        self._value = False
+
+    def deinit(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.deinit()
+
+    def switch_to_input(self, pull=None) -> None:
+        self.direction = Direction.INPUT
+        self.pull = pull
+
+    def switch_to_output(self, value: bool = False, drive_mode=DriveMode.PUSH_PULL) -> None:
+        self.direction = Direction.OUTPUT
+        self._value = value
+
+    @property
+    def value(self) -> bool:
+        if self.direction == Direction.OUTPUT:
+            return self._value
+        level = getattr(self.pin, "level", None)
+        if level is None:
+            return self.pull == Pull.UP
+        return bool(level)
+
+    @value.setter
+    def value(self, value: bool) -> None:
+        self._value = value
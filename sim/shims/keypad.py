@@ -0,0 +1,107 @@
+"""
+Simulated ``keypad`` module (just ``Keys``).
+
+On the device ``keypad`` scans its pins in the background and queues debounced key events, so a press isn't missed even
+while the firmware is busy.  Here the events come straight from the scenario's button presses: whenever the queue is
+looked at, every press and release since the last look is queued with the (virtual) time it happened at.
+"""
+
+from sim import hardware as _hardware
+
+_TICKS_PERIOD = 1 << 29
+
+
+class Event:
+    def __init__(self, key_number: int = 0, pressed: bool = True, timestamp: int = None):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = timestamp
+
+    @property
+    def released(self) -> bool:
+        return not self.pressed
+
+    def __eq__(self, other) -> bool:
+        return self.key_number == other.key_number and self.pressed == other.pressed
+
+    def __repr__(self) -> str:
+        return "<Event: key_number {} {}>".format(self.key_number, "pressed" if self.pressed else "released")
+
+
+class EventQueue:
+    def __init__(self, keys, max_events: int):
+        self._keys = keys
+        self._max_events = max_events
+        self._events = []
+        self.overflowed = False
+
+    def _append(self, event: Event):
+        if len(self._events) >= self._max_events:
+            self.overflowed = True
+            return
+        self._events.append(event)
+
+    def get(self) -> Event:
+        self._keys._scan()
+        return self._events.pop(0) if self._events else None
+
+    def get_into(self, event: Event) -> bool:
+        self._keys._scan()
+        if not self._events:
+            return False
+        queued = self._events.pop(0)
+        event.key_number = queued.key_number
+        event.pressed = queued.pressed
+        event.timestamp = queued.timestamp
+        return True
+
+    def clear(self):
+        self._events.clear()
+        self.overflowed = False
+
+    def __len__(self) -> int:
+        self._keys._scan()
+        return len(self._events)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+
+class Keys:
+    def __init__(self, pins, *, value_when_pressed: bool, pull: bool = True, interval: float = 0.02,
+                 max_events: int = 64, debounce_threshold: int = 1):
+        self._names = [pin.name for pin in pins]
+        self._hardware = _hardware.current()
+        self._scanned = self._hardware.elapsed() if self._hardware is not None else 0.0
+        self.key_count = len(pins)
+        self.events = EventQueue(self, max_events)
+
+    def _scan(self):
+        hardware = self._hardware
+        if hardware is None:
+            return
+        now = hardware.elapsed()
+        edges = []
+        for at, name, duration in hardware.scenario.presses:
+            if name not in self._names:
+                continue
+            for t, pressed in ((at, True), (at + duration, False)):
+                if self._scanned < t <= now:
+                    edges.append((t, pressed, self._names.index(name)))
+        for t, pressed, key_number in sorted(edges):
+            timestamp = int((hardware.clock.start + t) * 1000) % _TICKS_PERIOD
+            self.events._append(Event(key_number, pressed, timestamp))
+        self._scanned = now
+
+    def reset(self):
+        self._scanned = self._hardware.elapsed() if self._hardware is not None else 0.0
+        self.events.clear()
+
+    def deinit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.deinit()
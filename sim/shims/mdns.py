@@ -0,0 +1,17 @@
+"""
+Simulated ``mdns`` module.  Records what would have been advertised.
+"""
+
+
+class Server:
+    def __init__(self, network_interface):
+        self.network_interface = network_interface
+        self.hostname = None
+        self.instance_name = None
+        self.services = []
+
+    def advertise_service(self, *, service_type: str, protocol: str, port: int):
+        self.services.append((service_type, protocol, port))
+
+    def deinit(self):
+        pass
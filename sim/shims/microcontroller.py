@@ -0,0 +1,46 @@
+"""
+Simulated ``microcontroller`` module.
+
+``nvm`` belongs to the simulated board so it survives reloads (and, with ``--nvm``, separate runs).  ``reset()`` restarts
+the firmware the same way ``supervisor.reload()`` does.
+"""
+
+from sim import hardware as _hardware
+
+
+class Pin:
+    def __init__(self, name: str):
+        self.name = name
+
+    @property
+    def level(self):
+        '''
+        The level on an input pin.  Buttons pull to ground while the scenario holds them down and the NAU7802's DRDY
+        output is high while a conversion is ready.
+        '''
+        hardware = _hardware.current()
+        if hardware is None:
+            return None
+        if self.name == hardware.DRDY_PIN:
+            return hardware.nau7802.data_ready
+        return False if hardware.pressed(self.name) else None
+
+    def __repr__(self) -> str:
+        return "board." + self.name
+
+
+class _Processor:
+    frequency = 240000000
+    temperature = 40.0
+    voltage = 3.3
+    uid = bytes(6)
+    reset_reason = None
+
+
+cpu = _Processor()
+
+nvm = _hardware.current().nvm if _hardware.current() else _hardware.NVM()
+
+
+def reset():
+    raise _hardware.Reload()
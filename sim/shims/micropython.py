@@ -0,0 +1,17 @@
+"""Simulated ``micropython`` module."""
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
+
+
+def opt_level(level: int = None):
+    return 0
@@ -0,0 +1,45 @@
+"""
+Simulated ``neopixel`` module.  Keeps the pixel colours in memory.
+"""
+
+from sim import hardware as _hardware
+
+RGB = "RGB"
+GRB = "GRB"
+RGBW = "RGBW"
+GRBW = "GRBW"
+
+
+class NeoPixel:
+    def __init__(self, pin, n: int, *, bpp: int = 3, brightness: float = 1.0, auto_write: bool = True,
+                 pixel_order=None):
+        self.pin = pin
+        self.n = n
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self.pixels = [0] * n
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, index):
+        return self.pixels[index]
+
+    def __setitem__(self, index, color):
+        self.pixels[index] = color
+        if self.auto_write:
+            self.show()
+
+    def fill(self, color):
+        for i in range(self.n):
+            self.pixels[i] = color
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        hardware = _hardware.current()
+        if hardware is not None:
+            hardware.pixel_writes += 1
+
+    def deinit(self):
+        pass
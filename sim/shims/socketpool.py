@@ -0,0 +1,113 @@
+"""
+Simulated ``socketpool`` module backed by the host's sockets.
+
+When the pool's radio is the simulated ``wifi.radio``, plain sockets fail with EHOSTUNREACH while the radio is not
+connected, the way they do on the ESP32-S3 when the access point goes away, and connecting or sending a request takes
+the simulated board's network latency.  A non-blocking socket (``settimeout(0)``) doesn't wait for the round trip when
+it sends; instead receiving fails with EAGAIN until it's over.  Before anything is received the board's receive hooks
+get to send what's due.
+"""
+
+import select as _select
+import socket as _socket
+import time as _time
+
+from sim import hardware as _hardware
+
+EAGAIN = 11
+# lwIP's errno, which is what CircuitPython reports on the ESP32-S3 (Linux uses 113).
+EHOSTUNREACH = 118
+# The longest (real) time that a non-blocking socket waits for the stub's answer once the round trip is over.  The stub
+# answers at the speed of the host rather than of the virtual clock, so it mightn't have yet.
+_ANSWER_WAIT = 0.2
+
+
+def _unreachable():
+    return OSError(EHOSTUNREACH, "EHOSTUNREACH")
+
+
+class _Socket(_socket.socket):
+    radio = None
+    answer_at = None  # (Virtual) time.monotonic() when the answer to what a non-blocking socket sent can arrive
+
+    def _check_link(self):
+        if self.radio is not None and not getattr(self.radio, "connected", True):
+            raise _unreachable()
+
+    def _before_receive(self):
+        self._check_link()
+        hardware = _hardware.current()
+        if hardware is not None:
+            for hook in hardware.receive_hooks:
+                hook()
+
+    def _round_trip(self):
+        self._check_link()
+        hardware = _hardware.current()
+        if hardware is not None and hardware.network_latency:
+            _time.sleep(hardware.network_latency)
+
+    def connect(self, address):
+        self._round_trip()
+        return super().connect(address)
+
+    def send(self, data, flags=0):
+        if self.gettimeout() == 0:
+            self._check_link()
+            hardware = _hardware.current()
+            if hardware is not None and hardware.network_latency:
+                self.answer_at = _time.monotonic() + hardware.network_latency
+            return super().send(data, flags)
+        self._round_trip()
+        return super().send(data, flags)
+
+    def sendall(self, data, flags=0):
+        self._round_trip()
+        return super().sendall(data, flags)
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        self._before_receive()
+        self._await_answer()
+        return super().recv_into(buffer, nbytes, flags)
+
+    def recv(self, bufsize, flags=0):
+        self._before_receive()
+        self._await_answer()
+        return super().recv(bufsize, flags)
+
+    def _await_answer(self):
+        if self.answer_at is None or self.gettimeout() != 0:
+            return
+        if _time.monotonic() < self.answer_at:
+            raise OSError(EAGAIN, "EAGAIN")
+        self.answer_at = None
+        _select.select([self], [], [], _ANSWER_WAIT)
+
+
+class SocketPool:
+    AF_INET = _socket.AF_INET
+    AF_INET6 = _socket.AF_INET6
+    SOCK_STREAM = _socket.SOCK_STREAM
+    SOCK_DGRAM = _socket.SOCK_DGRAM
+    SOL_SOCKET = _socket.SOL_SOCKET
+    SO_REUSEADDR = _socket.SO_REUSEADDR
+    IPPROTO_TCP = _socket.IPPROTO_TCP
+    TCP_NODELAY = _socket.TCP_NODELAY
+    EAI_NONAME = _socket.EAI_NONAME
+
+    gaierror = _socket.gaierror
+    # Not in CircuitPython's socketpool, but it's how libraries like adafruit_minimqtt recognise CPython timeouts.
+    timeout = _socket.timeout
+
+    def __init__(self, radio):
+        self.radio = radio
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        if self.radio is not None and not getattr(self.radio, "connected", True):
+            raise _unreachable()
+        return _socket.getaddrinfo(host, port, family, type, proto, flags)
+
+    def socket(self, family=AF_INET, type=SOCK_STREAM, proto=0):
+        sock = _Socket(family, type, proto)
+        sock.radio = self.radio
+        return sock
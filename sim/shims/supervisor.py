@@ -0,0 +1,29 @@
+"""
+Simulated ``supervisor`` module.  ``reload()`` raises ``sim.hardware.Reload`` which the simulation runner catches to
+run the firmware again from the top.
+"""
+
+import time
+
+from sim import hardware as _hardware
+
+_TICKS_PERIOD = 1 << 29
+
+
+class _Runtime:
+    serial_connected = True
+    serial_bytes_available = 0
+    usb_connected = True
+    autoreload = False
+    run_reason = None
+
+
+runtime = _Runtime()
+
+
+def reload():
+    raise _hardware.Reload()
+
+
+def ticks_ms() -> int:
+    return int(time.monotonic() * 1000) % _TICKS_PERIOD
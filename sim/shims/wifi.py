@@ -0,0 +1,162 @@
+"""
+Simulated ``wifi`` module.
+
+There is a single access point, named and secured as ``sim.hardware.Hardware`` says.  While the scenario has an outage
+the access point can't be found and the radio drops its connection; afterwards it stays disconnected until
+``connect()`` is called again.  Scanning, associating and DHCP take (virtual) time just like they do on the ESP32-S3:
+a channel (and BSSID) hint skips the scan of every channel, and a static address skips DHCP.
+"""
+
+import ipaddress
+import time
+
+from sim import hardware as _hardware
+
+SCAN_TIME = 2.2  # scanning every channel
+PROBE_TIME = 0.05  # probing the one channel given as a hint
+ASSOCIATE_TIME = 0.1  # authenticating and associating
+DHCP_TIME = 1.2
+
+_DHCP_ADDRESS = (
+    ipaddress.IPv4Address("192.168.4.20"),
+    ipaddress.IPv4Address("255.255.255.0"),
+    ipaddress.IPv4Address("192.168.4.1"),
+    ipaddress.IPv4Address("192.168.4.1"),
+)
+
+
+class AuthMode:
+    OPEN = "OPEN"
+    WPA2 = "WPA2"
+    PSK = "PSK"
+
+
+class Network:
+    def __init__(self, ssid: str, bssid: bytes, channel: int, rssi: int):
+        self.ssid = ssid
+        self.bssid = bssid
+        self.channel = channel
+        self.rssi = rssi
+        self.country = "US"
+        self.authmode = [AuthMode.WPA2, AuthMode.PSK]
+
+
+_ACCESS_POINT = Network(_hardware.Hardware.SSID, b"\x02\x11\x22\x33\x44\x55", 6, -58)
+
+
+class Radio:
+    def __init__(self):
+        self._enabled = True
+        self.hostname = "cpy-qtpy"
+        self.mac_address = bytes.fromhex("f412fa8d9edc")
+        self.ipv4_address_ap = None
+        self.ipv4_gateway_ap = None
+        self._associated = False
+        self._static = None  # (address, netmask, gateway, dns) set with set_ipv4_address()
+        self.scans = 0
+        self.connects = 0
+        self.dhcp_leases = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool):
+        # Turning the radio off drops the connection.
+        if not value:
+            self._associated = False
+        self._enabled = value
+
+    def _link_up(self) -> bool:
+        hardware = _hardware.current()
+        return hardware is not None and hardware.link_up()
+
+    @property
+    def connected(self) -> bool:
+        if self._associated and not self._link_up():
+            self._associated = False
+        return self._associated
+
+    @property
+    def ap_info(self):
+        return _ACCESS_POINT if self.connected else None
+
+    def _address(self, part: int):
+        if not self.connected:
+            return None
+        return (self._static or _DHCP_ADDRESS)[part]
+
+    @property
+    def ipv4_address(self):
+        return self._address(0)
+
+    @property
+    def ipv4_subnet(self):
+        return self._address(1)
+
+    @property
+    def ipv4_gateway(self):
+        return self._address(2)
+
+    @property
+    def ipv4_dns(self):
+        return self._address(3)
+
+    def set_ipv4_address(self, *, ipv4, netmask, gateway, ipv4_dns=None):
+        # Like CircuitPython, this stops DHCP.
+        self._static = (ipv4, netmask, gateway, ipv4_dns or gateway)
+
+    def start_scanning_networks(self, *, start_channel: int = 1, stop_channel: int = 11):
+        self.scans += 1
+        time.sleep(SCAN_TIME)
+        return iter([_ACCESS_POINT] if self._link_up() else [])
+
+    def stop_scanning_networks(self):
+        pass
+
+    def connect(self, ssid, password=None, *, channel: int = 0, bssid=None, timeout=None):
+        self.connects += 1
+        if isinstance(ssid, bytes):
+            ssid = str(ssid, "utf-8")
+        if isinstance(password, bytes):
+            password = str(password, "utf-8")
+        hinted = channel == _ACCESS_POINT.channel and (not bssid or bytes(bssid) == _ACCESS_POINT.bssid)
+        if not self._link_up() or ssid != _ACCESS_POINT.ssid:
+            if not channel:
+                self.scans += 1
+            time.sleep(PROBE_TIME if channel else SCAN_TIME)
+            raise ConnectionError("No network with that ssid")
+        if channel and not hinted:
+            # A stale channel/BSSID hint costs a full scan before the radio finds the AP anyway.
+            time.sleep(PROBE_TIME)
+        if not hinted:
+            self.scans += 1
+        time.sleep(PROBE_TIME if hinted else SCAN_TIME)
+        time.sleep(ASSOCIATE_TIME)
+        if password != _hardware.Hardware.PASSWORD:
+            raise ConnectionError("Authentication failure")
+        if self._static is None:
+            self.dhcp_leases += 1
+            time.sleep(DHCP_TIME)
+        self._associated = True
+
+    def disconnect(self):
+        self._associated = False
+
+    def start_dhcp(self):
+        self._static = None
+
+    def stop_dhcp(self):
+        pass
+
+    def start_ap(self, ssid, password=None, *, channel: int = 1, authmode=None, max_connections: int = 4):
+        self.ipv4_address_ap = "192.168.4.1"
+        self.ipv4_gateway_ap = "192.168.4.1"
+
+    def stop_ap(self):
+        self.ipv4_address_ap = None
+        self.ipv4_gateway_ap = None
+
+
+radio = Radio()
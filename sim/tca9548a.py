@@ -0,0 +1,50 @@
+"""
+Model of the TCA9548A I2C multiplexer for use with the simulated ``busio.I2C`` bus.
+
+Writing a byte to the mux enables the channels whose bits are set, and the devices on the enabled channels then answer
+at their own addresses, so several devices with the same address (like NAU7802s) can be on one bus.
+"""
+
+
+class FakeTCA9548A:
+    def __init__(self, bus, address: int = 0x70):
+        self.bus = bus
+        self.enabled = 0  # Bitmask of the enabled channels
+        self.channels = [{} for _ in range(8)]  # Address -> device, for every channel
+        self.switches = 0  # Writes that changed the enabled channels
+        bus.attach(address, self)
+
+    def add(self, channel: int, address: int, device) -> None:
+        """Put a simulated device on a channel."""
+        self.channels[channel][address] = device
+        self.bus.attach(address, _Port(self, address))
+
+    def write(self, data: bytes) -> None:
+        if data and data[-1] != self.enabled:
+            self.enabled = data[-1]
+            self.switches += 1
+
+    def read(self, buf) -> None:
+        for i in range(len(buf)):
+            buf[i] = self.enabled
+
+    def device(self, address: int):
+        for channel in range(8):
+            if self.enabled & (1 << channel) and address in self.channels[channel]:
+                return self.channels[channel][address]
+        raise OSError(19, "No I2C device at address: 0x%x" % address)
+
+
+class _Port:
+    """Stands in on the bus for the devices at one address behind the mux and passes transactions to whichever is on
+    an enabled channel."""
+
+    def __init__(self, mux: FakeTCA9548A, address: int):
+        self.mux = mux
+        self.address = address
+
+    def write(self, data: bytes) -> None:
+        self.mux.device(self.address).write(data)
+
+    def read(self, buf) -> None:
+        self.mux.device(self.address).read(buf)
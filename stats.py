@@ -0,0 +1,250 @@
+import math
+from array import array
+
+
+class WindowStats:
+    '''
+    Running statistics over a sliding window of the most recent raw samples.
+
+    add() updates running sums, so the mean and variance cost O(1) per sample (plus an O(n) rebase every n samples, see
+    below) and reading them is O(1) whatever the size of the window.  With ordered, add() also keeps a sorted copy of
+    the window (sorted) for the trimmed mean, the median and the range.  Finding the evicted sample in it is a binary
+    search but the values between its place and the new sample's have to be shifted along, which is O(n) per sample,
+    so only ask for it when those are needed.
+
+    Values are stored relative to a reference value which is moved to the window's mean every time the window wraps
+    around.  This keeps the numbers small, so the running sums stay exact (and usually small) integers instead of relying
+    on a floating point recurrence like Welford's; CircuitPython's floats only have ~22 bits of mantissa which isn't
+    enough for raw 24-bit counts.
+    '''
+
+    def __init__(self, size: int, ordered: bool = True):
+        if size < 1:
+            raise ValueError("Window size must be at least 1")
+        self.size = size
+        self.window = array("i", [0] * size)  # Insertion order (ring buffer)
+        self.sorted = array("i", [0] * size) if ordered else None  # The same values in ascending order
+        self.reset()
+
+    def reset(self):
+        self.count = 0  # Total values added since the reset
+        self.reference = 0
+        self.total = 0  # Sum of the values in the window (relative to the reference)
+        self.total_squares = 0  # Sum of the squares of the values in the window (relative to the reference)
+
+    @property
+    def n(self) -> int:
+        '''The number of values currently in the window.'''
+        return min(self.count, self.size)
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.size
+
+    def add(self, value: int):
+        if self.count == 0:
+            self.reference = value
+        value -= self.reference
+
+        n = self.n
+        index = self.count % self.size
+        if n < self.size:
+            if self.sorted is not None:
+                self._insert_sorted(value, n)
+        else:
+            old = self.window[index]
+            self.total -= old
+            self.total_squares -= old * old
+            if self.sorted is not None:
+                self._replace_sorted(old, value)
+
+        self.window[index] = value
+        self.total += value
+        self.total_squares += value * value
+        self.count += 1
+
+        if self.count % self.size == 0:
+            self._rebase()
+
+    def mean(self) -> float:
+        self._check()
+        return self.reference + self.total / self.n
+
+    def variance(self) -> float:
+        '''The sample variance of the window in raw counts squared.'''
+        self._check()
+        n = self.n
+        if n < 2:
+            return 0.0
+        # Exact integer arithmetic until the final division.
+        return self.variance_numerator() / (n * (n - 1))
+
+    def variance_numerator(self) -> int:
+        '''
+        n * (n - 1) times the sample variance, which is exact and an integer.  Comparing this against a limit instead of
+        calling variance() or stddev() keeps the per-sample checks free of floats (which CircuitPython has to allocate).
+        '''
+        return self.n * self.total_squares - self.total * self.total
+
+    def int_mean(self) -> int:
+        '''The mean of the window rounded down to a whole count.'''
+        self._check()
+        return self.reference + self.total // self.n
+
+    def stddev(self) -> float:
+        return math.sqrt(self.variance())
+
+    def median(self) -> float:
+        self._check_sorted()
+        n = self.n
+        mid = n // 2
+        if n % 2:
+            return self.reference + self.sorted[mid]
+        return self.reference + (self.sorted[mid - 1] + self.sorted[mid]) / 2
+
+    def trimmed_mean(self, trim: int = 1) -> float:
+        '''The mean of the window after discarding the trim highest and trim lowest values.'''
+        self._check_sorted()
+        n = self.n
+        if n <= 2 * trim:
+            raise ValueError("At least {} values are required to trim {}".format(2 * trim + 1, trim))
+        total = self.total
+        for i in range(trim):
+            total -= self.sorted[i] + self.sorted[n - 1 - i]
+        return self.reference + total / (n - 2 * trim)
+
+    def _rebase(self):
+        shift = self.total // self.size
+        if not shift:
+            return
+        self.reference += shift
+        self.total = 0
+        self.total_squares = 0
+        for i in range(self.size):
+            value = self.window[i] - shift
+            self.window[i] = value
+            self.total += value
+            self.total_squares += value * value
+        if self.sorted is not None:
+            for i in range(self.size):
+                self.sorted[i] -= shift
+
+    def _check(self):
+        if self.count == 0:
+            raise ValueError("No values have been added")
+
+    def _check_sorted(self):
+        self._check()
+        if self.sorted is None:
+            raise ValueError("The window isn't ordered")
+
+    def _insert_sorted(self, value: int, n: int):
+        i = n
+        while i > 0 and self.sorted[i - 1] > value:
+            self.sorted[i] = self.sorted[i - 1]
+            i -= 1
+        self.sorted[i] = value
+
+    def _replace_sorted(self, old: int, value: int):
+        # Binary search for the value being evicted.
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if self.sorted[mid] < old:
+                low = mid + 1
+            else:
+                high = mid
+        i = low
+        # Slide the neighbours over until the new value is in order.
+        if value > old:
+            while i + 1 < self.size and self.sorted[i + 1] < value:
+                self.sorted[i] = self.sorted[i + 1]
+                i += 1
+        else:
+            while i > 0 and self.sorted[i - 1] > value:
+                self.sorted[i] = self.sorted[i - 1]
+                i -= 1
+        self.sorted[i] = value
+
+
+class SettleDetector:
+    '''
+    Sequential test for when the load on the scale has settled.  Samples are added one at a time and add() returns True
+    as soon as the ~95% confidence interval of the mean is within the tolerance, so a steady load only needs a few
+    samples while a moving one keeps being sampled.  A sample that jumps well away from the running mean restarts the
+    estimate so that readings from before the load changed don't count.
+
+    The tolerance is in raw counts.  At most max_samples (the most recent) contribute to the estimate.
+    '''
+
+    # Two sided z-score for a ~95% confidence interval.
+    Z = 2
+    # The fewest samples that can be considered settled.
+    MIN_SAMPLES = 3
+    # A sample further than this many tolerances (or standard deviations) from the mean means the load is moving.
+    MOVING = 4
+
+    def __init__(self, max_samples: int, tolerance: float):
+        if max_samples < self.MIN_SAMPLES:
+            raise ValueError("At least {} samples are required".format(self.MIN_SAMPLES))
+        # Only the mean and variance are needed, so the window isn't kept in order.
+        self.window = WindowStats(max_samples, ordered=False)
+        self.tolerance = tolerance
+        # add() only uses integer math, so it compares squares against the squared tolerance.
+        self.tolerance_squared = int(tolerance * tolerance)
+        self.reset()
+
+    def reset(self):
+        '''Starts a new reading, reusing the window so that nothing has to be allocated.'''
+        self.window.reset()
+        self.samples = 0  # Total samples added, including any from before a restart
+        self.restarts = 0
+
+    @property
+    def settled(self) -> bool:
+        window = self.window
+        n = window.n
+        if n < self.MIN_SAMPLES:
+            return False
+        # Z * stddev <= tolerance * sqrt(n), squared, with the variance being variance_numerator / (n * (n - 1)).
+        # Dividing rather than multiplying the other side keeps the numbers within CircuitPython's small (unallocated)
+        # integers.
+        return self.Z * self.Z * window.variance_numerator() // (n * n * (n - 1)) <= self.tolerance_squared
+
+    def add(self, value: int) -> bool:
+        window = self.window
+        self.samples += 1
+
+        n = window.n
+        if n >= 2:
+            # Moving if further than MOVING times the larger of the tolerance and the standard deviation from the mean.
+            limit = max(self.tolerance_squared, window.variance_numerator() // (n * (n - 1)))
+            distance = value - window.int_mean()
+            if distance * distance > self.MOVING * self.MOVING * limit:
+                window.reset()
+                self.restarts += 1
+
+        window.add(value)
+        return self.settled
+
+    def mean(self) -> float:
+        return self.window.mean()
+
+    def confidence(self) -> float:
+        '''The probability (0-1) that the true value is within the tolerance of the current mean.'''
+        window = self.window
+        if window.n < 2:
+            return 0.0
+        stddev = window.stddev()
+        if stddev == 0:
+            return 1.0
+        return _erf(self.tolerance * math.sqrt(window.n) / (stddev * math.sqrt(2)))
+
+
+def _erf(x: float) -> float:
+    # Abramowitz and Stegun 7.1.26, accurate to ~1.5e-7.  Not every CircuitPython build has math.erf.
+    sign = 1 if x >= 0 else -1
+    x = abs(x)
+    t = 1 / (1 + 0.3275911 * x)
+    y = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1 - y * math.exp(-x * x))
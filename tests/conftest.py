@@ -0,0 +1,26 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim  # noqa: E402
+
+sim.install()
+
+from sim.clock import SteppedClock  # noqa: E402
+
+
+@pytest.fixture
+def clock():
+    """A stepped clock for time and asyncio to follow during the test, so that simulated seconds pass instantly."""
+    saved = (time.monotonic, time.monotonic_ns, time.time, time.sleep)
+    policy = asyncio.get_event_loop_policy()
+    clock = SteppedClock()
+    clock.install()
+    yield clock
+    time.monotonic, time.monotonic_ns, time.time, time.sleep = saved
+    asyncio.set_event_loop_policy(policy)
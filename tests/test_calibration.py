@@ -0,0 +1,45 @@
+"""Tests for calibrating a scale that's still on the nominal slope (calibration.py)."""
+
+import pytest
+
+from calibration import Calibration
+
+# scale.py's nominal slope.
+NOMINAL = 1923.3
+
+
+def grams(calibration: Calibration, counts: int) -> float:
+    return calibration.to_decigrams(counts) / 10
+
+
+@pytest.mark.parametrize("counts_per_gram", (1500, 1923.3, 3000, 100))
+def test_the_first_weight_replaces_the_nominal_slope(counts_per_gram):
+    calibration = Calibration.nominal(NOMINAL)
+    assert calibration.provisional
+    calibration.add_point(round(100 * counts_per_gram), 100000)
+    assert not calibration.provisional
+    assert calibration.points == [(round(100 * counts_per_gram), 100000)]
+    for weight in (10, 50, 100, 250):
+        assert grams(calibration, round(weight * counts_per_gram)) == pytest.approx(weight, abs=0.1)
+
+
+def test_more_weights_join_the_first():
+    calibration = Calibration.nominal(NOMINAL)
+    calibration.add_point(150000, 100000)
+    calibration.add_point(30000, 20000)
+    assert calibration.points == [(30000, 20000), (150000, 100000)]
+    assert grams(calibration, 30000) == 20
+
+
+def test_a_stored_calibration_isnt_provisional():
+    calibration = Calibration.nominal(NOMINAL)
+    calibration.add_point(150000, 100000)
+    loaded = Calibration.decode(calibration.encode())
+    assert not loaded.provisional
+    loaded.add_point(30000, 20000)
+    assert len(loaded.points) == 2
+
+
+def test_a_cleared_calibration_doesnt_load():
+    # scale.clear_calibration() stores an empty value.
+    assert Calibration.decode(b"") is None
@@ -0,0 +1,86 @@
+"""
+Tests for when FeedingDetector's days end.  The device's clock isn't set, so they go by Home Assistant's clock through
+the transport's clock_offset.
+"""
+
+import time
+
+from feeding import DAY, FeedingDetector
+
+# Home Assistant's time (2023-11-14 22:13:20 UTC) at the device's time.time() of 0.
+OFFSET = 1700000000
+
+
+class Clock:
+    """Home Assistant's clock, as the clock_offset it's known by (None until it is)."""
+
+    def __init__(self, offset=None):
+        self.offset = offset
+
+    def __call__(self):
+        return self.offset
+
+
+def detector(clock, utc_offset=0, day=None, today=0):
+    events = []
+    feeding = FeedingDetector(lambda *event: events.append(event), clock, utc_offset, day, today)
+    return feeding, events
+
+
+def at(seconds, offset=OFFSET):
+    """Sets the device's clock so that Home Assistant's time is seconds."""
+    time.time = lambda: seconds - offset
+
+
+def test_days_arent_checked_until_home_assistants_time_is_known(clock):
+    ha = Clock()
+    feeding, events = detector(ha)
+    at(OFFSET)
+    feeding.check_day()
+    assert feeding.day is None
+    ha.offset = OFFSET
+    feeding.check_day()
+    assert feeding.day == OFFSET // 86400
+
+
+def test_the_day_ends_at_midnight(clock):
+    feeding, events = detector(Clock(OFFSET))
+    midnight = (OFFSET // 86400 + 1) * 86400
+    at(midnight - 1)
+    feeding.check_day()
+    feeding.today = 123
+    feeding.check_day()
+    assert events == []
+    at(midnight)
+    feeding.check_day()
+    assert events == [(DAY, midnight - 86400 - OFFSET, midnight - OFFSET, 123)]
+    assert feeding.today == 0
+
+
+def test_the_day_ends_at_local_midnight(clock):
+    # Two hours behind UTC, the day ends two hours after UTC's.
+    feeding, events = detector(Clock(OFFSET), utc_offset=-7200)
+    midnight = (OFFSET // 86400 + 1) * 86400
+    at(midnight)
+    feeding.check_day()
+    at(midnight + 7199)
+    feeding.check_day()
+    assert events == []
+    at(midnight + 7200)
+    feeding.check_day()
+    assert [event[0] for event in events] == [DAY]
+    assert events[0][2] == midnight + 7200 - OFFSET
+
+
+def test_a_restart_carries_on_counting_the_day(clock):
+    day = OFFSET // 86400
+    # Restarted with a different clock, on the same day and then on the next one.
+    feeding, events = detector(Clock(OFFSET + 500), day=day, today=42)
+    at(OFFSET, OFFSET + 500)
+    feeding.check_day()
+    assert events == [] and feeding.today == 42
+
+    feeding, events = detector(Clock(OFFSET + 500), day=day, today=42)
+    at((day + 1) * 86400 + 60, OFFSET + 500)
+    feeding.check_day()
+    assert events == [(DAY, day * 86400 - OFFSET - 500, (day + 1) * 86400 - OFFSET - 500, 42)]
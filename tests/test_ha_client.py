@@ -0,0 +1,96 @@
+"""
+Tests for when HomeAssistantClient retries a request, against a bare HTTP server that misbehaves on purpose.  A
+request that may have reached Home Assistant mustn't be sent again, or an event would be fired twice.
+"""
+
+import asyncio
+import socket
+import threading
+
+import pytest
+import socketpool
+
+from ha_client import HomeAssistantClient
+
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\n{}"
+
+
+class Server:
+    """Answers the first answer requests it's sent, then closes the connection (or just stops answering)."""
+
+    def __init__(self, answer: int, close: bool):
+        self.answer = answer
+        self.close = close
+        self.requests = 0
+        self.connections = 0
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+        self.listener.settimeout(5)
+        self.url = "http://127.0.0.1:{}".format(self.listener.getsockname()[1])
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        try:
+            while True:
+                connection, _ = self.listener.accept()
+                self.connections += 1
+                with connection:
+                    self.handle(connection)
+        except OSError:
+            pass
+
+    def handle(self, connection):
+        data = b""
+        while True:
+            while b"\r\n\r\n" not in data:
+                chunk = connection.recv(4096)
+                if not chunk:
+                    return
+                data += chunk
+            head, _, data = data.partition(b"\r\n\r\n")
+            length = int(head.lower().split(b"content-length: ")[1].split(b"\r\n")[0])
+            while len(data) < length:
+                data += connection.recv(4096)
+            data = data[length:]
+            self.requests += 1
+            if self.requests > self.answer:
+                if self.close:
+                    return
+                # Hold on to the request without answering until the client gives up.
+                connection.recv(4096)
+                return
+            connection.sendall(RESPONSE)
+
+
+def fire(server: Server, events: int):
+    client = HomeAssistantClient(socketpool.SocketPool(None), server.url, "token", timeout=0.5)
+    client.POLL_INTERVAL = 0.001
+
+    async def main():
+        for _ in range(events):
+            await client.request("POST", "/api/events/test", {})
+
+    try:
+        asyncio.run(main())
+    finally:
+        client.close()
+        server.listener.close()
+
+
+def test_retries_when_an_idle_connection_was_closed():
+    # The server closes the kept-alive connection instead of answering the second request, as if it had timed out.
+    server = Server(answer=1, close=True)
+    with pytest.raises(OSError):
+        fire(server, 2)
+    # The second request was sent again on a new connection, where it wasn't answered either.
+    assert (server.connections, server.requests) == (2, 3)
+
+
+def test_doesnt_retry_after_a_timeout():
+    server = Server(answer=1, close=False)
+    with pytest.raises(OSError) as error:
+        fire(server, 2)
+    assert error.value.errno == 110
+    assert (server.connections, server.requests) == (1, 2)
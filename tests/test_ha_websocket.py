@@ -0,0 +1,134 @@
+"""
+Tests for HomeAssistantWebSocket waiting on Home Assistant without blocking the event loop, against a bare WebSocket
+server that takes its time to answer.
+"""
+
+import asyncio
+import json
+import socket
+import struct
+import threading
+import time
+
+import pytest
+import socketpool
+
+from ha_websocket import HomeAssistantWebSocket
+
+HANDSHAKE = b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n\r\n"
+
+
+def frame(message: dict) -> bytes:
+    payload = json.dumps(message).encode()
+    if len(payload) < 126:
+        return bytes((0x81, len(payload))) + payload
+    return bytes((0x81, 126)) + struct.pack(">H", len(payload)) + payload
+
+
+class Server:
+    """Authenticates anyone, then answers commands after delay seconds (or never, if it's None)."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.commands = 0
+        self.connections = 0
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+        self.listener.settimeout(5)
+        self.url = "http://127.0.0.1:{}".format(self.listener.getsockname()[1])
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        try:
+            while True:
+                connection, _ = self.listener.accept()
+                self.connections += 1
+                with connection:
+                    self.handle(connection)
+        except OSError:
+            pass
+
+    def handle(self, connection):
+        self.data = b""
+        while b"\r\n\r\n" not in self.data:
+            self.data += connection.recv(4096)
+        self.data = self.data.partition(b"\r\n\r\n")[2]
+        connection.sendall(HANDSHAKE + frame({"type": "auth_required"}))
+        self.read(connection)
+        connection.sendall(frame({"type": "auth_ok"}))
+        while True:
+            message = self.read(connection)
+            if message is None:
+                return
+            self.commands += 1
+            if self.delay is None:
+                continue
+            time.sleep(self.delay)
+            connection.sendall(frame({"id": message["id"], "type": "result", "success": True, "result": None}))
+
+    def read(self, connection):
+        """The next (masked) message from the client, or None once it has gone."""
+        while True:
+            if len(self.data) >= 2:
+                length = self.data[1] & 0x7F
+                start = 2
+                if length == 126:
+                    length = struct.unpack(">H", self.data[2:4])[0]
+                    start = 4
+                end = start + 4 + length
+                if len(self.data) >= end:
+                    mask = self.data[start:start + 4]
+                    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.data[start + 4:end]))
+                    self.data = self.data[end:]
+                    return json.loads(payload)
+            chunk = connection.recv(4096)
+            if not chunk:
+                return None
+            self.data += chunk
+
+
+def fire(server: Server) -> int:
+    """Fires an event, and returns how many times another task got to run while it waited."""
+    websocket = HomeAssistantWebSocket(socketpool.SocketPool(None), server.url, "token", timeout=0.5)
+    websocket.POLL_INTERVAL = 0.001
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    async def main():
+        nonlocal ticks
+        task = asyncio.create_task(ticker())
+        try:
+            await websocket.connect()
+            ticks = 0
+            await websocket.call({"type": "fire_event", "event_type": "test"})
+        finally:
+            task.cancel()
+
+    try:
+        asyncio.run(main())
+    finally:
+        websocket.close()
+        server.listener.close()
+    return ticks
+
+
+def test_other_tasks_run_while_waiting_for_a_result():
+    server = Server(delay=0.2)
+    # A blocking call would let the ticker run once at most, when it's next scheduled.
+    assert fire(server) >= 10
+    assert server.commands == 1
+
+
+def test_doesnt_retry_after_a_timeout():
+    server = Server(delay=None)
+    with pytest.raises(OSError) as error:
+        fire(server)
+    assert error.value.errno == 110
+    assert (server.connections, server.commands) == (1, 1)
@@ -0,0 +1,45 @@
+"""Tests for how often OfflineLog writes to NVM, against the simulated NVM, which counts its writes."""
+
+from offline_log import RECORD_SIZE, OfflineLog
+from sim.hardware import NVM
+
+CAPACITY = 10
+
+
+def new_log(nvm=None):
+    nvm = nvm if nvm is not None else NVM(RECORD_SIZE * CAPACITY)
+    return OfflineLog(nvm, 0, len(nvm)), nvm
+
+
+def test_a_batch_is_marked_sent_in_one_write():
+    log, nvm = new_log()
+    for i in range(8):
+        log.append(1000 + i, i)
+    writes = nvm.writes
+    log.mark_sent(log.unsent_from + 5)
+    assert nvm.writes == writes + 1
+    assert log.pending == 2
+    assert [record[0] for record in log.unsent(10)] == [7, 8]
+
+
+def test_a_batch_that_wraps_around_takes_two_writes():
+    log, nvm = new_log()
+    for i in range(8):
+        log.append(1000 + i, i)
+    log.mark_sent(8)
+    for i in range(6):
+        log.append(2000 + i, i)
+    writes = nvm.writes
+    log.mark_sent(14)
+    assert nvm.writes == writes + 2
+    assert log.pending == 0
+
+
+def test_whats_been_sent_survives_a_restart():
+    log, nvm = new_log()
+    for i in range(12):
+        log.append(1000 + i, i)
+    log.mark_sent(7)
+    log, _ = new_log(nvm)
+    assert (log.unsent_from, log.next_sequence) == (8, 13)
+    assert [record[2] for record in log.unsent(10)] == [7, 8, 9, 10, 11]
@@ -0,0 +1,208 @@
+"""
+Tests for the adaptive conversion rate (rate_control.py) and for settle detection at each conversion rate, against the
+simulated NAU7802.  Its noise grows with the square root of the conversion rate like the real chip's, so the faster
+rates settle sooner only as long as the noise allows.
+"""
+
+import asyncio
+
+import busio
+import pytest
+
+from cedargrove_nau7802_async import NAU7802
+from rate_control import RateController
+from sampler import Sampler
+from sim.nau7802 import FakeNAU7802
+from stats import SettleDetector
+
+# The chip's conversion result with nothing on the scale, and the counts per gram in the driver's units (twice the
+# chip's), like scale.py's.
+ZERO = 273281
+COUNTS_PER_GRAM = 1923.3
+# scale.py's FAST_RATE_THRESHOLD, FAST_RATE_HOLD, SETTLE_SAMPLES and SETTLE_TOLERANCE.
+THRESHOLD = int(3.0 * COUNTS_PER_GRAM)
+HOLD = 5.0
+SETTLE_SAMPLES = 20
+TOLERANCE = 0.5 * COUNTS_PER_GRAM
+
+RATES = (10, 20, 40, 80, 320)
+# Noise (the standard deviation in the chip's counts at 10 SPS) that's well under the threshold at every rate, and noise
+# that's still under it at 10 SPS but not at the fast rates.
+QUIET = 100
+NOISY = 550
+
+
+class Scale:
+    """A simulated NAU7802 with a load that can be changed, and the sampler and rate controller reading it."""
+
+    def __init__(self, clock, noise: float, idle_rate: int = 10, fast_rate: int = 80, seed: int = 0):
+        self.grams = 100.0
+        self.chip = FakeNAU7802(signal=self.signal, noise=noise, clock=clock.monotonic, seed=seed)
+        i2c = busio.I2C()
+        i2c.clock = clock
+        i2c.attach(0x2A, self.chip)
+        self.adc = NAU7802(i2c)
+        self.sampler = Sampler(self.adc)
+        self.controller = RateController(self.sampler, THRESHOLD, idle_rate, fast_rate, HOLD)
+        self.sampler.listeners.append(self.controller.on_sample)
+
+    def signal(self, t: float) -> int:
+        return ZERO + int(self.grams * COUNTS_PER_GRAM / 2)
+
+    @property
+    def raw(self) -> int:
+        """What the driver reads without noise."""
+        return self.signal(0) * 2
+
+    def run(self, test, control: bool = True):
+        """Brings the chip up, runs the sampler (and the rate controller) and awaits test(self)."""
+
+        async def main():
+            await self.adc.begin(warm=False)
+            assert await self.adc.calibrate("INTERNAL")
+            tasks = [asyncio.create_task(self.sampler.run())]
+            if control:
+                tasks.append(asyncio.create_task(self.controller.run()))
+            try:
+                return await test(self)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return asyncio.run(main())
+
+
+async def samples_to_settle(scale: Scale, detector: SettleDetector, limit: int = 100):
+    """
+    Feeds new samples to detector until it has settled.  Returns how many it took and its mean, or Nones if it hadn't
+    after limit samples.
+    """
+    detector.reset()
+    for count in range(1, limit + 1):
+        await scale.sampler.wait_for_new()
+        if detector.add(scale.sampler.sample(scale.sampler.count - 1)):
+            return count, detector.mean()
+    return None, None
+
+
+@pytest.mark.parametrize("idle_rate", (10, 20, 40))
+def test_idles_while_steady(clock, idle_rate):
+    async def test(scale):
+        await asyncio.sleep(30)
+        return scale.controller.rate, scale.chip.rate
+
+    assert Scale(clock, QUIET, idle_rate=idle_rate).run(test) == (idle_rate, idle_rate)
+
+
+@pytest.mark.parametrize("fast_rate", (80, 320))
+@pytest.mark.parametrize("idle_rate", (10, 20, 40))
+def test_fast_while_changing(clock, idle_rate, fast_rate):
+    async def test(scale):
+        await asyncio.sleep(10)
+        scale.grams += 50
+        await asyncio.sleep(1)
+        changing = scale.chip.rate
+        await asyncio.sleep(HOLD + 1)
+        return changing, scale.chip.rate
+
+    assert Scale(clock, QUIET, idle_rate, fast_rate).run(test) == (fast_rate, idle_rate)
+
+
+@pytest.mark.parametrize(
+    "noise, fast_rate, rate",
+    (
+        (QUIET, 80, 10),
+        (QUIET, 320, 10),
+        # The noise at the fast rate keeps crossing the threshold, so the weight never looks steady there.
+        (NOISY, 80, 80),
+        (NOISY, 320, 320),
+    ),
+)
+def test_drops_back_only_when_quiet_at_the_fast_rate(clock, noise, fast_rate, rate):
+    async def test(scale):
+        await asyncio.sleep(30)
+        # The noise at the idle rate doesn't set it off.
+        assert scale.chip.rate == 10
+        scale.grams += 50
+        await asyncio.sleep(HOLD * 4)
+        return scale.chip.rate
+
+    assert Scale(clock, noise, 10, fast_rate).run(test) == rate
+
+
+@pytest.mark.parametrize("idle_rate, rates", ((10, []), (40, [40])))
+def test_changing_the_idle_rate(clock, idle_rate, rates):
+    # Setting the idle rate it's already at mustn't set off a switch to the fast rate (and a recalibration).
+    async def test(scale):
+        await asyncio.sleep(10)
+        switched = []
+        reconfigure = scale.sampler.reconfigure
+
+        async def recording(rate=None, gain=None):
+            switched.append(rate)
+            return await reconfigure(rate, gain)
+
+        scale.sampler.reconfigure = recording
+        scale.controller.set_idle_rate(idle_rate)
+        await asyncio.sleep(HOLD * 2)
+        return switched, scale.chip.rate
+
+    assert Scale(clock, QUIET).run(test) == (rates, idle_rate)
+
+
+def test_rate_changes_dont_leak_settling_conversions(clock):
+    # Without noise every sample should be exactly the load.  The first conversion after the conversions restart and
+    # any made before the offset is recalibrated for the new rate are off by the simulated chip's SETTLING_ERROR and
+    # UNCALIBRATED_ERROR.
+    async def test(scale):
+        await scale.sampler.wait_for_new(5)
+        for rate in RATES + tuple(reversed(RATES)):
+            start = scale.sampler.count
+            await scale.controller.set_rate(rate)
+            assert scale.chip.rate == rate
+            await scale.sampler.wait_for_new(10)
+            assert scale.sampler.count - start >= 10
+        return scale.sampler.latest(scale.sampler.available)
+
+    scale = Scale(clock, 0)
+    values = scale.run(test, control=False)
+    assert set(values) == {scale.raw}
+
+
+def test_settling_takes_more_samples_as_the_noise_grows(clock):
+    trials = 20
+
+    async def test(scale):
+        detector = SettleDetector(SETTLE_SAMPLES, TOLERANCE)
+        results = {}
+        for rate in RATES:
+            await scale.sampler.reconfigure(rate=rate)
+            counts = []
+            errors = []
+            for _ in range(trials):
+                count, mean = await samples_to_settle(scale, detector)
+                assert count is not None, "didn't settle at {} SPS".format(rate)
+                counts.append(count)
+                errors.append(abs(mean - scale.raw))
+            results[rate] = (sum(counts) / trials, sum(1 for error in errors if error <= TOLERANCE) / trials)
+        return results
+
+    results = Scale(clock, QUIET).run(test, control=False)
+    counts = [results[rate][0] for rate in RATES]
+    assert counts == sorted(counts)
+    assert counts[-1] > counts[0]
+    # The detector's estimate is within the tolerance ~95% of the time.
+    for rate in RATES:
+        assert results[rate][1] >= 0.85, rate
+
+
+@pytest.mark.parametrize("rate, settles", ((10, True), (20, True), (80, False), (320, False)))
+def test_too_noisy_to_settle(clock, rate, settles):
+    async def test(scale):
+        await scale.sampler.reconfigure(rate=rate)
+        count, mean = await samples_to_settle(scale, SettleDetector(SETTLE_SAMPLES, TOLERANCE))
+        if count is not None:
+            assert abs(mean - scale.raw) <= TOLERANCE * 2
+        return count is not None
+
+    assert Scale(clock, NOISY).run(test, control=False) == settles
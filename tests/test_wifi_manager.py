@@ -0,0 +1,80 @@
+"""Tests for when WiFiManager gives up on the saved access point and scans for it instead."""
+
+import asyncio
+import ipaddress
+
+from settings import SettingsStore
+from sim.hardware import NVM
+from wifi_manager import WiFiManager
+
+BSSID = b"\x02\x11\x22\x33\x44\x55"
+STALE_BSSID = b"\x02\x99\x88\x77\x66\x55"
+ADDRESS = tuple(ipaddress.IPv4Address(part) for part in ("192.168.4.20", "255.255.255.0", "192.168.4.1", "192.168.4.1"))
+
+
+class AccessPoint:
+    def __init__(self, bssid: bytes, channel: int):
+        self.bssid = bssid
+        self.channel = channel
+        self.rssi = -60
+
+
+class Radio:
+    """A radio whose access point is only found by scanning for it or with its own BSSID and channel."""
+
+    def __init__(self, access_point: AccessPoint = None):
+        self.access_point = access_point
+        self.connected = False
+        self.attempts = []  # "scan" or "hint" for every connect()
+        self.ipv4_address, self.ipv4_subnet, self.ipv4_gateway, self.ipv4_dns = ADDRESS
+
+    @property
+    def ap_info(self):
+        return self.access_point if self.connected else None
+
+    def start_dhcp(self):
+        pass
+
+    def set_ipv4_address(self, **address):
+        pass
+
+    def connect(self, ssid, password, channel: int = 0, bssid=None):
+        self.attempts.append("hint" if channel else "scan")
+        access_point = self.access_point
+        if access_point is None or (channel and (channel, bssid) != (access_point.channel, access_point.bssid)):
+            raise ConnectionError("No network with that ssid")
+        self.connected = True
+
+
+def manager(radio: Radio, hint: AccessPoint) -> WiFiManager:
+    """A manager that connected to hint last time."""
+    nvm = NVM(1024)
+    store = SettingsStore(nvm, 0, len(nvm))
+    saving = WiFiManager(Radio(hint), "ssid", "password", store)
+    saving.radio.connected = True
+    saving._save_hint()
+    return WiFiManager(radio, "ssid", "password", store)
+
+
+def test_goes_straight_to_the_saved_access_point(clock):
+    radio = Radio(AccessPoint(BSSID, 6))
+    assert asyncio.run(manager(radio, AccessPoint(BSSID, 6)).connect(6))
+    assert radio.attempts == ["hint"]
+
+
+def test_scans_when_the_saved_access_point_is_gone(clock):
+    # The router was replaced, so its BSSID changed.  Starting up gets to scan before it gives up.
+    radio = Radio(AccessPoint(STALE_BSSID, 11))
+    wifi = manager(radio, AccessPoint(BSSID, 6))
+    assert asyncio.run(wifi.connect(6))
+    assert radio.attempts == ["hint"] * WiFiManager.HINT_ATTEMPTS + ["scan"]
+    # Next time it goes to the new one.
+    assert wifi.hint[:2] == (STALE_BSSID, 11)
+
+
+def test_scans_now_and_then_while_nothing_can_be_found(clock):
+    radio = Radio()
+    hinted = WiFiManager.HINT_ATTEMPTS
+    assert not asyncio.run(manager(radio, AccessPoint(BSSID, 6)).connect(hinted + 2 * WiFiManager.FULL_SCAN_EVERY))
+    scans = [i for i, attempt in enumerate(radio.attempts) if attempt == "scan"]
+    assert scans == [hinted, hinted + WiFiManager.FULL_SCAN_EVERY]
@@ -0,0 +1,244 @@
+import json
+import time
+
+from ha_client import HomeAssistantClient
+from ha_websocket import HomeAssistantWebSocket
+
+
+class RestTransport:
+    '''
+    Sends states and events to Home Assistant through its REST API.
+
+    publish_state(), fire_event() and import_statistics() are coroutines which return True if Home Assistant accepted
+    the update and False if it rejected it (so there is no point in retrying).  Anything worth retrying, including
+    server errors, is raised.  The REST client doesn't block while it waits for Home Assistant (see
+    HomeAssistantClient).
+    '''
+
+    def __init__(self, client: HomeAssistantClient):
+        self.client = client
+
+    @property
+    def clock_offset(self) -> int:
+        '''Seconds to add to time.time() to get Home Assistant's time, None until it's known.'''
+        return self.client.clock_offset
+
+    async def publish_state(self, sensor, value) -> bool:
+        return self._check(await self.client.post_state(sensor.sensor_name, value, sensor.attributes))
+
+    async def fire_event(self, event_type: str, data: dict) -> bool:
+        return self._check(await self.client.request("POST", "/api/events/" + event_type, data))
+
+    async def import_statistics(self, metadata: dict, stats: list) -> bool:
+        '''
+        Adds (or replaces) hourly long-term statistics with the recorder.import_statistics action.  metadata has the
+        statistic_id, source, name, unit_of_measurement, has_mean and has_sum, and each of stats has a start (the top of
+        the hour, as an ISO 8601 time) and the mean, min and max for the hour.
+        '''
+        data = dict(metadata)
+        data["stats"] = stats
+        return self._check(await self.client.request("POST", "/api/services/recorder/import_statistics", data))
+
+    async def receive(self) -> list:
+        '''The events that Home Assistant has pushed since the last call.  Nothing can be pushed over REST.'''
+        return []
+
+    async def poll(self):
+        pass
+
+    def close(self):
+        self.client.close()
+
+    def _check(self, status_code: int) -> bool:
+        if status_code >= 500:
+            raise RuntimeError("Server error {}".format(status_code))
+        if status_code < 200 or status_code >= 300:
+            print(f"Unexpected status code {status_code}")
+            return False
+        return True
+
+
+class WebSocketTransport(RestTransport):
+    '''
+    Sends events and statistics to Home Assistant over its WebSocket API and receives the events it pushes back (see
+    HomeAssistantWebSocket), subscribing to command_event.  The WebSocket API has no way of setting an entity's state,
+    so states still go through the REST API, on its own kept-alive connection.
+
+    The connection is made the first time something is sent or received, and again after it has been lost.  Like the
+    REST client's, HomeAssistantWebSocket's commands wait for their results without blocking the event loop.
+    '''
+
+    def __init__(self, client: HomeAssistantClient, websocket: HomeAssistantWebSocket, command_event: str):
+        super().__init__(client)
+        self.websocket = websocket
+        websocket.subscribe(command_event)
+
+    async def fire_event(self, event_type: str, data: dict) -> bool:
+        return self._result(
+            await self.websocket.call({"type": "fire_event", "event_type": event_type, "event_data": data})
+        )
+
+    async def import_statistics(self, metadata: dict, stats: list) -> bool:
+        return self._result(
+            await self.websocket.call({"type": "recorder/import_statistics", "metadata": metadata, "stats": stats})
+        )
+
+    async def receive(self) -> list:
+        websocket = self.websocket
+        if not websocket.connected:
+            await websocket.connect()
+        await websocket.poll()
+        return websocket.events()
+
+    async def poll(self):
+        await self.websocket.poll()
+
+    def close(self):
+        super().close()
+        self.websocket.close()
+
+    def _result(self, reply: dict) -> bool:
+        if not reply.get("success"):
+            print("Command failed: {}".format(reply.get("error")))
+            return False
+        return True
+
+
+class MqttTransport:
+    '''
+    Sends states and events to Home Assistant over a single persistent MQTT connection.
+
+    The first time a sensor is published after connecting, its Home Assistant discovery config is published (retained)
+    so the entity is created automatically.  States are retained so Home Assistant has them after a restart, and the
+    availability topic is set to "online" on connect and to "offline" by the broker (as the last will) if the connection
+    drops.  Events are published as JSON to <prefix>/event/<event type>.
+
+    Requires the adafruit_minimqtt library, which is only imported when this transport is used.  It blocks while it
+    talks to the broker, so publish_state() and fire_event() do too, though they're coroutines like RestTransport's.
+    '''
+
+    DISCOVERY_PREFIX = "homeassistant"
+    KEEP_ALIVE = 60  # seconds
+
+    def __init__(
+        self,
+        pool,
+        ssl_context,
+        broker: str,
+        port: int = 1883,
+        username: str = None,
+        password: str = None,
+        is_ssl: bool = False,
+        prefix: str = "cinnascale",
+        device_name: str = "CinnaScale",
+    ):
+        import adafruit_minimqtt.adafruit_minimqtt as MQTT
+
+        self.prefix = prefix
+        self.device = {"identifiers": [prefix], "name": device_name}
+        self.availability_topic = prefix + "/availability"
+        self.mqtt = MQTT.MQTT(
+            broker=broker,
+            port=port,
+            username=username,
+            password=password,
+            client_id=prefix,
+            is_ssl=is_ssl,
+            keep_alive=self.KEEP_ALIVE,
+            socket_pool=pool,
+            ssl_context=ssl_context,
+        )
+        self.mqtt.will_set(self.availability_topic, "offline", retain=True)
+        self.discovered = set()
+        self.last_activity = 0
+        self.connected = False
+
+    def connect(self):
+        self.mqtt.connect()
+        self.connected = True
+        # The broker may not have kept the retained discovery configs, so send them again on every new connection.
+        self.discovered = set()
+        self._publish(self.availability_topic, "online", retain=True)
+
+    async def publish_state(self, sensor, value) -> bool:
+        self._ensure_connected()
+        try:
+            if sensor.sensor_name not in self.discovered:
+                self._publish(self._discovery_topic(sensor), json.dumps(self._discovery_config(sensor)), retain=True)
+                self.discovered.add(sensor.sensor_name)
+            self._publish(self._state_topic(sensor), str(value), retain=True)
+        except Exception:
+            self.close()
+            raise
+        return True
+
+    async def fire_event(self, event_type: str, data: dict) -> bool:
+        self._ensure_connected()
+        try:
+            self._publish(self.prefix + "/event/" + event_type, json.dumps(data))
+        except Exception:
+            self.close()
+            raise
+        return True
+
+    # MQTT has no way of telling the time or of importing statistics.
+    clock_offset = None
+
+    async def import_statistics(self, metadata: dict, stats: list) -> bool:
+        return False
+
+    async def receive(self) -> list:
+        return []
+
+    async def poll(self):
+        '''Keeps the connection alive.  Call this regularly; it only talks to the broker when a ping is due.'''
+        if not self.connected:
+            return
+        if time.monotonic() - self.last_activity > self.KEEP_ALIVE / 2:
+            try:
+                self.mqtt.ping()
+            except Exception:
+                self.close()
+                raise
+            self.last_activity = time.monotonic()
+
+    def close(self):
+        if not self.connected:
+            return
+        self.connected = False
+        try:
+            self.mqtt.disconnect()
+        except Exception:
+            # The connection is already gone, which is usually why we're closing it.
+            pass
+
+    def _ensure_connected(self):
+        if not self.connected:
+            self.connect()
+
+    def _publish(self, topic: str, message: str, retain: bool = False):
+        self.mqtt.publish(topic, message, retain=retain)
+        self.last_activity = time.monotonic()
+
+    def _state_topic(self, sensor) -> str:
+        return "{}/{}/state".format(self.prefix, sensor.name)
+
+    def _discovery_topic(self, sensor) -> str:
+        return "{}/{}/{}/{}/config".format(self.DISCOVERY_PREFIX, sensor.sensor_type, self.prefix, sensor.name)
+
+    def _discovery_config(self, sensor) -> dict:
+        config = {
+            "name": sensor.attributes["friendly_name"],
+            "unique_id": sensor.name,
+            "object_id": sensor.name,
+            "state_topic": self._state_topic(sensor),
+            "availability_topic": self.availability_topic,
+            "device": self.device,
+        }
+        for key in ("device_class", "icon", "state_class", "unit_of_measurement"):
+            if sensor.attributes.get(key) is not None:
+                config[key] = sensor.attributes[key]
+        if sensor.sensor_type == "binary_sensor":
+            config["payload_on"] = "on"
+            config["payload_off"] = "off"
+        return config
@@ -0,0 +1,128 @@
+import asyncio
+import ipaddress
+import random
+import struct
+import time
+
+import settings
+
+_HINT = "<6sB4s4s4s4s"  # BSSID, channel, IPv4 address, netmask, gateway, DNS
+
+
+class WiFiManager:
+    '''
+    Connects to (and stays connected to) one WiFi network without holding up the rest of the firmware for long.
+
+    Connecting is the slow part of coming back online: scanning every channel for the access point and then waiting for
+    DHCP takes seconds, and radio.connect() blocks the whole VM while it does.  So after every connection the access
+    point's BSSID and channel and the IPv4 settings that DHCP handed out are saved, and the next connection goes straight
+    to that access point with that address.  If that fails HINT_ATTEMPTS times in a row (the access point may have been
+    replaced or moved to another channel) it falls back to scanning and DHCP instead, and from then on scans every
+    FULL_SCAN_EVERY failures, so even a few attempts while starting up get to scan.  Failed attempts are retried with
+    exponential backoff and jitter, sleeping in between so sampling and everything else carries on while the link is
+    down.
+    '''
+
+    # Trying the saved access point only blocks for as long as it takes to probe its channel, so it's tried often.
+    MIN_BACKOFF = 0.25  # seconds
+    MAX_BACKOFF = 4  # seconds
+    HINT_ATTEMPTS = 2  # failed attempts
+    FULL_SCAN_EVERY = 10  # failed attempts
+    CHECK_INTERVAL = 0.5  # seconds between checks of the link in run()
+
+    def __init__(self, radio, ssid: str, password: str, store: settings.SettingsStore = None):
+        self.radio = radio
+        self.ssid = ssid
+        self.password = password
+        self.store = store if store is not None else settings.store
+        self.lock = asyncio.Lock()
+        self.on_connect = []  # Called with no arguments after every (re)connection
+        self.failures = 0
+        self.hint = self._load_hint()
+
+    async def connect(self, attempts: int = None) -> bool:
+        '''Connects unless already connected, trying up to attempts times (forever if None).  Returns whether it did.'''
+        async with self.lock:
+            tried = 0
+            while not self.radio.connected:
+                if self._attempt():
+                    self.failures = 0
+                    for callback in self.on_connect:
+                        callback()
+                    break
+                self.failures += 1
+                tried += 1
+                if attempts is not None and tried >= attempts:
+                    return False
+                await asyncio.sleep(self._backoff())
+            return True
+
+    async def run(self):
+        '''Watches the link and reconnects as soon as it drops.'''
+        while True:
+            await asyncio.sleep(self.CHECK_INTERVAL)
+            if self.radio.connected:
+                continue
+            print("WiFi connection lost.  Reconnecting...")
+            start = time.monotonic()
+            await self.connect()
+            print("Reconnected to WiFi in {:.2f}s".format(time.monotonic() - start))
+
+    def forget_address(self):
+        '''Drops the saved IPv4 settings and the connection so the next connection gets an address from DHCP again.'''
+        if self.hint is not None:
+            self.hint = (self.hint[0], self.hint[1], None)
+        self.radio.start_dhcp()
+        self.radio.disconnect()
+
+    def _attempt(self) -> bool:
+        hint = self.hint
+        since_hinted = self.failures - self.HINT_ATTEMPTS
+        full = hint is None or (since_hinted >= 0 and since_hinted % self.FULL_SCAN_EVERY == 0)
+        try:
+            if full:
+                self.radio.start_dhcp()
+                self.radio.connect(self.ssid, self.password)
+            else:
+                bssid, channel, address = hint
+                if address is not None:
+                    ipv4, netmask, gateway, dns = address
+                    self.radio.set_ipv4_address(ipv4=ipv4, netmask=netmask, gateway=gateway, ipv4_dns=dns)
+                else:
+                    self.radio.start_dhcp()
+                self.radio.connect(self.ssid, self.password, channel=channel, bssid=bssid)
+        except ConnectionError as e:
+            print("WiFi connection failed ({}): {}".format("scan" if full else "cached access point", e))
+            return False
+
+        ap_info = self.radio.ap_info
+        print("Connected to {} (RSSI: {}, Channel: {}) with ip {}".format(
+            self.ssid, ap_info.rssi, ap_info.channel, self.radio.ipv4_address
+        ))
+        self._save_hint()
+        return True
+
+    def _backoff(self) -> float:
+        delay = min(self.MAX_BACKOFF, self.MIN_BACKOFF * (1 << min(self.failures - 1, 16)))
+        # Half of it fixed, half random, so devices that lost the same access point don't all come back at once.
+        return delay / 2 + random.random() * delay / 2
+
+    def _load_hint(self):
+        data = self.store.get(settings.WIFI)
+        if data is None or len(data) != struct.calcsize(_HINT):
+            return None
+        bssid, channel, *address = struct.unpack(_HINT, data)
+        return bssid, channel, tuple(ipaddress.IPv4Address(part) for part in address)
+
+    def _save_hint(self):
+        radio = self.radio
+        ap_info = radio.ap_info
+        if ap_info is None:
+            return
+        address = (radio.ipv4_address, radio.ipv4_subnet, radio.ipv4_gateway, radio.ipv4_dns)
+        self.hint = (bytes(ap_info.bssid), ap_info.channel, address)
+        # Nothing is written if it's the same access point and address as last time.
+        self.store.set(settings.WIFI, struct.pack(
+            _HINT, self.hint[0], self.hint[1], *(part.packed for part in address)
+        ))
+        self.store.flush()